@@ -2,8 +2,11 @@ from metrics.views.common import get_layout, use_table_callback, get_table_layou
 
 from django_plotly_dash import DjangoDash
 from django.shortcuts import render
+from metrics.models import Event, Node, OrganisingInstitution
+from metrics.views.conditional import conditional_dash_page
 
 
+@conditional_dash_page("AllEvents", [Event, Node, OrganisingInstitution])
 def all_events(request):
     app = DjangoDash("AllEvents")
     group = request.metrics.get_group('event_full')
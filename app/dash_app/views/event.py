@@ -2,8 +2,11 @@ from metrics.views.common import get_layout, use_callback, get_tabs
 
 from django_plotly_dash import DjangoDash
 from django.shortcuts import render
+from metrics.models import Event, Node
+from metrics.views.conditional import conditional_dash_page
 
 
+@conditional_dash_page("EventReport", [Event, Node])
 def event_report(request):
     app = DjangoDash("EventReport")
     group = request.metrics.get_group('event')
@@ -8,6 +8,7 @@ import pandas as pd
 import numpy as np
 from django.db.models import Count, F
 from metrics.models import Event, Node
+from metrics.views.conditional import conditional_dash_page
 
 def get_event_data():
     # Query database to get counts of events by country
@@ -23,6 +24,7 @@ def get_event_data():
     final = pd.merge(df, temp, on='location_country')
     return final, total_events
 
+@conditional_dash_page("WorldMap", [Event, Node])
 def world_map(request):
     app = DjangoDash("WorldMap")
 
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MetricsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "metrics"
+
+    def ready(self):
+        from metrics import change_stamps
+        change_stamps.connect_signals()
\ No newline at end of file
@@ -0,0 +1,175 @@
+from django.core.management import call_command
+from django.db import connection
+from metrics import upload_jobs
+from metrics.models import Event, Node, OrganisingInstitution, User
+import contextlib
+import dataclasses
+import functools
+import io
+import os
+import re
+import resource
+import time
+
+
+# Node and user the generated test data belongs to
+BENCHMARK_NODE = "ELIXIR-UK"
+BENCHMARK_USER = "uk"
+UPLOAD_FILES = {
+    "events": "events",
+    "demographic_quality_metrics": "demographic_quality",
+    "impact_metrics": "impact",
+}
+ROR_ID = re.compile(r"https://ror\.org/\w+")
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    name: str
+    rows: int
+    seconds: float
+    queries: int
+    peak_rss_kb: int
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0
+
+    @property
+    def queries_per_row(self):
+        return self.queries / self.rows if self.rows else 0
+
+    def as_dict(self):
+        return {
+            **dataclasses.asdict(self),
+            "rows_per_second": self.rows_per_second,
+            "queries_per_row": self.queries_per_row,
+        }
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(name: str, run) -> BenchmarkResult:
+    # run returns the number of processed rows. The peak RSS is the high
+    # water mark of the whole process so far.
+    counter = QueryCounter()
+    started = time.perf_counter()
+    with connection.execute_wrapper(counter):
+        rows = run()
+    return BenchmarkResult(
+        name=name,
+        rows=rows,
+        seconds=time.perf_counter() - started,
+        queries=counter.count,
+        peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    )
+
+
+def write_test_data(target_dir: str, size: int) -> dict[str, str]:
+    call_command(
+        "create_test_data",
+        targetdir=target_dir,
+        events=size,
+        eventcodes=",".join(["1"] * size),
+        vectorized=True,
+        answersperevent=0,
+        contextid=str(size),
+        stdout=io.StringIO(),
+    )
+    return {
+        upload_type: os.path.join(target_dir, f"{prefix}-{size}.csv")
+        for (upload_type, prefix) in UPLOAD_FILES.items()
+    }
+
+
+def create_references(paths: dict[str, str]):
+    # Institutions are created up front, so that no ROR requests are made
+    # while measuring.
+    Node.objects.get_or_create(name=BENCHMARK_NODE, defaults={"country": "United Kingdom"})
+    (user, _created) = User.objects.get_or_create(username=BENCHMARK_USER)
+    ror_ids = set()
+    with open(paths["events"]) as f:
+        for line in f:
+            ror_ids.update(ROR_ID.findall(line))
+    OrganisingInstitution.objects.bulk_create(
+        [
+            OrganisingInstitution(ror_id=ror_id, name=ror_id, country="")
+            for ror_id in ror_ids
+        ],
+        ignore_conflicts=True,
+    )
+    return user
+
+
+def parse_file(importer, path: str) -> int:
+    with open(path, "rb") as file:
+        return sum(1 for row in upload_jobs.read_csv_rows(file) if importer.parse(row))
+
+
+def import_file(importer, path: str) -> int:
+    # Files are validated before they are imported, like uploads are
+    with open(path, "rb") as file:
+        errors = upload_jobs.validate_file(importer, file)
+        if errors:
+            raise ValueError(f"Invalid benchmark data in {path}: {errors[:5]}")
+        return importer.insert_rows(upload_jobs.read_csv_rows(file)).rows
+
+
+def get_scratch_name() -> str:
+    return f"{connection.settings_dict['NAME']}_benchmark"
+
+
+@contextlib.contextmanager
+def scratch_database():
+    # Created and migrated like the test database, and dropped afterwards
+    old_name = connection.settings_dict["NAME"]
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    old_test_name = test_settings.get("NAME")
+    test_settings["NAME"] = get_scratch_name()
+    try:
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+    finally:
+        test_settings["NAME"] = old_test_name
+
+
+def run_size(size: int, target_dir: str) -> list[BenchmarkResult]:
+    paths = write_test_data(target_dir, size)
+    user = create_references(paths)
+    event = None
+    results = []
+    for (upload_type, path) in paths.items():
+        # Metrics are imported for the first of the imported events
+        (importer, _view_transforms) = upload_jobs.get_upload_handler(
+            upload_type,
+            upload_jobs.make_import_context(user, event),
+        )
+        results.append(measure(f"parse-{upload_type}-{size}", functools.partial(parse_file, importer, path)))
+        results.append(measure(f"import-{upload_type}-{size}", functools.partial(import_file, importer, path)))
+        if upload_type == "events":
+            event = Event.objects.filter(user=user).earliest("id")
+    return results
+
+
+def run_benchmarks(sizes: list[int], target_dir: str) -> list[BenchmarkResult]:
+    """
+    Generates test data of each size and measures parsing and the validated
+    import of every upload type. The imports are committed in a scratch
+    database, which is emptied after every size.
+    """
+    results = []
+    with scratch_database():
+        for size in sizes:
+            results.extend(run_size(size, target_dir))
+            call_command("flush", interactive=False, verbosity=0)
+    return results
@@ -0,0 +1,200 @@
+from contextlib import contextmanager
+from django.db import transaction
+from django.db.models import CharField, F, PositiveIntegerField, Value
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils import timezone
+from django.utils.cache import quote_etag
+from metrics.models import (
+    ChangeStamp,
+    Event,
+    Demographic,
+    Quality,
+    Impact,
+    Node,
+    OrganisingInstitution,
+    User,
+)
+import functools
+import hashlib
+import threading
+
+
+# Tables whose change stamps are maintained. Metrics models only get
+# post_save receivers so that queryset deletes stay fast deletes, the
+# views deleting them mark the change explicitly.
+TRACKED_MODELS = [
+    Event,
+    Demographic,
+    Quality,
+    Impact,
+    Node,
+    OrganisingInstitution,
+]
+METRICS_MODELS = [Demographic, Quality, Impact]
+# Users are saved on every login, only created and deleted users change
+# their stamp
+STAMPED_MODELS = [*TRACKED_MODELS, User]
+
+_state = threading.local()
+
+
+def get_table(model):
+    return model._meta.db_table
+
+
+def refresh(*models):
+    now = timezone.now()
+    for model in models:
+        ChangeStamp.objects.update_or_create(
+            table=get_table(model),
+            defaults={
+                "modified": now,
+                "row_count": model.objects.count(),
+            }
+        )
+
+
+def touch(model, row_delta=0):
+    if row_delta is None:
+        refresh(model)
+        return
+
+    updated = ChangeStamp.objects.filter(table=get_table(model)).update(
+        modified=timezone.now(),
+        row_count=F("row_count") + row_delta,
+    )
+    if not updated:
+        refresh(model)
+
+
+def touch_on_commit(model, row_delta=0):
+    # The stamp row is only locked after the changes are committed instead
+    # of for the rest of the writing transaction
+    transaction.on_commit(functools.partial(touch, model, row_delta))
+
+
+def mark_changed(model, row_delta=0):
+    # A row delta of None means the number of rows is unknown and needs to
+    # be recounted.
+    pending = getattr(_state, "pending", None)
+    if pending is None:
+        touch_on_commit(model, row_delta)
+    elif model in pending and pending[model] is not None and row_delta is not None:
+        pending[model] += row_delta
+    else:
+        pending[model] = None if model in pending else row_delta
+
+
+@contextmanager
+def batch_changes():
+    if getattr(_state, "pending", None) is not None:
+        yield
+        return
+
+    _state.pending = {}
+    try:
+        yield
+    finally:
+        pending = _state.pending
+        _state.pending = None
+        for (model, row_delta) in pending.items():
+            touch_on_commit(model, row_delta)
+
+
+def get_change_stamps(models, instance_key=None):
+    # Both sides of the union only select annotations, which keeps their
+    # columns in the same order
+    stamps = ChangeStamp.objects.filter(
+        table__in=[get_table(model) for model in models]
+    ).annotate(
+        stamp_key=F("table"),
+        stamp_modified=F("modified"),
+        stamp_rows=F("row_count"),
+    ).values_list("stamp_key", "stamp_modified", "stamp_rows")
+    if instance_key is not None:
+        (model, pk) = instance_key
+        instance_stamp = model.objects.filter(pk=pk).annotate(
+            stamp_key=Value(f"{get_table(model)}:{pk}", output_field=CharField()),
+            stamp_modified=F("modified"),
+            stamp_rows=Value(1, output_field=PositiveIntegerField()),
+        ).values_list("stamp_key", "stamp_modified", "stamp_rows")
+        stamps = stamps.union(instance_stamp, all=True)
+    return list(stamps)
+
+
+def get_validators(request, models, instance_key=None):
+    stamps = get_change_stamps(models, instance_key)
+    expected_count = len(models) + (0 if instance_key is None else 1)
+    if len(stamps) != expected_count:
+        return (None, None)
+
+    digest = hashlib.sha1()
+    for part in [
+        request.user.pk,
+        request.META.get("CSRF_COOKIE"),
+        request.get_full_path(),
+        *sorted(stamps),
+    ]:
+        digest.update(repr(part).encode())
+    last_modified = max(modified for (_table, modified, _count) in stamps)
+    return (
+        quote_etag(digest.hexdigest()),
+        int(last_modified.timestamp())
+    )
+
+
+def on_save(sender, created=False, raw=False, **kwargs):
+    if not raw:
+        mark_changed(sender, 1 if created else 0)
+
+
+def on_user_save(sender, created=False, raw=False, **kwargs):
+    if created and not raw:
+        mark_changed(sender, 1)
+
+
+def on_delete(sender, **kwargs):
+    mark_changed(sender, -1)
+    if sender is Event:
+        for model in METRICS_MODELS:
+            mark_changed(model, None)
+
+
+def get_related_event_ids(sender, instance, reverse, pk_set):
+    if not reverse:
+        return {instance.pk}
+    if pk_set is not None:
+        return pk_set
+    instance_field = next(
+        field.name
+        for field in sender._meta.fields
+        if field.related_model is type(instance)
+    )
+    return set(sender.objects.filter(**{instance_field: instance}).values_list("event_id", flat=True))
+
+
+def on_event_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Event pages are validated by the modified time of their event. The
+    # events of a cleared node or institution are only known before the clear.
+    clear_action = "pre_clear" if reverse else "post_clear"
+    if action in {"post_add", "post_remove", clear_action}:
+        Event.objects.filter(pk__in=get_related_event_ids(sender, instance, reverse, pk_set)).update(
+            modified=timezone.now()
+        )
+    if action in {"post_add", "post_remove", "post_clear"}:
+        mark_changed(Event)
+
+
+def connect_signals():
+    for model in TRACKED_MODELS:
+        post_save.connect(on_save, sender=model, dispatch_uid=f"change_stamp_save_{model.__name__}")
+        if model not in METRICS_MODELS:
+            post_delete.connect(on_delete, sender=model, dispatch_uid=f"change_stamp_delete_{model.__name__}")
+    post_save.connect(on_user_save, sender=User, dispatch_uid="change_stamp_save_User")
+    post_delete.connect(on_delete, sender=User, dispatch_uid="change_stamp_delete_User")
+    for through in [Event.node.through, Event.organising_institution.through]:
+        m2m_changed.connect(
+            on_event_relations_changed,
+            sender=through,
+            dispatch_uid=f"change_stamp_m2m_{through.__name__}"
+        )
@@ -0,0 +1,203 @@
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from metrics import change_stamps, import_utils
+from metrics.models import Event, User
+from typing import Callable, Iterable
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class CopyImportContext(import_utils.ImportContext):
+    # Users and events are resolved with joins in the database, rows are
+    # only normalized in Python.
+    def get_user_and_event(self, data: dict):
+        return (None, None)
+
+
+class CopyStream:
+    # File-like object that lets copy_expert read lines from an iterator
+    def __init__(self, lines: Iterable[str]):
+        self.lines = iter(lines)
+        self.buffer = bytearray()
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer.extend(line.encode())
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+def copy_text(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, (list, tuple)):
+        value = array_literal(value)
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def array_literal(values) -> str:
+    quoted = (
+        '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+        for value in values
+    )
+    return "{" + ",".join(quoted) + "}"
+
+
+def get_value_fields(model) -> list:
+    return [
+        field
+        for field in model._meta.concrete_fields
+        if not (
+            field.primary_key
+            or field.is_relation
+            or getattr(field, "auto_now", False)
+            or getattr(field, "auto_now_add", False)
+        )
+    ]
+
+
+class CopyLoader:
+    """
+    Loads metrics rows by streaming them into a temporary staging table with
+    COPY and inserting them with a single INSERT ... SELECT that joins users
+    and events.
+    """
+
+    def __init__(self, model, build: Callable[[dict], object], context: import_utils.ImportContext):
+        self.model = model
+        self.build = build
+        self.context = context
+        self.fields = get_value_fields(model)
+        self.validator = import_utils.RowValidator(model, exclude={"user", "event"})
+        self.fingerprinter = (
+            import_utils.Fingerprinter()
+            if model in import_utils.FINGERPRINTED_MODELS
+            else None
+        )
+        self.staged = 0
+
+    def load(self, rows: Iterable[dict]) -> int:
+        qn = connection.ops.quote_name
+        staging = qn(f"staging_{self.model._meta.db_table}")
+        columns = ", ".join(qn(field.column) for field in self.fields)
+        errors = []
+        self.staged = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(self.create_staging_sql(staging))
+            cursor.copy_expert(
+                f"COPY {staging} (row_index, username, event_key, {columns}) FROM STDIN",
+                CopyStream(self.copy_lines(rows, errors)),
+            )
+            if errors:
+                raise ValidationError(errors)
+
+            cursor.execute(self.unresolved_sql(staging))
+            for (index, username, event_key, unknown_user, unknown_event) in cursor.fetchall():
+                if unknown_user:
+                    errors.append(f"Row {index}: Unknown user '{username}'")
+                if unknown_event:
+                    errors.append(f"Row {index}: Unknown event '{event_key}'")
+            if errors:
+                raise ValidationError(errors)
+
+            cursor.execute(self.insert_sql(staging))
+            inserted = cursor.rowcount
+            cursor.execute(f"DROP TABLE {staging}")
+
+        change_stamps.mark_changed(self.model, inserted)
+        logger.info(
+            f"Copied {inserted} rows into {self.model._meta.db_table}, "
+            f"skipped {self.staged - inserted} duplicates"
+        )
+        return inserted
+
+    def copy_lines(self, rows: Iterable[dict], errors: list[str]):
+        for (index, row) in enumerate(rows):
+            try:
+                instance = self.build(row)
+                event_key = (
+                    self.context.get_event_key(row["event"])
+                    if row.get("event")
+                    else None
+                )
+            except (ValidationError, ValueError) as e:
+                messages = e.messages if isinstance(e, ValidationError) else [str(e)]
+                errors.extend(f"Row {index}: {message}" for message in messages)
+                continue
+
+            errors.extend(
+                f"Row {index}: {self.model.__name__}.{error}"
+                for error in self.validator.get_errors(instance)
+            )
+            if self.fingerprinter is not None:
+                # Numbered by the event key, the event id is only known
+                # after the join
+                self.fingerprinter.assign(instance, event_key)
+            self.staged += 1
+            values = [
+                index,
+                row.get("user") or None,
+                event_key,
+                *[getattr(instance, field.attname) for field in self.fields],
+            ]
+            yield "\t".join(copy_text(value) for value in values) + "\n"
+
+    def create_staging_sql(self, staging: str) -> str:
+        # The staging columns take their types from the target tables, so
+        # that COPY parses arrays and lookup keys the same way.
+        qn = connection.ops.quote_name
+        event_field = Event._meta.get_field(self.context.event_lookup_field)
+        columns = ", ".join(f"t.{qn(field.column)}" for field in self.fields)
+        return (
+            f"CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS "
+            f"SELECT NULL::integer AS row_index, NULL::text AS username, "
+            f"e.{qn(event_field.column)} AS event_key, {columns} "
+            f"FROM {qn(self.model._meta.db_table)} t, {qn(Event._meta.db_table)} e "
+            f"WITH NO DATA"
+        )
+
+    def joins_sql(self, staging: str, join: str = "JOIN") -> str:
+        qn = connection.ops.quote_name
+        event_field = Event._meta.get_field(self.context.event_lookup_field)
+        return (
+            f"FROM {staging} s "
+            f"{join} {qn(User._meta.db_table)} u ON u.username = s.username "
+            f"{join} {qn(Event._meta.db_table)} e ON e.{qn(event_field.column)} = s.event_key"
+        )
+
+    def unresolved_sql(self, staging: str) -> str:
+        return (
+            f"SELECT s.row_index, s.username, s.event_key, u.id IS NULL, e.id IS NULL "
+            f"{self.joins_sql(staging, 'LEFT JOIN')} "
+            f"WHERE u.id IS NULL OR e.id IS NULL "
+            f"ORDER BY s.row_index"
+        )
+
+    def insert_sql(self, staging: str) -> str:
+        qn = connection.ops.quote_name
+        meta = self.model._meta
+        columns = [qn(field.column) for field in self.fields]
+        return (
+            f"INSERT INTO {qn(meta.db_table)} ("
+            f"{qn(meta.get_field('user').column)}, {qn(meta.get_field('event').column)}, "
+            f"{qn(meta.get_field('created').column)}, {qn(meta.get_field('modified').column)}, "
+            f"{', '.join(columns)}) "
+            f"SELECT u.id, e.id, now(), now(), {', '.join(f's.{column}' for column in columns)} "
+            f"{self.joins_sql(staging)} "
+            f"ORDER BY s.row_index "
+            f"ON CONFLICT DO NOTHING"
+        )
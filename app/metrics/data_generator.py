@@ -0,0 +1,144 @@
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import io
+import numpy as np
+
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+def get_weights(values: list, skew: float = 0.0, weights: dict | None = None) -> np.ndarray:
+    # Zipf-like weights by the order of the values unless explicit weights
+    # are given, skew 0 samples uniformly.
+    if weights:
+        sampled = np.array([float(weights.get(value, 0)) for value in values])
+    else:
+        sampled = 1.0 / np.arange(1, len(values) + 1) ** skew
+    if sampled.sum() <= 0:
+        raise ValueError(f"No positive weights for: {values}")
+    return sampled / sampled.sum()
+
+
+class Constant:
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self, rng: np.random.Generator, start: int, stop: int) -> np.ndarray:
+        return np.full(stop - start, self.value, dtype=object)
+
+
+class Numbered:
+    # Unique values with the row number appended to a prefix
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+
+    def __call__(self, rng, start, stop):
+        return np.char.add(self.prefix, np.arange(start, stop).astype(str))
+
+
+class Choice:
+    def __init__(self, values: list, weights: np.ndarray):
+        self.values = np.array(values, dtype=object)
+        self.weights = weights
+
+    def __call__(self, rng, start, stop):
+        return self.values[rng.choice(len(self.values), size=stop - start, p=self.weights)]
+
+
+class Subset:
+    """
+    Joins 1 to max_size distinct values sampled without replacement, like
+    the multiple choice answers of the surveys.
+    """
+
+    def __init__(self, values: list, weights: np.ndarray, max_size: int | None = None, separator: str = ", "):
+        self.values = values
+        self.weights = weights
+        self.max_size = min(max_size or len(values), np.count_nonzero(weights))
+        self.separator = separator
+
+    def __call__(self, rng, start, stop):
+        size = stop - start
+        # Weighted sampling without replacement for every row at once: the
+        # values with the smallest exponential keys scaled by their weights
+        with np.errstate(divide="ignore"):
+            keys = rng.exponential(size=(size, len(self.values))) / self.weights
+        indices = np.argsort(keys, axis=1)[:, : self.max_size]
+        lengths = rng.integers(1, self.max_size + 1, size=size)
+        indices[np.arange(self.max_size) >= lengths[:, None]] = -1
+        # Only the distinct combinations are joined in Python
+        (combinations, inverse) = np.unique(indices, axis=0, return_inverse=True)
+        joined = np.array(
+            [
+                self.separator.join(self.values[index] for index in combination if index >= 0)
+                for combination in combinations
+            ],
+            dtype=object,
+        )
+        return joined[inverse.reshape(-1)]
+
+
+class Poisson:
+    def __init__(self, mean: float):
+        self.mean = mean
+
+    def __call__(self, rng, start, stop):
+        return rng.poisson(self.mean, size=stop - start)
+
+
+class Repeated:
+    # Repeats each value by its count, e.g. the event code of every answer
+    def __init__(self, values: list, counts: np.ndarray):
+        self.values = np.array(values, dtype=object)
+        self.offsets = np.cumsum(counts)
+
+    def __call__(self, rng, start, stop):
+        return self.values[np.searchsorted(self.offsets, np.arange(start, stop), side="right")]
+
+
+def get_answer_counts(event_count: int, answers_per_event: float, seed: int) -> np.ndarray:
+    # At least one answer for every event
+    rng = np.random.default_rng([seed, event_count])
+    return np.maximum(1, rng.poisson(answers_per_event, size=event_count))
+
+
+def render_chunk(columns: dict, seed: int, start: int, stop: int) -> str:
+    # Every chunk has its own random stream, so that the output does not
+    # depend on the number of processes.
+    rng = np.random.default_rng([seed, start])
+    sampled = [sample(rng, start, stop).tolist() for sample in columns.values()]
+    output = io.StringIO()
+    csv.writer(output).writerows(zip(*sampled))
+    return output.getvalue()
+
+
+def write_csv(
+    path: str,
+    columns: dict,
+    rows: int,
+    seed: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    processes: int = 1,
+) -> int:
+    """
+    Writes rows sampled column by column to a CSV file, chunk by chunk.
+    Chunks are rendered by a process pool when processes > 1.
+    """
+    ranges = [
+        (start, min(start + chunk_size, rows))
+        for start in range(0, rows, chunk_size)
+    ]
+    with open(path, "w", newline="") as f:
+        csv.writer(f).writerow(columns.keys())
+        if processes > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                chunks = executor.map(
+                    render_chunk,
+                    *zip(*[(columns, seed, start, stop) for (start, stop) in ranges]),
+                )
+                for chunk in chunks:
+                    f.write(chunk)
+        else:
+            for (start, stop) in ranges:
+                f.write(render_chunk(columns, seed, start, stop))
+    return rows
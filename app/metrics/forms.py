@@ -2,6 +2,9 @@ from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+from metrics import change_stamps, ror
 import metrics.models as models
 
 
@@ -16,3 +19,127 @@ class UserLoginForm(AuthenticationForm):
 
     password = forms.CharField(
         widget=forms.PasswordInput(attrs={'class': 'form-control'}))
+
+
+class InstitutionAutocomplete(forms.SelectMultiple):
+    """
+    Lists only the selected institutions, others are found by searching the
+    local ROR registry and are submitted by their ror id.
+    """
+    template_name = "metrics/widgets/institution-autocomplete.html"
+
+    def __init__(self, attrs=None):
+        super().__init__(attrs)
+        # Labels of the initial institutions, so they need no query
+        self.labels = {}
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context["widget"]["search_url"] = reverse("institution-search")
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        labels = self.get_labels(value)
+        return [(
+            None,
+            [
+                self.create_option(name, selected, labels.get(selected, selected), True, index, attrs=attrs)
+                for (index, selected) in enumerate(value)
+            ],
+            0,
+        )]
+
+    def get_labels(self, values):
+        labels = {value: self.labels[value] for value in values if value in self.labels}
+        missing = [value for value in values if value not in labels]
+        ids = [value for value in missing if value.isdigit()]
+        if ids:
+            labels.update({
+                str(institution.pk): str(institution)
+                for institution in models.OrganisingInstitution.objects.filter(pk__in=ids)
+            })
+        ror_ids = [value for value in missing if not value.isdigit()]
+        if ror_ids:
+            labels.update({
+                record.ror_id: f"{record.name} ({record.country})" if record.country else record.name
+                for record in models.RorRecord.objects.filter(ror_id__in=ror_ids)
+            })
+        return labels
+
+
+class InstitutionChoiceField(forms.ModelMultipleChoiceField):
+    """
+    Accepts the ids of existing institutions and the ror ids of new ones.
+    The new institutions are returned unsaved with their ROR data.
+    """
+    widget = InstitutionAutocomplete
+
+    def _check_values(self, value):
+        ror_ids = {str(item) for item in value if not str(item).isdigit()}
+        institutions = list(super()._check_values([item for item in value if str(item) not in ror_ids]))
+        known = {institution.pk for institution in institutions}
+        existing = {
+            institution.ror_id: institution
+            for institution in self.queryset.filter(ror_id__in=ror_ids)
+        }
+        institutions.extend(
+            institution
+            for institution in existing.values()
+            if institution.pk not in known
+        )
+        resolved = ror.resolve(ror_ids - existing.keys()) if ror_ids - existing.keys() else {}
+        for (ror_id, data) in sorted(resolved.items()):
+            if isinstance(data, ValidationError):
+                raise data
+            institution = models.OrganisingInstitution(ror_id=ror_id)
+            institution.update_ror_data(data)
+            institutions.append(institution)
+        return institutions
+
+
+class EventForm(forms.ModelForm):
+    class Meta:
+        model = models.Event
+        fields = [
+            "user",
+            "title",
+            "node",
+            "date_start",
+            "date_end",
+            "duration",
+            "type",
+            "organising_institution",
+            "location_city",
+            "location_country",
+            "funding",
+            "target_audience",
+            "additional_platforms",
+            "communities",
+            "number_participants",
+            "number_trainers",
+            "url",
+            "status",
+        ]
+        field_classes = {
+            "organising_institution": InstitutionChoiceField,
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["organising_institution"].widget.labels = {
+            str(institution.pk): str(institution)
+            for institution in self.initial.get("organising_institution", [])
+            if isinstance(institution, models.OrganisingInstitution)
+        }
+
+    def _save_m2m(self):
+        # Institutions picked from the registry are created with the event
+        new = [
+            institution
+            for institution in self.cleaned_data.get("organising_institution", [])
+            if institution.pk is None
+        ]
+        if new:
+            models.OrganisingInstitution.objects.bulk_create(new)
+            change_stamps.mark_changed(models.OrganisingInstitution, len(new))
+        super()._save_m2m()
@@ -1,6 +1,6 @@
 from django.conf import settings
 from datetime import datetime
-from django.db.models import TextField
+from django.db.models import Model, TextField
 from metrics.models import (
     Event,
     Demographic,
@@ -13,9 +13,19 @@ from metrics.models import (
 )
 from django.utils.text import slugify
 from django.core.exceptions import ValidationError, PermissionDenied
+from django.db import transaction
+from metrics import change_stamps, instrumentation, ror
+import collections
+import contextlib
+import dataclasses
+import gzip
+import hashlib
+import json
+import os
 import random
-from typing import Callable
+from typing import Callable, Iterable
 import functools
+import itertools
 import csv
 import logging
 
@@ -24,14 +34,90 @@ logger = logging.getLogger(__name__)
 
 
 class ImportContext:
-    def __init__(self):
+    event_lookup_field = "code"
+
+    def __init__(self, fetch_ror: bool = True):
+        # Validation only looks up the ROR ids that are known locally
+        self.fetch_ror = fetch_ror
         self._institutions = {}
+        self._ror_data = {}
+        self._users = {}
+        self._events = {}
+        self._nodes = {}
+        self._user_nodes = {}
+
+    def preload(self, rows: list[dict]):
+        self.load_lookups(
+            self._users,
+            User,
+            "username",
+            {row["user"] for row in rows if row.get("user")}
+        )
+        self.load_lookups(
+            self._events,
+            Event,
+            self.event_lookup_field,
+            {self.get_event_key(row["event"]) for row in rows if row.get("event")}
+        )
+        self.load_lookups(
+            self._nodes,
+            Node,
+            "name",
+            {name for row in rows for name in get_node_names(row)}
+        )
+        self.preload_institutions(
+            {ror_id for row in rows for ror_id in get_ror_ids(row)}
+        )
+
+    def preload_institutions(self, ror_ids: set):
+        # ROR data for unknown institutions is fetched concurrently up front
+        # instead of one request per institution.
+        missing = ror_ids - self._institutions.keys() - self._ror_data.keys()
+        if not missing:
+            return
+        for institution in OrganisingInstitution.objects.filter(ror_id__in=missing):
+            self._institutions[institution.ror_id] = institution
+        unknown = missing - self._institutions.keys()
+        if unknown:
+            self._ror_data.update(ror.resolve(unknown, fetch=self.fetch_ror))
+
+    def load_lookups(self, cache: dict, model, field: str, keys: set):
+        missing = keys - cache.keys()
+        if missing:
+            found = {
+                getattr(instance, field): instance
+                for instance in model.objects.filter(**{f"{field}__in": missing})
+            }
+            cache.update({key: found.get(key) for key in missing})
+
+    def lookup(self, cache: dict, model, field: str, key):
+        self.load_lookups(cache, model, field, {key})
+        instance = cache[key]
+        if instance is None:
+            raise ValidationError(f"Unknown {model.__name__.lower()} '{key}'")
+        return instance
 
     def event_from_dict(self, data: dict):
+        (event, institutions, nodes) = self.build_event(data)
+        # Invalid events are rejected before anything is written
+        event.full_clean()
+        event.save()
+        event.organising_institution.set(institutions)
+        event.node.add(*nodes)
+        return event
+
+    def build_event(self, data: dict) -> tuple[Event, list, list]:
+        # Returns the unsaved event with its institutions and nodes
+        event = self.build_event_instance(data)
+        institution_ids = csv_to_array(data['organising_institution'])
+        institutions = self.get_institutions(institution_ids)
+        return (event, institutions, self.get_event_nodes(data))
+
+    def build_event_instance(self, data: dict) -> Event:
         (created, modified) = self.timestamps_from_data(data)
         start_date = convert_to_date(data['date_start'])
         end_date = convert_to_date(data['date_end'])
-        event = Event.objects.create(
+        return Event(
             user=self.user_from_data(data),
             created=created,
             modified=modified,
@@ -45,30 +131,77 @@ class ImportContext:
             date_start=start_date,
             date_end=end_date,
             duration=float(data['duration']) if data['duration'] else (end_date - start_date).days + 1,
-            type=use_alias(data['type']),
-            funding=csv_to_array(data['funding']) or ["ELIXIR Node"],
+            type=use_alias(data['type'], "Event.type"),
+            funding=csv_to_array(data['funding'], "Event.funding") or ["ELIXIR Node"],
             location_city=data['location_city'] or "NA",
             location_country=data['location_country'],
-            target_audience=csv_to_array(data['target_audience']) or ["Academia/ Research Institution"],
-            additional_platforms=csv_to_array(data['additional_platforms']) or ["NA"],
-            communities=csv_to_array(data['communities']) or ["NA"],
+            target_audience=csv_to_array(data['target_audience'], "Event.target_audience") or ["Academia/ Research Institution"],
+            additional_platforms=csv_to_array(data['additional_platforms'], "Event.additional_platforms") or ["NA"],
+            communities=csv_to_array(data['communities'], "Event.communities") or ["NA"],
             number_participants=int(data['number_participants'] or 0),
             number_trainers=int(data['number_trainers'] or 0),
             url=data['url'],
-            status=use_alias(data['status']),
+            status=use_alias(data['status'], "Event.status"),
         )
-        institution_ids = csv_to_array(data['organising_institution'])
-        event.organising_institution.set(self.get_institutions(institution_ids))
+
+    def get_event_nodes(self, data: dict) -> list[Node]:
         node_names = data['node'].split(",")
         stripped_names = [name.strip() for name in node_names]
-        nodes = [
-            Node.objects.get(name=node)
+        return [
+            self.get_node(node)
             for node in stripped_names
         ]
-        event.node.add(*nodes)
 
-        event.full_clean()
-        return event
+    def events_from_dicts(self, rows: Iterable[dict]):
+        events = []
+        for chunk in chunked(rows, get_import_batch_size()):
+            events.extend(self.save_events(chunk))
+        return events
+
+    def save_events(self, rows: list[dict]) -> list[Event]:
+        """
+        Creates the events of the rows with one insert for the new
+        institutions, one for the events and one for each of their relations.
+        """
+        with instrumentation.stage("lookup", len(rows)):
+            self.preload(rows)
+            self.create_institutions({ror_id for row in rows for ror_id in get_ror_ids(row)})
+        with instrumentation.stage("build", len(rows)):
+            built = [self.build_event(row) for row in rows]
+        events = [event for (event, _institutions, _nodes) in built]
+        with instrumentation.stage("validate", len(rows)):
+            errors = get_row_validator(Event).validate(enumerate(events)) + get_code_errors(events)
+            if errors:
+                raise ValidationError(errors)
+        with instrumentation.stage("insert", len(rows)):
+            Event.objects.bulk_create(events)
+            insert_relations(
+                Event.node.through,
+                "node_id",
+                {event.id: nodes for (event, _institutions, nodes) in built},
+            )
+            insert_relations(
+                Event.organising_institution.through,
+                "organisinginstitution_id",
+                {event.id: institutions for (event, institutions, _nodes) in built},
+            )
+            change_stamps.mark_changed(Event, len(events))
+        return events
+
+    def create_institutions(self, ror_ids: set):
+        # Institutions resolved through ROR by preload are created together
+        new = []
+        for ror_id in ror_ids - self._institutions.keys():
+            data = self._ror_data.get(ror_id)
+            if data is None or isinstance(data, ValidationError):
+                continue
+            institution = OrganisingInstitution(ror_id=ror_id)
+            institution.update_ror_data(data)
+            new.append(institution)
+        if new:
+            OrganisingInstitution.objects.bulk_create(new)
+            change_stamps.mark_changed(OrganisingInstitution, len(new))
+            self._institutions.update({institution.ror_id: institution for institution in new})
 
     def get_institutions(self, ror_ids):
         result = []
@@ -84,73 +217,95 @@ class ImportContext:
         if institution is not None:
             return institution
 
-        existing_inst = OrganisingInstitution.objects.filter(ror_id=ror_id).first()
-        if existing_inst is not None:
-            self._institutions[ror_id] = existing_inst
-            return existing_inst
+        # Preloaded ids that were resolved through ROR are known to be new
+        if ror_id not in self._ror_data:
+            existing_inst = OrganisingInstitution.objects.filter(ror_id=ror_id).first()
+            if existing_inst is not None:
+                self._institutions[ror_id] = existing_inst
+                return existing_inst
 
+        data = self._ror_data.get(ror_id)
+        if isinstance(data, ValidationError):
+            raise data
         new_inst = OrganisingInstitution(ror_id=ror_id)
-        new_inst.update_ror_data()
+        new_inst.update_ror_data(data)
         new_inst.save()
         self._institutions[ror_id] = new_inst
         return new_inst
 
+    def check_institutions(self, ror_ids: Iterable[str]):
+        # Raises the failed lookups of preloaded ids without creating
+        # any institutions
+        errors = [
+            data
+            for ror_id in ror_ids
+            if isinstance(data := self._ror_data.get(ror_id), ValidationError)
+        ]
+        if errors:
+            raise ValidationError(errors)
+
     def demographic_from_dict(self, data: dict):
+        return save_validated(self.build_demographic(data))
+
+    def quality_from_dict(self, data: dict):
+        return save_validated(self.build_quality(data))
+
+    def impact_from_dict(self, data: dict):
+        return save_validated(self.build_impact(data))
+
+    def build_demographic(self, data: dict):
         (created, modified) = self.timestamps_from_data(data)
         (user, event) = self.get_user_and_event(data)
-        demographic = Demographic.objects.create(
+        return Demographic(
             user=user,
             created=created,
             modified=modified,
             event=event,
-            heard_from=csv_to_array(data['heard_from']) or ["Other"],
-            employment_sector=use_alias(data['employment_sector']) or "Other",
+            legacy_id=legacy_id_from_dict(data),
+            heard_from=csv_to_array(data['heard_from'], "Demographic.heard_from") or ["Other"],
+            employment_sector=use_alias(data['employment_sector'], "Demographic.employment_sector") or "Other",
             employment_country=data['employment_country'],
-            gender=use_alias(data['gender']) or "Other",
-            career_stage=use_alias(data['career_stage']) or "Other",
+            gender=use_alias(data['gender'], "Demographic.gender") or "Other",
+            career_stage=use_alias(data['career_stage'], "Demographic.career_stage") or "Other",
         )
-        demographic.full_clean()
-        return demographic
 
-    def quality_from_dict(self, data: dict):
+    def build_quality(self, data: dict):
         (created, modified) = self.timestamps_from_data(data)
         (user, event) = self.get_user_and_event(data)
-        quality = Quality.objects.create(
+        return Quality(
             user=user,
             created=created,
             modified=modified,
             event=event,
-            used_resources_before=use_alias(data['used_resources_before']),
-            used_resources_future=use_alias(data['used_resources_future']),
-            recommend_course=use_alias(data['recommend_course']),
-            course_rating=use_alias(data['course_rating']),
-            balance=use_alias(data['balance']),
-            email_contact=use_alias(data['email_contact']) or "No",
+            legacy_id=legacy_id_from_dict(data),
+            used_resources_before=use_alias(data['used_resources_before'], "Quality.used_resources_before"),
+            used_resources_future=use_alias(data['used_resources_future'], "Quality.used_resources_future"),
+            recommend_course=use_alias(data['recommend_course'], "Quality.recommend_course"),
+            course_rating=use_alias(data['course_rating'], "Quality.course_rating"),
+            balance=use_alias(data['balance'], "Quality.balance"),
+            email_contact=use_alias(data['email_contact'], "Quality.email_contact") or "No",
         )
-        quality.full_clean()
-        return quality
 
-    def impact_from_dict(self, data: dict):
+    def build_impact(self, data: dict):
         (created, modified) = self.timestamps_from_data(data)
         (user, event) = self.get_user_and_event(data)
-        impact = Impact.objects.create(
+        return Impact(
             user=user,
             created=created,
             modified=modified,
             event=event,
-            when_attend_training=use_alias(data['when_attend_training']),
-            main_attend_reason=use_alias(data['main_attend_reason']),
-            how_often_use_before=use_alias(data['how_often_use_before']),
-            how_often_use_after=use_alias(data['how_often_use_after']),
-            able_to_explain=use_alias(data['able_to_explain']) or "Other",
-            able_use_now=use_alias(data['able_use_now']) or "Other",
-            help_work=csv_to_array(data['help_work']) or ["Other"],
-            attending_led_to=csv_to_array(data['attending_led_to']) or ["Other"],
-            people_share_knowledge=use_alias(data['people_share_knowledge']),
-            recommend_others=use_alias(data['recommend_others']),
+            legacy_id=legacy_id_from_dict(data),
+            when_attend_training=use_alias(data['when_attend_training'], "Impact.when_attend_training"),
+            main_attend_reason=use_alias(data['main_attend_reason'], "Impact.main_attend_reason"),
+            how_often_use_before=use_alias(data['how_often_use_before'], "Impact.how_often_use_before"),
+            how_often_use_after=use_alias(data['how_often_use_after'], "Impact.how_often_use_after"),
+            able_to_explain=use_alias(data['able_to_explain'], "Impact.able_to_explain") or "Other",
+            able_use_now=use_alias(data['able_use_now'], "Impact.able_use_now") or "Other",
+            help_work=csv_to_array(data['help_work'], "Impact.help_work") or ["Other"],
+            attending_led_to=csv_to_array(data['attending_led_to'], "Impact.attending_led_to") or ["Other"],
+            people_share_knowledge=use_alias(data['people_share_knowledge'], "Impact.people_share_knowledge"),
+            recommend_others=use_alias(data['recommend_others'], "Impact.recommend_others"),
         )
-        impact.full_clean()
-        return impact
 
     def get_user_and_event(self, data: dict):
         event = self.get_event(data)
@@ -159,18 +314,28 @@ class ImportContext:
         return (user, event)
 
     def get_event(self, data):
-        identifier = data['event']
-        return Event.objects.get(code=identifier)
+        identifier = self.get_event_key(data['event'])
+        return self.lookup(self._events, Event, self.event_lookup_field, identifier)
+
+    def get_event_key(self, identifier):
+        return identifier
+
+    def get_node(self, name):
+        return self.lookup(self._nodes, Node, "name", name)
+
+    def get_user_node(self, user):
+        if user.pk not in self._user_nodes:
+            self._user_nodes[user.pk] = user.get_node()
+        return self._user_nodes[user.pk]
 
     def user_from_data(self, data: dict):
-        return User.objects.get(username=data['user'])
+        return self.lookup(self._users, User, "username", data['user'])
 
     def node_from_data(self, data: dict):
         node_main = data['node_main'] if data['node_main'] else ''
         return (
-            Node.objects.get(
-                name=node_main
-            ) if node_main
+            self.get_node(node_main)
+            if node_main
             else None
         )
 
@@ -182,8 +347,10 @@ class ImportContext:
 
 
 class LegacyImportContext(ImportContext):
-    def __init__(self, user=None, node_main=None, timestamps=None, fixed_event=None):
-        super().__init__()
+    event_lookup_field = "id"
+
+    def __init__(self, user=None, node_main=None, timestamps=None, fixed_event=None, fetch_ror=True):
+        super().__init__(fetch_ror)
         self._user = user
         self._node_main = node_main
         self._timestamps = timestamps
@@ -195,6 +362,12 @@ class LegacyImportContext(ImportContext):
             self.demographic_from_dict(data)
         )
 
+    def build_quality_and_demographic(self, data: dict):
+        return (
+            self.build_quality(data),
+            self.build_demographic(data)
+        )
+
     def get_institutions(self, ror_ids):
         return [
             self.get_institution(ror_id)
@@ -205,8 +378,10 @@ class LegacyImportContext(ImportContext):
         if self._fixed_event:
             return self._fixed_event
 
-        identifier = data['event']
-        return Event.objects.get(id=int(identifier))
+        return super().get_event(data)
+
+    def get_event_key(self, identifier):
+        return int(identifier)
 
     def user_from_data(self, data: dict):
         return self._user
@@ -218,82 +393,666 @@ class LegacyImportContext(ImportContext):
         return self._timestamps
 
     def assert_can_change_data(self, user, event):
-        if not event.is_locked and user.get_node() != event.node_main:
+        if not event.is_locked and self.get_user_node(user) != event.node_main:
             raise PermissionDenied(
                 f"The metrics for the event {event.id}, {event.code} can not"
                 f" be updated by the current user: {user.username}"
             )
 
 
-def read_aliases(path):
-    aliases = {}
+def get_node_names(data: dict) -> set[str]:
+    names = {
+        name.strip()
+        for name in (data.get("node") or "").split(",")
+    }
+    if data.get("node_main"):
+        names.add(data["node_main"])
+    return names - {""}
+
+
+def get_ror_ids(data: dict) -> set[str]:
+    return set(csv_to_array(data.get("organising_institution") or ""))
+
+
+def get_import_batch_size():
+    return getattr(settings, "IMPORT_BATCH_SIZE", 1000)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    if path.endswith(".zst"):
+        # Optional dependency, only needed for zstd compressed files
+        import zstandard
+        return zstandard.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, newline="")
+
+
+def json_to_csv_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value)
+    return str(value)
+
+
+class NdjsonReader:
+    """
+    Reads newline delimited JSON objects like csv.DictReader, the values are
+    converted to the strings of the CSV files.
+    """
+
+    def __init__(self, f):
+        self.rows = (json.loads(line) for line in f if line.strip())
+        self.first = next(self.rows, None)
+        self.fieldnames = list(self.first) if self.first is not None else None
+
+    def __iter__(self):
+        if self.first is None:
+            return
+        for row in itertools.chain([self.first], self.rows):
+            yield {key: json_to_csv_value(value) for (key, value) in row.items()}
+
+
+@contextlib.contextmanager
+def open_rows(path: str):
+    # CSV or NDJSON, optionally gzip or zstd compressed
+    with open_text(path) as f:
+        if ".ndjson" in os.path.basename(path):
+            yield NdjsonReader(f)
+        else:
+            yield csv.DictReader(f)
+
+
+class RowValidator:
+    def __init__(self, model, exclude: Iterable[str] = ()):
+        self.model = model
+        self.checks = [
+            check
+            for field in model._meta.concrete_fields
+            if field.name not in exclude
+            for check in compile_field_checks(field)
+        ]
+
+    def get_errors(self, instance) -> list[str]:
+        errors = []
+        for check in self.checks:
+            error = check(instance)
+            if error is not None:
+                errors.append(error)
+        return errors
+
+    def validate(self, rows: Iterable[tuple[int, Model]]) -> list[str]:
+        return [
+            f"Row {index}: {self.model.__name__}.{error}"
+            for (index, instance) in rows
+            for error in self.get_errors(instance)
+        ]
+
+
+def compile_field_checks(field) -> list[Callable[[Model], str | None]]:
+    if field.primary_key or (not field.editable and not field.is_relation):
+        return []
+
+    name = field.name
+    attname = field.attname
+    checks = []
+    if not field.blank or not field.null:
+        allow_null = field.null
+        allow_blank = field.blank
+        empty_values = field.empty_values
+
+        def check_required(instance):
+            value = getattr(instance, attname)
+            if (
+                (value is None and not allow_null)
+                or (not allow_blank and value in empty_values)
+            ):
+                return f"{name}: This field is required."
+        checks.append(check_required)
+
+    if field.is_relation:
+        return checks
+
+    if field.choices:
+        choices = frozenset(choice for (choice, _label) in field.flatchoices)
+
+        def check_choice(instance):
+            value = getattr(instance, attname)
+            if value not in choices and value not in ("", None):
+                return f"{name}: '{value}' is not a valid choice."
+        checks.append(check_choice)
+
+    base_field = getattr(field, "base_field", None)
+    if base_field is not None and base_field.choices:
+        base_choices = frozenset(choice for (choice, _label) in base_field.flatchoices)
+
+        def check_array_choices(instance):
+            invalid = [
+                value
+                for value in getattr(instance, attname) or []
+                if value not in base_choices
+            ]
+            if invalid:
+                return f"{name}: invalid choices {', '.join(repr(value) for value in invalid)}."
+        checks.append(check_array_choices)
+
+    # The field validators cover lengths, integer ranges, URLs and the digits
+    # of decimals, values are converted first like Model.full_clean does
+    if field.validators:
+        to_python = field.to_python
+        run_validators = field.run_validators
+
+        def check_validators(instance):
+            try:
+                run_validators(to_python(getattr(instance, attname)))
+            except ValidationError as e:
+                return f"{name}: {' '.join(e.messages)}"
+        checks.append(check_validators)
+
+    return checks
+
+
+@functools.cache
+def get_row_validator(model) -> RowValidator:
+    return RowValidator(model)
+
+
+def validate_instance(instance):
+    errors = get_row_validator(type(instance)).get_errors(instance)
+    if errors:
+        raise ValidationError(errors)
+
+
+def save_validated(instance):
+    validate_instance(instance)
+    instance.save()
+    return instance
+
+
+@dataclasses.dataclass
+class ImportProgress:
+    chunks: int = 0
+    rows: int = 0
+    items: list = dataclasses.field(default_factory=list)
+    # Skipped rows that were imported before, by model name
+    duplicates: dict = dataclasses.field(default_factory=dict)
+
+
+FINGERPRINTED_MODELS = (Demographic, Quality, Impact)
+FINGERPRINT_EXCLUDE = {"id", "user", "created", "modified", "event", "fingerprint", "legacy_id"}
+
+
+class Fingerprinter:
+    """
+    Assigns content fingerprints to answers. Identical answers to the same
+    event are numbered, so that they stay distinct within an import while
+    importing the same rows again gives the same fingerprints.
+
+    The numbering starts over with every import, so an import with n
+    identical answers to an event skips as many of them as were stored
+    before and adds the rest. Skipped rows are reported as duplicates.
+    """
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.fields = {}
+
+    def get_fields(self, model) -> list[str]:
+        if model not in self.fields:
+            self.fields[model] = [
+                field.attname
+                for field in model._meta.concrete_fields
+                if field.name not in FINGERPRINT_EXCLUDE
+            ]
+        return self.fields[model]
+
+    def assign(self, instance, event_key=None):
+        model = type(instance)
+        values = [getattr(instance, attname) for attname in self.get_fields(model)]
+        digest = hashlib.sha256(
+            json.dumps([model.__name__, *values], default=str).encode()
+        ).digest()
+        key = (instance.event_id if event_key is None else event_key, digest)
+        ordinal = self.counts[key]
+        self.counts[key] += 1
+        instance.fingerprint = hashlib.sha256(digest + f":{ordinal}".encode()).hexdigest()
+        return instance
+
+
+class BatchImporter:
+    def __init__(
+        self,
+        build: Callable[[dict], Model | tuple],
+        batch_size: int | None = None,
+        preload: Callable[[list[dict]], None] | None = None,
+        parse: Callable[[dict], dict] | None = None,
+    ):
+        self.build = build
+        self.batch_size = batch_size or get_import_batch_size()
+        self.preload = preload
+        self.parse = parse
+        self.start()
+
+    def start(self):
+        # Fingerprints are numbered from the start of every import
+        self.fingerprinter = Fingerprinter()
+        self.duplicates = collections.Counter()
+
+    def import_rows(self, rows: Iterable[dict]) -> list:
+        items = self.build_rows(rows)
+        self.start()
+        for chunk in chunked(items, self.batch_size):
+            self.insert(chunk)
+        return items
+
+    def build_rows(self, rows: Iterable[dict]) -> list:
+        # Every row is built and validated before anything is written, so
+        # invalid uploads are rejected with all their errors at once.
+        items = []
+        errors = []
+        for (offset, chunk) in self.chunks(rows):
+            (built, chunk_errors) = self.build_chunk(chunk, offset)
+            items.extend(built)
+            errors.extend(chunk_errors)
+        if errors:
+            raise ValidationError(errors)
+        return items
+
+    def validate_rows(
+        self,
+        rows: Iterable[dict],
+        progress: Callable[[ImportProgress], None] | None = None,
+    ) -> list[str]:
+        errors = []
+        result = ImportProgress()
+        for (offset, chunk) in self.chunks(rows):
+            (_built, chunk_errors) = self.build_chunk(chunk, offset)
+            errors.extend(chunk_errors)
+            result.chunks += 1
+            result.rows += len(chunk)
+            if progress is not None:
+                progress(result)
+        return errors
+
+    def insert_rows(
+        self,
+        rows: Iterable[dict],
+        progress: Callable[[ImportProgress], None] | None = None,
+        keep_items: bool = False,
+    ) -> ImportProgress:
+        # Only one chunk is held in memory at a time, each one is written
+        # under its own savepoint. Rows are expected to be validated by
+        # validate_rows beforehand.
+        result = ImportProgress()
+        self.start()
+        for (offset, chunk) in self.chunks(rows):
+            (built, errors) = self.build_chunk(chunk, offset)
+            if errors:
+                raise ValidationError(errors)
+            with transaction.atomic():
+                inserted = self.insert(built)
+            result.chunks += 1
+            result.rows += len(chunk)
+            result.duplicates = dict(self.duplicates)
+            if keep_items:
+                result.items.extend(inserted)
+            logger.info(f"Imported chunk {result.chunks}, {result.rows} rows in total")
+            if progress is not None:
+                progress(result)
+        return result
+
+    def chunks(self, rows: Iterable[dict]):
+        # The time spent reading the rows is measured as the read stage
+        chunks = chunked(rows, self.batch_size)
+        offset = 0
+        while True:
+            with instrumentation.stage("read"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            instrumentation.add_rows("read", len(chunk))
+            yield (offset, chunk)
+            offset += len(chunk)
+
+    def parse_chunk(self, rows: list[dict], offset: int = 0) -> tuple[list[tuple[int, dict]], list[str]]:
+        if self.parse is None:
+            return (list(enumerate(rows, start=offset)), [])
+
+        parsed = []
+        errors = []
+        with instrumentation.stage("parse", len(rows)):
+            for (index, row) in enumerate(rows, start=offset):
+                try:
+                    parsed.append((index, self.parse(row)))
+                except ValidationError as e:
+                    errors.extend(f"Failed to parse row {index}: {message}" for message in e.messages)
+        return (parsed, errors)
+
+    def build_chunk(self, rows: list[dict], offset: int = 0) -> tuple[list, list[str]]:
+        (parsed, errors) = self.parse_chunk(rows, offset)
+        items = []
+        indexed_instances = {}
+        if self.preload is not None:
+            with instrumentation.stage("lookup", len(parsed)):
+                self.preload([row for (_index, row) in parsed])
+        # Building includes the alias normalization and cached lookups
+        with instrumentation.stage("build", len(parsed)):
+            for (index, row) in parsed:
+                try:
+                    item = self.build(row)
+                except ValidationError as e:
+                    errors.extend(f"Row {index}: {message}" for message in e.messages)
+                    continue
+                items.append(item)
+                for instance in as_instances(item):
+                    indexed_instances.setdefault(type(instance), []).append((index, instance))
+        with instrumentation.stage("validate", len(items)):
+            for (model, instances) in indexed_instances.items():
+                errors.extend(get_row_validator(model).validate(instances))
+        return (items, errors)
+
+    def insert(self, items: list) -> list:
+        instances_by_model = {}
+        for item in items:
+            for instance in as_instances(item):
+                instances_by_model.setdefault(type(instance), []).append(instance)
+        with instrumentation.stage("insert", len(items)):
+            for (model, instances) in instances_by_model.items():
+                if model in FINGERPRINTED_MODELS:
+                    # Answers with a legacy id are updated in place instead
+                    # of being matched by their fingerprints
+                    self.upsert_legacy(model, [instance for instance in instances if instance.legacy_id is not None])
+                    instances = self.skip_duplicates(
+                        model,
+                        [instance for instance in instances if instance.legacy_id is None],
+                    )
+                # Conflicts with concurrent imports of the same answers are
+                # ignored as well
+                model.objects.bulk_create(
+                    instances,
+                    batch_size=self.batch_size,
+                    ignore_conflicts=model in FINGERPRINTED_MODELS,
+                )
+                change_stamps.mark_changed(model, len(instances))
+        return items
+
+    def upsert_legacy(self, model, instances: list):
+        if not instances:
+            return
+        # A row can only be updated once per statement, the last one wins
+        instances = list({instance.legacy_id: instance for instance in instances}.values())
+        model.objects.bulk_create(
+            instances,
+            batch_size=self.batch_size,
+            update_conflicts=True,
+            unique_fields=["legacy_id"],
+            update_fields=[
+                field.name
+                for field in model._meta.concrete_fields
+                if not field.primary_key and field.name not in ("created", "legacy_id")
+            ],
+        )
+        change_stamps.mark_changed(model, len(instances))
+
+    def skip_duplicates(self, model, instances: list) -> list:
+        for instance in instances:
+            self.fingerprinter.assign(instance)
+        existing = set(
+            model.objects
+            .filter(
+                event_id__in={instance.event_id for instance in instances},
+                fingerprint__in=[instance.fingerprint for instance in instances],
+            )
+            .values_list("event_id", "fingerprint")
+        )
+        new = [
+            instance
+            for instance in instances
+            if (instance.event_id, instance.fingerprint) not in existing
+        ]
+        self.duplicates[model.__name__] += len(instances) - len(new)
+        return new
+
+
+class EventImporter(BatchImporter):
+    # Events are created chunk by chunk by the import context. Before
+    # writing, they are built and validated in memory, only new institutions
+    # are created when inserting.
+    def __init__(self, context: ImportContext, batch_size: int | None = None, parse: Callable[[dict], dict] | None = None):
+        super().__init__(
+            context.save_events,
+            batch_size=batch_size,
+            preload=context.preload,
+            parse=parse,
+        )
+        self.context = context
+
+    def build_chunk(self, rows: list[dict], offset: int = 0) -> tuple[list, list[str]]:
+        (parsed, errors) = self.parse_chunk(rows, offset)
+        items = [row for (_index, row) in parsed]
+        # Resolving institutions here keeps the ROR requests out of the
+        # insert transaction.
+        with instrumentation.stage("lookup", len(items)):
+            self.preload(items)
+        events = []
+        with instrumentation.stage("build", len(items)):
+            for (index, row) in parsed:
+                try:
+                    events.append((index, self.context.build_event_instance(row)))
+                    self.context.get_event_nodes(row)
+                    self.context.check_institutions(get_ror_ids(row))
+                except (ValidationError, ValueError, KeyError) as e:
+                    messages = e.messages if isinstance(e, ValidationError) else [f"{type(e).__name__}: {e}"]
+                    errors.extend(f"Row {index}: {message}" for message in messages)
+        with instrumentation.stage("validate", len(events)):
+            errors.extend(get_row_validator(Event).validate(events))
+        return (items, errors)
+
+    def insert(self, items: list) -> list:
+        return self.build(items)
+
+
+def get_code_errors(events: list[Event]) -> list[str]:
+    # Unique codes are checked with one query instead of full_clean per event
+    indexes = {}
+    errors = []
+    for (index, event) in enumerate(events):
+        if event.code is None:
+            continue
+        if event.code in indexes:
+            errors.append(f"Row {index}: Event.code: '{event.code}' is used by row {indexes[event.code]} as well.")
+        indexes.setdefault(event.code, index)
+    for code in Event.objects.filter(code__in=indexes.keys()).values_list("code", flat=True):
+        errors.append(f"Row {indexes[code]}: Event.code: Event with this Code already exists.")
+    return errors
+
+
+def insert_relations(through, target_field: str, targets: dict[int, list]):
+    # Through rows for the targets of each event, repeated targets once
+    through.objects.bulk_create(
+        [
+            through(event_id=event_id, **{target_field: target.id})
+            for (event_id, instances) in targets.items()
+            for target in {instance.id: instance for instance in instances}.values()
+        ],
+        ignore_conflicts=True,
+    )
+    if targets:
+        change_stamps.mark_changed(Event)
+
+
+def as_instances(item) -> tuple:
+    return item if isinstance(item, tuple) else (item,)
+
+
+DEFAULT_ALIASES = {
+    "academia/ research institution": "Academia/ Research Institution",
+    "non-profit organisation": "Non-Profit Organisation",
+    "complete": "Complete",
+    "non-elixir/ non-excelerate funds": "Non-ELIXIR / Non-EXCELERATE Funds",
+    "training - elearning": "Training - e-learning",
+    "converge": "ELIXIR Converge",
+    "eosc-life": "EOSC Life",
+    "knowledge exchange workshop": "Knowledge Exchange Workshop",
+    "elixir community/ use case": "ELIXIR Community / Use case",
+    "to learn something new to aid me in my current research/ work": "To learn something new to aid me in my current research/work",
+    "by using training materials/ notes from the training event": "By using training materials/notes from the training event",
+    "to build an existing knowledge to aid me in my current research/ work": "To build on existing knowledge to aid me in my current research/work",
+    "useful collaboration(s) with other participants/ trainers from the training event": "Useful collaboration(s) with other participants/trainers from the training event",
+    "it improved communication with the bioinformatician/ statistician analyzing my data": "It improved communication with the bioinformatician/statistician analyzing my data",
+    "it did not help as i do not use the tool(s)/ resource(s) covered in the training event": "It did not help as I do not use the tool(s)/resource(s) covered in the training event",
+    "submission of my dissertation/ thesis for degree purposes": "Submission of my dissertation/thesis for degree purposes",
+}
+
+
+# Aliases of this field id apply to every field
+GENERAL_ALIASES_FIELD = "general.general"
+
+
+def normalize_alias_key(value: str) -> str:
+    return value.lower().strip()
+
+
+class AliasMap:
+    # Normalized values are memoized, repeated values in an import are only
+    # looked up once.
+    MAX_MEMO_SIZE = 10000
+
+    def __init__(self, aliases: dict[str, str]):
+        self.aliases = aliases
+        self._values = {}
+        self._arrays = {}
+
+    def normalize(self, value: str) -> str:
+        normalized = self._values.get(value)
+        if normalized is None:
+            if len(self._values) >= self.MAX_MEMO_SIZE:
+                self._values.clear()
+            normalized = self.aliases.get(normalize_alias_key(value), value)
+            self._values[value] = normalized
+        return normalized
+
+    def normalize_array(self, csv_string: str) -> list[str]:
+        if not csv_string:
+            return []
+        normalized = self._arrays.get(csv_string)
+        if normalized is None:
+            if len(self._arrays) >= self.MAX_MEMO_SIZE:
+                self._arrays.clear()
+            normalized = tuple(
+                self.normalize(value.strip())
+                for value in csv_string.split(",")
+            )
+            self._arrays[csv_string] = normalized
+        return list(normalized)
+
+
+def read_alias_maps(path) -> dict[str, dict[str, str]]:
+    alias_maps = {}
     ignore_columns = {"field", "value"}
     with open(path) as f:
         reader = csv.DictReader(f)
         for row in reader:
+            field_id = row["field"]
             value = row["value"]
+            aliases = alias_maps.setdefault(field_id, {})
             for (column, alias) in row.items():
                 if column not in ignore_columns and alias:
-                    simplified_alias = alias.lower().strip()
+                    simplified_alias = normalize_alias_key(alias)
                     existing_alias = aliases.get(simplified_alias)
                     if existing_alias is None:
                         aliases[simplified_alias] = value
                     elif existing_alias != value:
                         raise ValueError(
-                            f"Confliciting aliases for '{simplified_alias}': '{existing_alias}' <-> '{value}'"
+                            f"Confliciting aliases for {field_id} '{simplified_alias}': '{existing_alias}' <-> '{value}'"
                         )
-    return aliases
+    return alias_maps
 
 
-@functools.cache
-def get_aliases():
-    aliases = {
-        "academia/ research institution": "Academia/ Research Institution",
-        "non-profit organisation": "Non-Profit Organisation",
-        "complete": "Complete",
-        "non-elixir/ non-excelerate funds": "Non-ELIXIR / Non-EXCELERATE Funds",
-        "training - elearning": "Training - e-learning",
-        "converge": "ELIXIR Converge",
-        "eosc-life": "EOSC Life",
-        "knowledge exchange workshop": "Knowledge Exchange Workshop",
-        "elixir community/ use case": "ELIXIR Community / Use case",
-        "to learn something new to aid me in my current research/ work": "To learn something new to aid me in my current research/work",
-        "by using training materials/ notes from the training event": "By using training materials/notes from the training event",
-        "to build an existing knowledge to aid me in my current research/ work": "To build on existing knowledge to aid me in my current research/work",
-        "useful collaboration(s) with other participants/ trainers from the training event": "Useful collaboration(s) with other participants/trainers from the training event",
-        "it improved communication with the bioinformatician/ statistician analyzing my data": "It improved communication with the bioinformatician/statistician analyzing my data",
-        "it did not help as i do not use the tool(s)/ resource(s) covered in the training event": "It did not help as I do not use the tool(s)/resource(s) covered in the training event",
-        "submission of my dissertation/ thesis for degree purposes": "Submission of my dissertation/thesis for degree purposes",
-    }
+def merge_alias_maps(alias_maps) -> dict[str, str]:
+    # Aliases that map to different values for different fields are left
+    # out of the field independent map.
+    merged = {}
+    conflicts = set()
+    for aliases in alias_maps:
+        for (alias, value) in aliases.items():
+            if merged.setdefault(alias, value) != value:
+                conflicts.add(alias)
+    for alias in conflicts:
+        del merged[alias]
+    return merged
+
 
+@functools.cache
+def get_alias_maps() -> dict[str | None, AliasMap]:
+    field_aliases = {}
     aliases_path = getattr(settings, "VALUE_ALIASES_PATH", None)
     if aliases_path is not None:
         try:
-            aliases = read_aliases(aliases_path)
+            field_aliases = read_alias_maps(aliases_path)
             logger.info(f"Aliases loaded from: {aliases_path}")
         except (FileNotFoundError, ValueError) as e:
             logger.error(f"Failed to load aliases from: {aliases_path}: {str(e)}")
 
-    return aliases
+    general_aliases = field_aliases.get(GENERAL_ALIASES_FIELD, {})
+    return {
+        None: AliasMap(
+            merge_alias_maps(field_aliases.values())
+            if field_aliases
+            else DEFAULT_ALIASES
+        ),
+        # Field specific aliases take precedence over the general ones
+        **{
+            field_id: AliasMap({**general_aliases, **aliases})
+            for (field_id, aliases) in field_aliases.items()
+        },
+    }
+
+
+def get_alias_map(field_id: str | None = None) -> AliasMap:
+    # Field ids are "<Model>.<field>", unknown fields use the aliases of all
+    # fields.
+    alias_maps = get_alias_maps()
+    return alias_maps.get(field_id) or alias_maps[None]
 
 
-def use_alias(value):
-    aliases = get_aliases()
+def use_alias(value, field_id: str | None = None):
+    alias_map = get_alias_map(field_id)
     return (
         [
-            aliases.get(value.lower(), v)
+            alias_map.normalize(v)
             for v in value
         ]
         if type(value) is list
-        else aliases.get(value.lower(), value)
+        else alias_map.normalize(value)
     )
 
 
-def csv_to_array(csv_string):
+def csv_to_array(csv_string, field_id: str | None = None):
+    return get_alias_map(field_id).normalize_array(csv_string)
+
+
+def normalize_column(values: list, field_id: str | None = None, array: bool = False) -> list:
+    alias_map = get_alias_map(field_id)
+    normalize = alias_map.normalize_array if array else alias_map.normalize
+    normalized = {
+        value: normalize(value)
+        for value in set(values)
+    }
     return [
-        use_alias(x.strip())
-        for x in csv_string.split(",")
-    ] if csv_string else []
+        list(normalized[value]) if array else normalized[value]
+        for value in values
+    ]
 
 
 def convert_to_timestamp(date_string):
@@ -324,6 +1083,16 @@ def timestamps_from_dict(data: dict):
     return (created, modified)
 
 
+def legacy_id_from_dict(data: dict) -> int | None:
+    value = data.get("legacy_id")
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"Invalid legacy_id: '{value}'")
+
+
 def legacy_to_current_event_dict(data: dict) -> dict:
     try:
         mapping = {
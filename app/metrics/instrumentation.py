@@ -0,0 +1,140 @@
+from django.db import connection
+import contextlib
+import contextvars
+import dataclasses
+import logging
+import threading
+import time
+import tracemalloc
+
+
+logger = logging.getLogger(__name__)
+
+_profile = contextvars.ContextVar("import_profile", default=None)
+# Returned by stage() while profiling is disabled
+NO_STAGE = contextlib.nullcontext()
+
+
+@dataclasses.dataclass
+class StageStats:
+    name: str
+    seconds: float = 0
+    calls: int = 0
+    rows: int = 0
+    queries: int = 0
+    # Bytes, only traced when memory profiling is enabled
+    peak_memory: int | None = None
+
+
+class ImportProfile:
+    """
+    Wall time, rows, queries and tracemalloc peaks per import stage. Threads
+    that share a profile record into their own one, which is merged into it
+    when they are done. Memory peaks are process wide, so they are only
+    meaningful while a single thread is profiled.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.queries = 0
+        self.lock = threading.Lock()
+        # Peaks of the open stages from before their nested stages reset it
+        self.peaks = []
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def get_stage(self, name: str) -> StageStats:
+        if name not in self.stages:
+            self.stages[name] = StageStats(name)
+        return self.stages[name]
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows: int = 0):
+        stats = self.get_stage(name)
+        queries = self.queries
+        if self.trace_memory:
+            if self.peaks:
+                self.peaks[-1] = max(self.peaks[-1], tracemalloc.get_traced_memory()[1])
+            self.peaks.append(0)
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats.seconds += time.perf_counter() - started
+            stats.calls += 1
+            stats.rows += rows
+            stats.queries += self.queries - queries
+            if self.trace_memory:
+                peak = max(self.peaks.pop(), tracemalloc.get_traced_memory()[1])
+                stats.peak_memory = max(stats.peak_memory or 0, peak)
+                # The enclosing stage includes the peak of this one
+                if self.peaks:
+                    self.peaks[-1] = max(self.peaks[-1], peak)
+
+    def merge(self, other: "ImportProfile"):
+        with self.lock:
+            self.queries += other.queries
+            for stats in other.stages.values():
+                merged = self.get_stage(stats.name)
+                merged.seconds += stats.seconds
+                merged.calls += stats.calls
+                merged.rows += stats.rows
+                merged.queries += stats.queries
+                if stats.peak_memory is not None:
+                    merged.peak_memory = max(merged.peak_memory or 0, stats.peak_memory)
+
+    def summary(self) -> list[dict]:
+        return [dataclasses.asdict(stats) for stats in self.stages.values()]
+
+    def log(self, label: str):
+        for stats in self.stages.values():
+            logger.info(
+                f"import_stage label={label} stage={stats.name} seconds={stats.seconds:.3f} "
+                f"calls={stats.calls} rows={stats.rows} queries={stats.queries} "
+                f"peak_memory={stats.peak_memory}"
+            )
+
+
+@contextlib.contextmanager
+def profile(import_profile: ImportProfile | None = None, trace_memory: bool = False):
+    # An existing profile can be passed to collect the stages of several
+    # threads. The current thread counts the queries of its own connection
+    # into a profile of its own, which is merged into the shared one.
+    shared_profile = import_profile
+    import_profile = ImportProfile(
+        trace_memory if shared_profile is None else shared_profile.trace_memory
+    )
+    started_tracing = import_profile.trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    token = _profile.set(import_profile)
+    try:
+        with connection.execute_wrapper(import_profile.count_query):
+            yield import_profile if shared_profile is None else shared_profile
+    finally:
+        _profile.reset(token)
+        if started_tracing:
+            tracemalloc.stop()
+        if shared_profile is not None:
+            shared_profile.merge(import_profile)
+
+
+def get_profile() -> ImportProfile | None:
+    return _profile.get()
+
+
+def stage(name: str, rows: int = 0):
+    import_profile = _profile.get()
+    if import_profile is None:
+        return NO_STAGE
+    return import_profile.stage(name, rows)
+
+
+def add_rows(name: str, rows: int):
+    import_profile = _profile.get()
+    if import_profile is not None:
+        import_profile.get_stage(name).rows += rows
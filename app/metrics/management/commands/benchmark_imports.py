@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from metrics import benchmarks
+import json
+import tempfile
+
+
+class Command(BaseCommand):
+    help = "Measures the import throughput of generated test data in a scratch database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=str,
+            default="1000,100000,1000000",
+            help="Comma separated numbers of rows to generate per data type",
+        )
+        parser.add_argument(
+            "--targetdir",
+            type=str,
+            help="Directory for the generated CSV files, a temporary one by default",
+        )
+        parser.add_argument(
+            "--output",
+            type=str,
+            help="Path of the JSON report, printed when not given",
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        if options["targetdir"]:
+            results = benchmarks.run_benchmarks(sizes, options["targetdir"])
+        else:
+            with tempfile.TemporaryDirectory() as target_dir:
+                results = benchmarks.run_benchmarks(sizes, target_dir)
+
+        for result in results:
+            self.stderr.write(
+                f"{result.name}: {result.rows_per_second:.0f} rows/s, "
+                f"{result.queries_per_row:.2f} queries/row, "
+                f"{result.peak_rss_kb} kB peak RSS"
+            )
+        report = json.dumps([result.as_dict() for result in results], indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(report)
+        else:
+            self.stdout.write(report)
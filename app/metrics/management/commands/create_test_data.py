@@ -1,10 +1,163 @@
 from django.core.management.base import BaseCommand
 from uuid import uuid4
-from metrics import import_utils, models
+from metrics import data_generator, import_utils, models
 import csv
+import json
 import random
 
 
+INSTITUTIONS = [
+    "https://ror.org/0576by029",
+    "https://ror.org/05g3p2p60",
+    "https://ror.org/0576by029",
+    "https://ror.org/05g3p2p60",
+    "https://ror.org/03xrhmk39",
+    "https://ror.org/02hpadn98",
+    "https://ror.org/01h1jbk91",
+    "https://ror.org/03bndpq63",
+    "https://ror.org/045f7pv37",
+    "https://ror.org/03mstc592",
+    "https://ror.org/02catss52",
+    "https://ror.org/04wfr2810",
+    "https://ror.org/03mstc592",
+    "https://ror.org/045f7pv37",
+    "https://ror.org/02nv7yv05",
+    "https://ror.org/052rphn09",
+    "https://ror.org/045f7pv37",
+    "https://ror.org/03bndpq63",
+    "https://ror.org/045f7pv37",
+    "https://ror.org/03bndpq63",
+    "https://ror.org/00enajs79",
+    "https://ror.org/033m02g29",
+    "https://ror.org/002n09z45",
+    "https://ror.org/05f0yaq80",
+    "https://ror.org/01fapfv42",
+    "https://ror.org/02495e989",
+    "https://ror.org/05kb8h459",
+    "https://ror.org/048a87296",
+    "https://ror.org/008x57b05",
+    "https://ror.org/027m9bs27",
+    "https://ror.org/03z77qz90",
+    "https://ror.org/048a87296",
+    "https://ror.org/03xrhmk39",
+]
+
+
+EVENT_MAPPING = {
+    "Event type": "type",
+    "Funding": "funding",
+    "Target audience": "target_audience",
+    "Additional ELIXIR Platforms involved": "additional_platforms",
+    "ELIXIR Communities involved": "communities",
+    "No. of participants": "number_participants",
+    "No. of trainers/ facilitators": "number_trainers",
+    "Url to event page/ agenda": "url",
+}
+
+
+DEMOGRAPHIC_MAPPING = {
+    "Where did you see the course advertised?": "heard_from",
+    "What is your career stage?": "career_stage",
+    "What is your employment sector?": "employment_sector",
+    "What is your country of employment?": "employment_country",
+    "What is your gender?": "gender",
+}
+
+
+QUALITY_MAPPING = {
+    "Have you used the tool(s)/resource(s) covered in the course before?": "used_resources_before",
+    "Will you use the tool(s)/resource(s) covered in the course again?": "used_resources_future",
+    "Would you recommend the course?": "recommend_course",
+    "Please tell us your overall rating for the entire course": "course_rating",
+    "May we contact you by email in the future for more feedback?": "email_contact",
+    "The balance of theoretical and practical content was": "balance",
+}
+
+
+IMPACT_MAPPING = {
+    "Which training event did you take part in?": None,
+    "How long ago did you attend the training?": "when_attend_training",
+    "What was your main reason for attending the training?": "main_attend_reason",
+    "What was your main reason for attending the training? (Other)": None,
+    "How often did you use the tool(s)/ resource(s), covered in the training, BEFORE attending the training?": "how_often_use_before",
+    "How often do you use the tool(s)/ resource(s), covered in the training, AFTER having attended the training?": "how_often_use_after",
+    "Do you feel that you are able to explain to others what you learnt in the training?": "able_to_explain",
+    "Do you feel that you are able to explain to others what you learnt in the training? (Other)": None,
+    "Are you now able to use the tool(s)/ resource(s) covered in the training:": "able_use_now",
+    "Are you now able to use the tool(s)/ resource(s) covered in the training: (Other)": None,
+    "How did the training event help with your work? [select all that apply]": "help_work",
+    "How did the training event help with your work? (Other)": None,
+    "Attending the training event led to/ facilitated: [select all that apply]": "attending_led_to",
+    "Attending the training event led to/ facilitated: (Other)": None,
+    "Please elaborate on any impact": None,
+    "How many people have you shared the skills and/or knowledge that you learned during the training, with?": "people_share_knowledge",
+    "Would you recommend the training to others?": "recommend_others",
+    "Any other comments?": None,
+}
+
+
+EVENT_FIELDNAMES = [
+    "Title",
+    "ELIXIR Node",
+    "Start Date",
+    "End Date",
+    "Event type",
+    "Funding",
+    "Organising Institution/s",
+    "Location (city, country)",
+    "EXCELERATE WP",
+    "Target audience",
+    "Additional ELIXIR Platforms involved",
+    "ELIXIR Communities involved",
+    "No. of participants",
+    "No. of trainers/ facilitators",
+    "Url to event page/ agenda"
+]
+
+
+DEMOGRAPHIC_QUALITY_FIELDNAMES = [
+    "event_code",
+    "Where did you see the course advertised?",
+    "What is your career stage?",
+    "What is your employment sector?",
+    "What is your country of employment?",
+    "What is your gender?",
+    "Have you used the tool(s)/resource(s) covered in the course before?",
+    "Will you use the tool(s)/resource(s) covered in the course again?",
+    "Would you recommend the course?",
+    "Please tell us your overall rating for the entire course",
+    "May we contact you by email in the future for more feedback?",
+    "What part of the training did you enjoy the most?",
+    "What part of the training did you enjoy the least?",
+    "The balance of theoretical and practical content was",
+    "What other topics would you like to see covered in the future?",
+    "Any other comments?",
+]
+
+
+IMPACT_FIELDNAMES = [
+    "event_code",
+    "Which training event did you take part in?",
+    "How long ago did you attend the training?",
+    "What was your main reason for attending the training?",
+    "What was your main reason for attending the training? (Other)",
+    "How often did you use the tool(s)/ resource(s), covered in the training, BEFORE attending the training?",
+    "How often do you use the tool(s)/ resource(s), covered in the training, AFTER having attended the training?",
+    "Do you feel that you are able to explain to others what you learnt in the training?",
+    "Do you feel that you are able to explain to others what you learnt in the training? (Other)",
+    "Are you now able to use the tool(s)/ resource(s) covered in the training:",
+    "Are you now able to use the tool(s)/ resource(s) covered in the training: (Other)",
+    "How did the training event help with your work? [select all that apply]",
+    "How did the training event help with your work? (Other)",
+    "Attending the training event led to/ facilitated: [select all that apply]",
+    "Attending the training event led to/ facilitated: (Other)",
+    "Please elaborate on any impact",
+    "How many people have you shared the skills and/or knowledge that you learned during the training, with?",
+    "Would you recommend the training to others?",
+    "Any other comments?",
+]
+
+
 class Command(BaseCommand):
     help = 'Create test data for upload'
 
@@ -33,12 +186,52 @@ class Command(BaseCommand):
             required=False,
             default="1,2,3"
         )
+        parser.add_argument(
+            "--vectorized",
+            action="store_true",
+            help="Sample whole columns with NumPy and write them in chunks, for large amounts of data",
+        )
+        parser.add_argument(
+            "--answersperevent",
+            type=float,
+            default=1,
+            help="Mean number of metrics rows per event code, vectorized only",
+        )
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=0,
+            help="Zipf exponent of the choice distributions, 0 samples uniformly, vectorized only",
+        )
+        parser.add_argument(
+            "--distributions",
+            type=str,
+            help="JSON file of choice weights by field id, e.g. {\"gender\": {\"Female\": 2, \"Male\": 1}}, vectorized only",
+        )
+        parser.add_argument(
+            "--chunksize",
+            type=int,
+            default=data_generator.DEFAULT_CHUNK_SIZE,
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+        )
 
     def handle(self, *args, **options):
         target_dir = options["targetdir"]
         events = options["events"]
         context_id = options["contextid"]
         event_codes = options["eventcodes"].split(",")
+        if options["vectorized"]:
+            return self.handle_vectorized(target_dir, events, context_id, event_codes, options)
+
         generators = [
             (f"events-{context_id}.csv", self.create_event_data, (events,)),
             (f"demographic_quality-{context_id}.csv", self.create_demographic_quality_metrics, (event_codes,)),
@@ -49,51 +242,105 @@ class Command(BaseCommand):
             fieldnames, test_data = generator(*params)
             with open(f"{target_dir}/{file_name}", "w") as f:
                 writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writerow({
-                    fieldname: fieldname
-                    for fieldname in fieldnames
-                })
-                for row in test_data:
-                    writer.writerow(row)
-    
-    def get_institutions(self):
-        institutions = [
-            "https://ror.org/0576by029",
-            "https://ror.org/05g3p2p60",
-            "https://ror.org/0576by029",
-            "https://ror.org/05g3p2p60",
-            "https://ror.org/03xrhmk39",
-            "https://ror.org/02hpadn98",
-            "https://ror.org/01h1jbk91",
-            "https://ror.org/03bndpq63",
-            "https://ror.org/045f7pv37",
-            "https://ror.org/03mstc592",
-            "https://ror.org/02catss52",
-            "https://ror.org/04wfr2810",
-            "https://ror.org/03mstc592",
-            "https://ror.org/045f7pv37",
-            "https://ror.org/02nv7yv05",
-            "https://ror.org/052rphn09",
-            "https://ror.org/045f7pv37",
-            "https://ror.org/03bndpq63",
-            "https://ror.org/045f7pv37",
-            "https://ror.org/03bndpq63",
-            "https://ror.org/00enajs79",
-            "https://ror.org/033m02g29",
-            "https://ror.org/002n09z45",
-            "https://ror.org/05f0yaq80",
-            "https://ror.org/01fapfv42",
-            "https://ror.org/02495e989",
-            "https://ror.org/05kb8h459",
-            "https://ror.org/048a87296",
-            "https://ror.org/008x57b05",
-            "https://ror.org/027m9bs27",
-            "https://ror.org/03z77qz90",
-            "https://ror.org/048a87296",
-            "https://ror.org/03xrhmk39",
+                writer.writeheader()
+                writer.writerows(test_data)
+
+    def handle_vectorized(self, target_dir, events, context_id, event_codes, options):
+        distributions = {}
+        if options["distributions"]:
+            with open(options["distributions"]) as f:
+                distributions = json.load(f)
+        self.skew = options["skew"]
+        self.distributions = distributions
+
+        answer_counts = data_generator.get_answer_counts(len(event_codes), options["answersperevent"], options["seed"])
+        answers = int(answer_counts.sum())
+        event_code_column = data_generator.Repeated(event_codes, answer_counts)
+        tables = [
+            (
+                f"events-{context_id}.csv",
+                self.get_event_columns(context_id),
+                events,
+            ),
+            (
+                f"demographic_quality-{context_id}.csv",
+                self.get_columns(
+                    DEMOGRAPHIC_QUALITY_FIELDNAMES,
+                    [(models.Demographic, DEMOGRAPHIC_MAPPING), (models.Quality, QUALITY_MAPPING)],
+                    {"event_code": event_code_column},
+                ),
+                answers,
+            ),
+            (
+                f"impact-{context_id}.csv",
+                self.get_columns(
+                    IMPACT_FIELDNAMES,
+                    [(models.Impact, IMPACT_MAPPING)],
+                    {"event_code": event_code_column},
+                ),
+                answers,
+            ),
         ]
+        for (file_name, columns, rows) in tables:
+            data_generator.write_csv(
+                f"{target_dir}/{file_name}",
+                columns,
+                rows,
+                seed=options["seed"],
+                chunk_size=options["chunksize"],
+                processes=options["processes"],
+            )
+            self.stdout.write(f"Wrote {rows} rows to {file_name}")
+
+    def get_sampler(self, model, field_id):
+        info = import_utils.get_field_info(model, field_id)
+        if info["values"] is None:
+            return None
+        weights = data_generator.get_weights(info["values"], self.skew, self.distributions.get(field_id))
+        if info["multichoice"]:
+            return data_generator.Subset(info["values"], weights)
+        return data_generator.Choice(info["values"], weights)
+
+    def get_columns(self, fieldnames, mappings, columns):
+        samplers = {
+            alias: self.get_sampler(model, field_id)
+            for (model, mapping) in mappings
+            for (alias, field_id) in mapping.items()
+            if field_id is not None
+        }
+        return {
+            fieldname: (
+                columns.get(fieldname)
+                or samplers.get(fieldname)
+                or data_generator.Constant("")
+            )
+            for fieldname in fieldnames
+        }
+
+    def get_event_columns(self, context_id):
+        institution_weights = data_generator.get_weights(
+            INSTITUTIONS,
+            self.skew,
+            self.distributions.get("organising_institution"),
+        )
+        return self.get_columns(
+            EVENT_FIELDNAMES,
+            [(models.Event, EVENT_MAPPING)],
+            {
+                "Title": data_generator.Numbered(f"A cool event {context_id}-"),
+                "ELIXIR Node": data_generator.Constant(self.get_node()),
+                "Start Date": data_generator.Constant(self.get_start_date()),
+                "End Date": data_generator.Constant(self.get_end_date()),
+                "Organising Institution/s": data_generator.Subset(INSTITUTIONS, institution_weights, 3, ","),
+                "Location (city, country)": data_generator.Constant(self.get_location()),
+                "No. of participants": data_generator.Poisson(25),
+                "No. of trainers/ facilitators": data_generator.Poisson(4),
+                "Url to event page/ agenda": data_generator.Constant(self.get_url()),
+            },
+        )
 
-        return ",".join(random.choices(institutions, k=random.randint(1,3)))
+    def get_institutions(self):
+        return ",".join(random.choices(INSTITUTIONS, k=random.randint(1,3)))
 
     def get_location(self):
         return "Neverland, Queenstown"
@@ -114,21 +361,11 @@ class Command(BaseCommand):
         return "https://neverland.local"
 
     def create_event_data(self, count):
-        event_mapping = {
-            "Event type": "type",
-            "Funding": "funding",
-            "Target audience": "target_audience",
-            "Additional ELIXIR Platforms involved": "additional_platforms",
-            "ELIXIR Communities involved": "communities",
-            "No. of participants": "number_participants",
-            "No. of trainers/ facilitators": "number_trainers",
-            "Url to event page/ agenda": "url",
-        }
         test_data = import_utils.get_test_data_from_model(
             models.Event,
             [
                 (field_id, alias)
-                for (alias, field_id) in event_mapping.items()
+                for (alias, field_id) in EVENT_MAPPING.items()
             ],
             count
         )
@@ -146,49 +383,18 @@ class Command(BaseCommand):
             }
         )
         return (
-            [
-                "Title",
-                "ELIXIR Node",
-                "Start Date",
-                "End Date",
-                "Event type",
-                "Funding",
-                "Organising Institution/s",
-                "Location (city, country)",
-                "EXCELERATE WP",
-                "Target audience",
-                "Additional ELIXIR Platforms involved",
-                "ELIXIR Communities involved",
-                "No. of participants",
-                "No. of trainers/ facilitators",
-                "Url to event page/ agenda"
-            ],
+            EVENT_FIELDNAMES,
             test_data
         )
 
     def create_demographic_quality_metrics(self, event_codes):
         count = len(event_codes)
-        demographic_mapping = {
-            "Where did you see the course advertised?": "heard_from",
-            "What is your career stage?": "career_stage",
-            "What is your employment sector?": "employment_sector",
-            "What is your country of employment?": "employment_country",
-            "What is your gender?": "gender",
-        }
-        quality_mapping = {
-            "Have you used the tool(s)/resource(s) covered in the course before?": "used_resources_before",
-            "Will you use the tool(s)/resource(s) covered in the course again?": "used_resources_future",
-            "Would you recommend the course?": "recommend_course",
-            "Please tell us your overall rating for the entire course": "course_rating",
-            "May we contact you by email in the future for more feedback?": "email_contact",
-            "The balance of theoretical and practical content was": "balance",
-        }
 
         demographic_data = import_utils.get_test_data_from_model(
             models.Demographic,
             [
                 (field_id, alias)
-                for (alias, field_id) in demographic_mapping.items()
+                for (alias, field_id) in DEMOGRAPHIC_MAPPING.items()
             ],
             count
         )
@@ -196,7 +402,7 @@ class Command(BaseCommand):
             models.Quality,
             [
                 (field_id, alias)
-                for (alias, field_id) in quality_mapping.items()
+                for (alias, field_id) in QUALITY_MAPPING.items()
             ],
             count
         )
@@ -219,54 +425,17 @@ class Command(BaseCommand):
             }
         )
         return (
-            [
-                "event_code",
-                "Where did you see the course advertised?",
-                "What is your career stage?",
-                "What is your employment sector?",
-                "What is your country of employment?",
-                "What is your gender?",
-                "Have you used the tool(s)/resource(s) covered in the course before?",
-                "Will you use the tool(s)/resource(s) covered in the course again?",
-                "Would you recommend the course?",
-                "Please tell us your overall rating for the entire course",
-                "May we contact you by email in the future for more feedback?",
-                "What part of the training did you enjoy the most?",
-                "What part of the training did you enjoy the least?",
-                "The balance of theoretical and practical content was",
-                "What other topics would you like to see covered in the future?",
-                "Any other comments?",
-            ],
+            DEMOGRAPHIC_QUALITY_FIELDNAMES,
             test_data
         )
 
     def create_impact_metrics(self, event_codes):
         count = len(event_codes)
-        impact_mapping = {
-            "Which training event did you take part in?": None,
-            "How long ago did you attend the training?": "when_attend_training",
-            "What was your main reason for attending the training?": "main_attend_reason",
-            "What was your main reason for attending the training? (Other)": None,
-            "How often did you use the tool(s)/ resource(s), covered in the training, BEFORE attending the training?": "how_often_use_before",
-            "How often do you use the tool(s)/ resource(s), covered in the training, AFTER having attended the training?": "how_often_use_after",
-            "Do you feel that you are able to explain to others what you learnt in the training?": "able_to_explain",
-            "Do you feel that you are able to explain to others what you learnt in the training? (Other)": None,
-            "Are you now able to use the tool(s)/ resource(s) covered in the training:": "able_use_now",
-            "Are you now able to use the tool(s)/ resource(s) covered in the training: (Other)": None,
-            "How did the training event help with your work? [select all that apply]": "help_work",
-            "How did the training event help with your work? (Other)": None,
-            "Attending the training event led to/ facilitated: [select all that apply]": "attending_led_to",
-            "Attending the training event led to/ facilitated: (Other)": None,
-            "Please elaborate on any impact": None,
-            "How many people have you shared the skills and/or knowledge that you learned during the training, with?": "people_share_knowledge",
-            "Would you recommend the training to others?": "recommend_others",
-            "Any other comments?": None,
-        }
         test_data = import_utils.get_test_data_from_model(
             models.Impact,
             [
                 (field_id, alias)
-                for (alias, field_id) in impact_mapping.items()
+                for (alias, field_id) in IMPACT_MAPPING.items()
                 if field_id is not None
             ],
             count
@@ -277,33 +446,13 @@ class Command(BaseCommand):
             {
                 **{
                     alias: None
-                    for (alias, field_id) in impact_mapping.items()
+                    for (alias, field_id) in IMPACT_MAPPING.items()
                     if field_id is None
                 },
                 "event_code": lambda: next(event_code_iterator),
             }
         )
         return (
-            [
-                "event_code",
-                "Which training event did you take part in?",
-                "How long ago did you attend the training?",
-                "What was your main reason for attending the training?",
-                "What was your main reason for attending the training? (Other)",
-                "How often did you use the tool(s)/ resource(s), covered in the training, BEFORE attending the training?",
-                "How often do you use the tool(s)/ resource(s), covered in the training, AFTER having attended the training?",
-                "Do you feel that you are able to explain to others what you learnt in the training?",
-                "Do you feel that you are able to explain to others what you learnt in the training? (Other)",
-                "Are you now able to use the tool(s)/ resource(s) covered in the training:",
-                "Are you now able to use the tool(s)/ resource(s) covered in the training: (Other)",
-                "How did the training event help with your work? [select all that apply]",
-                "How did the training event help with your work? (Other)",
-                "Attending the training event led to/ facilitated: [select all that apply]",
-                "Attending the training event led to/ facilitated: (Other)",
-                "Please elaborate on any impact",
-                "How many people have you shared the skills and/or knowledge that you learned during the training, with?",
-                "Would you recommend the training to others?",
-                "Any other comments?",
-            ],
+            IMPACT_FIELDNAMES,
             test_data
         )
@@ -1,37 +1,54 @@
-import csv
+import contextlib
+import os
 from metrics.models import Event, Demographic, Quality, Impact, Node, OrganisingInstitution, User
-from metrics import import_utils
-from django.core.management.base import BaseCommand
+from metrics import change_stamps, copy_loader, import_utils, instrumentation, parallel_loader, upsert_loader
+from django.core.management.base import BaseCommand, CommandError
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
+# Newline delimited JSON files are read when there is no CSV file
+DATA_SUFFIXES = [".csv", ".ndjson", ".ndjson.gz", ".ndjson.zst"]
+
+
 def get_data_sources(targetdir="example-data"):
     return {
-        Event:  f'raw-tmd-data/{targetdir}/tango_events.csv',
-        Demographic: f'raw-tmd-data/{targetdir}/tango_demographics.csv',
-        Quality: f'raw-tmd-data/{targetdir}/tango_qualities.csv',
-        Impact: f'raw-tmd-data/{targetdir}/tango_impacts.csv',
-        User: f'raw-tmd-data/{targetdir}/users.csv',
-        OrganisingInstitution: f'raw-tmd-data/{targetdir}/institutions.csv',
-        Node: f'raw-tmd-data/{targetdir}/nodes.csv'
+        Event: find_data_file(f'raw-tmd-data/{targetdir}/tango_events'),
+        Demographic: find_data_file(f'raw-tmd-data/{targetdir}/tango_demographics'),
+        Quality: find_data_file(f'raw-tmd-data/{targetdir}/tango_qualities'),
+        Impact: find_data_file(f'raw-tmd-data/{targetdir}/tango_impacts'),
+        User: find_data_file(f'raw-tmd-data/{targetdir}/users'),
+        OrganisingInstitution: find_data_file(f'raw-tmd-data/{targetdir}/institutions'),
+        Node: find_data_file(f'raw-tmd-data/{targetdir}/nodes')
     }
 
 
+def find_data_file(path):
+    for suffix in DATA_SUFFIXES:
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return path + DATA_SUFFIXES[0]
+
+
 DATA_SOURCES = get_data_sources()
+BATCH_SIZE = None
+# Codes of the events whose metrics are loaded, all when None
+UPSERTED_EVENTS = None
+# Import stages are recorded when profiling is enabled
+PROFILE = None
 import_context = import_utils.ImportContext()
 
 
-def are_headers_in_model(csv_file_path, model):
-    with open(csv_file_path, newline='') as csvfile:
-        reader = csv.DictReader(csvfile, delimiter=',')
+def are_headers_in_model(path, model):
+    with import_utils.open_rows(path) as reader:
         model_attributes = sorted(
             [
                 field.name
                 for field in model._meta.fields + model._meta.many_to_many
-                if field.name not in {"locked"}
+                if field.name not in {"locked", "content_hash", "fingerprint", "legacy_id"}
             ]
         )
-        headers = sorted(reader.fieldnames)
+        # The legacy ids of metrics rows are optional
+        headers = sorted(name for name in reader.fieldnames if name != "legacy_id")
         uncommon_headers = set(
             model_attributes).symmetric_difference(set(headers))
         if len(uncommon_headers) > 1:
@@ -39,65 +56,174 @@ def are_headers_in_model(csv_file_path, model):
         return len(uncommon_headers) == 1
 
 
+def has_legacy_ids(path):
+    with import_utils.open_rows(path) as reader:
+        return "legacy_id" in reader.fieldnames
+
+
 def load_events():
-    with open(DATA_SOURCES[Event], newline='') as csvfile:
-        reader = csv.DictReader(csvfile, delimiter=',')
-        for row in reader:
-            import_context.event_from_dict(row)
+    with import_utils.open_rows(DATA_SOURCES[Event]) as reader:
+        import_context.events_from_dicts(reader)
 
 
 def load_demographics():
-    with open(DATA_SOURCES[Demographic], newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if not is_empty(row):
-                import_context.demographic_from_dict(row)
+    with import_utils.open_rows(DATA_SOURCES[Demographic]) as reader:
+        importer = import_utils.BatchImporter(
+            import_context.build_demographic,
+            BATCH_SIZE,
+            preload=import_context.preload,
+        )
+        importer.import_rows(get_metrics_rows(reader))
 
 
 def load_qualities():
-    with open(DATA_SOURCES[Quality], newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if not is_empty(row):
-                import_context.quality_from_dict(row)
+    with import_utils.open_rows(DATA_SOURCES[Quality]) as reader:
+        importer = import_utils.BatchImporter(
+            import_context.build_quality,
+            BATCH_SIZE,
+            preload=import_context.preload,
+        )
+        importer.import_rows(get_metrics_rows(reader))
 
 
 def load_impacts():
-    with open(DATA_SOURCES[Impact], newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if not is_empty(row):
-                import_context.impact_from_dict(row)
-
-
-def load_user():
-    with open(DATA_SOURCES[User]) as csvfile:
-        reader = csv.DictReader(csvfile)
+    with import_utils.open_rows(DATA_SOURCES[Impact]) as reader:
+        importer = import_utils.BatchImporter(
+            import_context.build_impact,
+            BATCH_SIZE,
+            preload=import_context.preload,
+        )
+        importer.import_rows(get_metrics_rows(reader))
+
+
+def load_events_upsert(delta=False):
+    # Deltas only contain changed metrics rows, which update the metrics of
+    # the events by their legacy ids instead of replacing them.
+    metrics_hashes = {} if delta else upsert_loader.get_metrics_hashes(
+        {model: DATA_SOURCES[model] for model in [Demographic, Quality, Impact]},
+        skip_row=is_empty,
+    )
+    upserter = upsert_loader.EventUpserter(
+        import_context,
+        metrics_hashes,
+        BATCH_SIZE,
+        replace_metrics=not delta,
+    )
+    with import_utils.open_rows(DATA_SOURCES[Event]) as reader:
+        report = upserter.upsert(reader)
+    print(f"Events: {report.inserted} inserted, {report.updated} updated, {report.unchanged} unchanged")
+    for error in report.errors:
+        print(f"An error occurred: {error}")
+    return upserter
+
+
+def load_metrics_fast():
+    # Metrics are copied into staging tables and inserted with set-based
+    # joins instead of going through the ORM.
+    context = copy_loader.CopyImportContext()
+    for (model, build) in [
+        (Demographic, context.build_demographic),
+        (Quality, context.build_quality),
+        (Impact, context.build_impact),
+    ]:
+        with import_utils.open_rows(DATA_SOURCES[model]) as reader:
+            loader = copy_loader.CopyLoader(model, build, context)
+            inserted = loader.load(get_metrics_rows(reader))
+            print(f"Copied {inserted} {model.__name__} rows")
+
+
+def load_metrics_parallel(processes):
+    reports = parallel_loader.load_parallel(
+        {model: DATA_SOURCES[model] for model in [Demographic, Quality, Impact]},
+        processes,
+        BATCH_SIZE,
+        skip_row=is_empty,
+    )
+    for (model, report) in reports.items():
+        print(f"Loaded {report.rows} {model.__name__} rows ({report.rows_per_second:.0f} rows/s)")
+        for error in report.errors:
+            print(f"An error occurred: {error}")
+    total_rows = sum(report.rows for report in reports.values())
+    seconds = max(report.seconds for report in reports.values())
+    print(f"Loaded {total_rows} metrics rows in {seconds:.1f}s ({total_rows / seconds if seconds else 0:.0f} rows/s)")
+
+
+def load_user(skip_existing=False):
+    existing = (
+        set(User.objects.values_list("username", flat=True))
+        if skip_existing
+        else set()
+    )
+    with import_utils.open_rows(DATA_SOURCES[User]) as reader:
         for row in reader:
+            if row['NodeAccount'] in existing:
+                continue
             User.objects.create_user(
                 username=row['NodeAccount'],
                 password=row['Password']
             )
 
 
-def load_nodes():
-    with open(DATA_SOURCES[Node]) as csvfile:
-        reader = csv.DictReader(csvfile)
+def load_nodes(skip_existing=False):
+    existing = (
+        set(Node.objects.values_list("name", flat=True))
+        if skip_existing
+        else set()
+    )
+    with import_utils.open_rows(DATA_SOURCES[Node]) as reader:
         for row in reader:
+            if row['name'] in existing:
+                continue
             Node.objects.create(
                 name=row['name'],
             )
 
 
-def load_institutions():
-    with open(DATA_SOURCES[OrganisingInstitution]) as csvfile:
-        reader = csv.DictReader(csvfile)
+def load_institutions(skip_existing=False):
+    existing = (
+        set(OrganisingInstitution.objects.values_list("name", flat=True))
+        if skip_existing
+        else set()
+    )
+    with import_utils.open_rows(DATA_SOURCES[OrganisingInstitution]) as reader:
         for row in reader:
+            if row['name'] in existing:
+                continue
             OrganisingInstitution.objects.create(
                 name=row['name'],
             )
 
 
+def run_batched(func):
+    with change_stamps.batch_changes(), profiled():
+        func()
+
+
+def profiled():
+    # Every thread counts the queries of its own connection into the profile
+    if PROFILE is None:
+        return contextlib.nullcontext()
+    return instrumentation.profile(PROFILE)
+
+
+def print_profile(import_profile):
+    print("IMPORT STAGES")
+    print("------------------------")
+    for stats in import_profile.stages.values():
+        peak_memory = f", {stats.peak_memory / 2**20:.1f} MiB peak" if stats.peak_memory is not None else ""
+        print(f"{stats.name}: {stats.seconds:.2f}s, {stats.rows} rows, {stats.queries} queries{peak_memory}")
+    import_profile.log("load_data")
+
+
+def get_metrics_rows(reader):
+    return (
+        row
+        for row in reader
+        if not is_empty(row)
+        and (UPSERTED_EVENTS is None or row["event"] in UPSERTED_EVENTS)
+    )
+
+
 def is_empty(items):
     for key, value in items.items():
         if (
@@ -109,7 +235,7 @@ def is_empty(items):
 
 
 class Command(BaseCommand):
-    help = 'Load data from CSV files into the database.'
+    help = 'Load data from CSV or newline delimited JSON files into the database.'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -124,6 +250,50 @@ class Command(BaseCommand):
             required=False,
         )
 
+        parser.add_argument(
+            "--batchsize",
+            type=int,
+            required=False,
+            help="Number of metrics rows inserted per bulk insert",
+        )
+
+        parser.add_argument(
+            "--fast",
+            action="store_true",
+            help="Load metrics with COPY into staging tables instead of the ORM",
+        )
+
+        parser.add_argument(
+            "--processes",
+            type=int,
+            required=False,
+            help="Load metrics in this many processes, the answers of each file are split by event",
+        )
+
+        parser.add_argument(
+            "--upsert",
+            action="store_true",
+            help="Insert or update events by code and only reload the metrics of changed events",
+        )
+
+        parser.add_argument(
+            "--delta",
+            action="store_true",
+            help="Apply a delta export of changed rows: upsert events by code and metrics by legacy id",
+        )
+
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="Report time, rows and queries per import stage",
+        )
+
+        parser.add_argument(
+            "--profilememory",
+            action="store_true",
+            help="Also trace memory peaks per import stage with tracemalloc, implies --profile and loads the metrics serially",
+        )
+
     def handle(self, *args, **options):
         if options["resetdata"]:
             all_models = [
@@ -138,41 +308,94 @@ class Command(BaseCommand):
             for model in all_models:
                 model.objects.all().delete()
 
-        global DATA_SOURCES
+        if options["fast"] and options["processes"]:
+            raise CommandError("--fast and --processes can not be combined")
+        if options["upsert"] and (options["fast"] or options["processes"] or options["resetdata"]):
+            raise CommandError("--upsert can not be combined with --fast, --processes or --resetdata")
+        if options["delta"] and (options["upsert"] or options["fast"] or options["processes"] or options["resetdata"]):
+            raise CommandError("--delta can not be combined with --upsert, --fast, --processes or --resetdata")
+        if options["delta"] and not options["targetdir"]:
+            raise CommandError("--delta needs the --targetdir of the delta")
+        incremental = options["upsert"] or options["delta"]
+
+        global DATA_SOURCES, BATCH_SIZE, UPSERTED_EVENTS, PROFILE
+        UPSERTED_EVENTS = None
+        upserter = None
+        PROFILE = (
+            instrumentation.ImportProfile(trace_memory=options["profilememory"])
+            if options["profile"] or options["profilememory"]
+            else None
+        )
         if options["targetdir"]:
             DATA_SOURCES = get_data_sources(options["targetdir"])
+        BATCH_SIZE = options["batchsize"]
 
-        for model, csv_file_path in DATA_SOURCES.items():
+        for model, path in DATA_SOURCES.items():
             if model == User:
                 continue
-            if not are_headers_in_model(csv_file_path, model):
+            if not are_headers_in_model(path, model):
                 raise Exception(
-                    f'Some headers are not present for model {model.__name__} in {csv_file_path}')
-
-        print("LOADING NODES")
-        print("------------------------")
-        load_nodes()
-        print("LOADING INSTITUTIONS")
-        print("------------------------")
-        load_institutions()
-        print("LOADING USERS")
-        print("------------------------")
-        load_user()
-        print("LOADING EVENTS")
-        print("------------------------")
-        load_events()
+                    f'Some headers are not present for model {model.__name__} in {path}')
+        # Delta rows update the metrics loaded before by their legacy ids,
+        # so that rows exported again are not added twice
+        if options["delta"] and not all(
+            has_legacy_ids(DATA_SOURCES[model])
+            for model in [Demographic, Quality, Impact]
+        ):
+            raise CommandError("--delta needs a legacy_id column in the metrics files")
+
+        with change_stamps.batch_changes(), profiled():
+            print("LOADING NODES")
+            print("------------------------")
+            load_nodes(skip_existing=incremental)
+            print("LOADING INSTITUTIONS")
+            print("------------------------")
+            load_institutions(skip_existing=incremental)
+            print("LOADING USERS")
+            print("------------------------")
+            load_user(skip_existing=incremental)
+            print("LOADING EVENTS")
+            print("------------------------")
+            if options["upsert"]:
+                upserter = load_events_upsert()
+                UPSERTED_EVENTS = upserter.changed_codes
+            elif options["delta"]:
+                upserter = load_events_upsert(delta=True)
+            else:
+                load_events()
         print("LOADING METRICS")
         print("------------------------")
 
-        num_workers = 3
-        with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            functions_to_execute = [
-                load_demographics, load_qualities, load_impacts]
-
-            futures = [executor.submit(func) for func in functions_to_execute]
-
-            for future in as_completed(futures):
-                try:
-                    future.result()
-                except Exception as e:
-                    print(f"An error occurred: {e}")
+        if options["fast"]:
+            load_metrics_fast()
+        elif options["processes"]:
+            load_metrics_parallel(options["processes"])
+        else:
+            # Memory peaks are process wide, the metrics are loaded one
+            # after the other to attribute them to their stages
+            num_workers = 1 if options["profilememory"] else 3
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                functions_to_execute = [
+                    load_demographics, load_qualities, load_impacts]
+
+                futures = [executor.submit(run_batched, func) for func in functions_to_execute]
+
+                metrics_failed = False
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        metrics_failed = True
+                        print(f"An error occurred: {e}")
+
+            # The changed events are upserted again by the next run unless
+            # their metrics were loaded
+            if upserter is not None:
+                if metrics_failed:
+                    print("Metrics failed to load, the changed events are reloaded by the next run")
+                else:
+                    upserter.save_content_hashes()
+
+        change_stamps.refresh(*change_stamps.STAMPED_MODELS)
+        if PROFILE is not None:
+            print_profile(PROFILE)
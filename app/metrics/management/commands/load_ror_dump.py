@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from metrics import ror
+
+
+class Command(BaseCommand):
+    help = "Loads the ROR data dump zip file into the local ROR registry"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path to the ROR data dump zip file")
+        parser.add_argument(
+            "--batchsize",
+            type=int,
+            default=5000,
+            help="Number of records written per bulk insert",
+        )
+
+    def handle(self, *args, **options):
+        loaded = ror.load_dump(options["path"], options["batchsize"])
+        self.stdout.write(f"Loaded {loaded} ROR records")
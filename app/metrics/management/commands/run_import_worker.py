@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from metrics import upload_jobs
+import datetime
+import time
+
+
+class Command(BaseCommand):
+    help = "Runs queued upload jobs, several workers can run in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once there are no queued jobs left instead of polling for new ones",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2,
+            help="Seconds to wait between polls when there are no queued jobs",
+        )
+        parser.add_argument(
+            "--staleafter",
+            type=int,
+            default=None,
+            help="Minutes without progress after which a running job is claimed again",
+        )
+
+    def handle(self, *args, **options):
+        stale_after = (
+            None
+            if options["staleafter"] is None
+            else datetime.timedelta(minutes=options["staleafter"])
+        )
+        while True:
+            close_old_connections()
+            job = upload_jobs.claim_job(stale_after)
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+                continue
+
+            self.stdout.write(f"Running upload job {job.id}: {job}")
+            job = upload_jobs.run_job(job)
+            self.stdout.write(f"Finished upload job {job.id}: {job.status}")
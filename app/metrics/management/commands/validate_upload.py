@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from metrics import upload_jobs
+from metrics.models import Event, User
+from metrics.views.upload import UPLOAD_TYPES
+
+
+class Command(BaseCommand):
+    help = "Validates an upload file without writing to the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path to the CSV file")
+        parser.add_argument(
+            "--type",
+            choices=UPLOAD_TYPES.keys(),
+            required=True,
+            help="Data type of the file",
+        )
+        parser.add_argument(
+            "--user",
+            required=True,
+            help="Username of the uploading user",
+        )
+        parser.add_argument(
+            "--event",
+            type=int,
+            help="Id of the event metrics are uploaded for",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["user"])
+            event = Event.objects.get(id=options["event"]) if options["event"] else None
+        except (User.DoesNotExist, Event.DoesNotExist) as e:
+            raise CommandError(str(e))
+
+        with open(options["path"], "rb") as file:
+            errors = upload_jobs.validate_upload(
+                options["type"],
+                file,
+                upload_jobs.make_import_context(user, event, fetch_ror=False),
+                event,
+            )
+        for error in errors:
+            self.stdout.write(error)
+        if errors:
+            raise CommandError(f"Found {len(errors)} errors in {options['path']}")
+        self.stdout.write("The file is valid")
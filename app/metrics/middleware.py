@@ -1,6 +1,7 @@
 from datetime import datetime
 from functools import lru_cache
 from contextlib import suppress
+from django.utils.functional import SimpleLazyObject
 from .models import Event, Quality, Impact, Demographic, Node
 
 
@@ -363,7 +364,7 @@ def get_metrics(request):
 
 def metrics_middleware(get_response):
     def middleware(request):
-        setattr(request, "metrics", get_metrics(request))
+        setattr(request, "metrics", SimpleLazyObject(lambda: get_metrics(request)))
         response = get_response(request)
         return response
 
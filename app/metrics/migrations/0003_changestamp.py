@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:35
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def create_change_stamps(apps, schema_editor):
+    ChangeStamp = apps.get_model("metrics", "ChangeStamp")
+    now = timezone.now()
+    for (app_label, model_name) in [
+        ("metrics", "Event"),
+        ("metrics", "Demographic"),
+        ("metrics", "Quality"),
+        ("metrics", "Impact"),
+        ("metrics", "Node"),
+        ("metrics", "OrganisingInstitution"),
+        ("auth", "User"),
+    ]:
+        model = apps.get_model(app_label, model_name)
+        ChangeStamp.objects.create(
+            table=model._meta.db_table,
+            modified=now,
+            row_count=model.objects.count(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("metrics", "0002_alter_event_duration"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeStamp",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("table", models.CharField(max_length=128, unique=True)),
+                ("modified", models.DateTimeField()),
+                ("row_count", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_change_stamps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metrics", "0004_uploadjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RorCache",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("ror_id", models.URLField(max_length=512, unique=True)),
+                ("name", models.TextField()),
+                ("country", models.TextField(blank=True)),
+                ("fetched", models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metrics", "0006_rorrecord"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="content_hash",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=64
+            ),
+        ),
+    ]
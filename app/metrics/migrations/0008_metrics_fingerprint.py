@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metrics", "0007_event_content_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="demographic",
+            name="fingerprint",
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="impact",
+            name="fingerprint",
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="quality",
+            name="fingerprint",
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="demographic",
+            constraint=models.UniqueConstraint(
+                fields=("event", "fingerprint"), name="unique_demographic_fingerprint"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="impact",
+            constraint=models.UniqueConstraint(
+                fields=("event", "fingerprint"), name="unique_impact_fingerprint"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="quality",
+            constraint=models.UniqueConstraint(
+                fields=("event", "fingerprint"), name="unique_quality_fingerprint"
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metrics", "0008_metrics_fingerprint"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="uploadjob",
+            name="data",
+        ),
+        migrations.AddField(
+            model_name="uploadjob",
+            name="file",
+            field=models.FileField(blank=True, upload_to="uploads/"),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metrics", "0009_uploadjob_file"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="demographic",
+            name="legacy_id",
+            field=models.PositiveIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name="impact",
+            name="legacy_id",
+            field=models.PositiveIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name="quality",
+            name="legacy_id",
+            field=models.PositiveIntegerField(editable=False, null=True, unique=True),
+        ),
+    ]
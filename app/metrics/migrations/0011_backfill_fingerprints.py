@@ -0,0 +1,62 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:40
+
+from django.db import migrations
+import collections
+import hashlib
+import itertools
+import json
+
+
+# Same fields and numbering as metrics.import_utils.Fingerprinter at the
+# time of this migration, so that answers imported before the fingerprints
+# were added are skipped when they are uploaded again.
+FINGERPRINT_EXCLUDE = {"id", "user", "created", "modified", "event", "fingerprint", "legacy_id"}
+BATCH_SIZE = 2000
+
+
+def backfill_fingerprints(apps, schema_editor):
+    for model_name in ["Demographic", "Quality", "Impact"]:
+        model = apps.get_model("metrics", model_name)
+        attnames = [
+            field.attname
+            for field in model._meta.concrete_fields
+            if field.name not in FINGERPRINT_EXCLUDE
+        ]
+        rows = model.objects.order_by("event_id", "id").iterator(chunk_size=BATCH_SIZE)
+        changed = []
+        for (_event_id, instances) in itertools.groupby(rows, key=lambda instance: instance.event_id):
+            instances = list(instances)
+            # Identical answers are numbered in the order they were added,
+            # skipping the fingerprints of rows imported since 0008
+            used = {instance.fingerprint for instance in instances if instance.fingerprint}
+            counts = collections.Counter()
+            for instance in instances:
+                if instance.fingerprint:
+                    continue
+                values = [getattr(instance, attname) for attname in attnames]
+                digest = hashlib.sha256(
+                    json.dumps([model_name, *values], default=str).encode()
+                ).digest()
+                while True:
+                    fingerprint = hashlib.sha256(digest + f":{counts[digest]}".encode()).hexdigest()
+                    counts[digest] += 1
+                    if fingerprint not in used:
+                        break
+                used.add(fingerprint)
+                instance.fingerprint = fingerprint
+                changed.append(instance)
+            if len(changed) >= BATCH_SIZE:
+                model.objects.bulk_update(changed, ["fingerprint"])
+                changed = []
+        model.objects.bulk_update(changed, ["fingerprint"], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metrics", "0010_metrics_legacy_id"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,14 @@
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.urls import reverse
 from django import forms
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.functional import cached_property
 import re
-import requests
 from django.contrib.auth.models import User 
 
 
@@ -24,7 +28,27 @@ class ChoiceArrayField(ArrayField):
         defaults.update(kwargs)
         return super(ArrayField, self).formfield(**defaults)
 
+
+class EventQuerySet(models.QuerySet):
+    def with_stats(self):
+        return self.annotate(**{
+            count_name: Coalesce(
+                Subquery(
+                    model.objects.filter(event=OuterRef("pk"))
+                    .order_by()
+                    .values("event")
+                    .annotate(count=Count("pk"))
+                    .values("count")
+                ),
+                0
+            )
+            for (_name, model, count_name) in Event.get_stat_models()
+        })
+
+
 class Event(models.Model):
+    objects = EventQuerySet.as_manager()
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
@@ -105,6 +129,8 @@ class Event(models.Model):
         ])
     )
     locked = models.BooleanField(default=False)
+    # Hash of the imported row and its metrics, used by load_data --upsert
+    content_hash = models.CharField(max_length=64, blank=True, default="", editable=False)
 
     def __str__(self):
         return f"{self.title} ({self.id}) ({self.code})"
@@ -128,15 +154,29 @@ class Event(models.Model):
             self.date_end
         )
 
+    @staticmethod
+    def get_stat_models():
+        return [
+            ("Quality metrics", Quality, "quality_count"),
+            ("Impact metrics", Impact, "impact_count"),
+            ("Demographic metrics", Demographic, "demographic_count"),
+        ]
+
+    @cached_property
+    def stat_counts(self):
+        count_names = [count_name for (_name, _model, count_name) in self.get_stat_models()]
+        if all(hasattr(self, count_name) for count_name in count_names):
+            return {
+                count_name: getattr(self, count_name)
+                for count_name in count_names
+            }
+        return Event.objects.filter(pk=self.pk).with_stats().values(*count_names).get()
+
     @property
     def stats(self):
         return [
-            (name, model.objects.filter(event=self).count())
-            for name, model in [
-                ("Quality metrics", Quality),
-                ("Impact metrics", Impact),
-                ("Demographic metrics", Demographic)
-            ]
+            (name, self.stat_counts[count_name])
+            for (name, _model, count_name) in self.get_stat_models()
         ]
 
     @property
@@ -210,6 +250,17 @@ class Demographic(models.Model):
             ("Other", "Other"),
         ],
     )
+    # Content hash of the answers, unique per event so that re-uploaded
+    # answers are skipped
+    fingerprint = models.CharField(max_length=64, null=True, editable=False)
+    # Entity id of the answer in the legacy database, delta loads update
+    # the answers by it
+    legacy_id = models.PositiveIntegerField(null=True, unique=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["event", "fingerprint"], name="unique_demographic_fingerprint"),
+        ]
 
 
 class Quality(models.Model):
@@ -280,6 +331,15 @@ class Quality(models.Model):
             ("No", "No"),
         ]
     )
+    fingerprint = models.CharField(max_length=64, null=True, editable=False)
+    # Entity id of the answer in the legacy database, delta loads update
+    # the answers by it
+    legacy_id = models.PositiveIntegerField(null=True, unique=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["event", "fingerprint"], name="unique_quality_fingerprint"),
+        ]
 
 
 class Impact(models.Model):
@@ -405,6 +465,15 @@ class Impact(models.Model):
     recommend_others = models.TextField(
         blank=True,
         choices=RECOMMEND_OTHERS_CHOICES)
+    fingerprint = models.CharField(max_length=64, null=True, editable=False)
+    # Entity id of the answer in the legacy database, delta loads update
+    # the answers by it
+    legacy_id = models.PositiveIntegerField(null=True, unique=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["event", "fingerprint"], name="unique_impact_fingerprint"),
+        ]
 
     def __str__(self):
         return f"Attendance: {self.get_how_long_ago_display()}, Reason: {self.get_main_attend_reason_display()}, Use Before: {self.how_often_use_before}, Use After: {self.how_often_use_after}, Able to Explain: {self.able_to_explain}"
@@ -443,26 +512,98 @@ class OrganisingInstitution(models.Model):
     def get_absolute_url(self):
         return reverse("institution-edit", kwargs={"pk": self.id})
 
-    def update_ror_data(self):
-        try:
-            ror_id_base = re.match("^https://ror.org/(.+)$", self.ror_id)[0]
-            ror_url = f"https://api.ror.org/organizations/{ror_id_base}"
-            response = requests.get(ror_url, allow_redirects=True)
-            if response.status_code == 200:
-                data = response.json()
-                self.name = data["name"]
-                self.country = data.get("country", {}).get("country_name", "")
-            else:
-                raise ValidationError(f"Could not fetch ROR data for: {self.ror_id}, {ror_url}, {response.status_code}")
-        except TypeError:
-            raise ValidationError(f"Not a valid ror id: {self.ror_id}")
+    def update_ror_data(self, data=None):
+        # Data resolved ahead of time by metrics.ror.resolve can be passed in
+        if data is None:
+            from metrics import ror
+            data = ror.get_ror_data(self.ror_id)
+        self.name = data.name
+        self.country = data.country
+
+
+class RorCache(models.Model):
+    ror_id = models.URLField(max_length=512, unique=True)
+    name = models.TextField()
+    country = models.TextField(blank=True)
+    fetched = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.ror_id} ({self.name})"
+
+
+class RorRecord(models.Model):
+    # Local copy of the ROR registry, loaded with the load_ror_dump command
+    ror_id = models.URLField(max_length=512, unique=True)
+    name = models.TextField()
+    aliases = ArrayField(models.TextField(), default=list, blank=True)
+    country = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(name="ror_record_name_trgm", fields=["name"], opclasses=["gin_trgm_ops"]),
+        ]
+
+    def __str__(self):
+        return f"{self.ror_id} ({self.name})"
+
+
+class ChangeStamp(models.Model):
+    table = models.CharField(max_length=128, unique=True)
+    modified = models.DateTimeField()
+    row_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.table} ({self.row_count}, {self.modified})"
+
+
+class UploadJob(models.Model):
+    STATUS_CHOICES = string_choices([
+        "Queued",
+        "Running",
+        "Done",
+        "Failed",
+    ])
+    FINISHED_STATUSES = ["Done", "Failed"]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    upload_type = models.TextField()
+    file_name = models.TextField()
+    # The uploaded file is stored until the job has finished, workers
+    # stream it from the shared media storage.
+    file = models.FileField(upload_to="uploads/", blank=True)
+    status = models.TextField(choices=STATUS_CHOICES, default="Queued")
+    rows_parsed = models.PositiveIntegerField(default=0)
+    rows_inserted = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list)
+    outputs = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created"]),
+        ]
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+    def __str__(self):
+        return f"{self.upload_type} upload {self.file_name} ({self.status})"
+
+
+def get_node_name(self):
+    return f"ELIXIR-{self.username.upper()}"
 
 
 def get_node(self):
-    node_name = f"ELIXIR-{self.username.upper()}"
     try:
-        return Node.objects.get(name=node_name)
+        return Node.objects.get(name=self.get_node_name())
     except Node.DoesNotExist:
         return None
 
+User.add_to_class("get_node_name", get_node_name)
 User.add_to_class("get_node", get_node)
@@ -0,0 +1,102 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.exceptions import ValidationError
+from django.db import connections, transaction
+from metrics import change_stamps, import_utils
+from metrics.models import Demographic, Quality, Impact
+import dataclasses
+import django
+import time
+import zlib
+from typing import Callable
+
+
+BUILDERS = {
+    Demographic: "build_demographic",
+    Quality: "build_quality",
+    Impact: "build_impact",
+}
+
+EVENT_COLUMN = "event"
+
+
+@dataclasses.dataclass
+class LoadReport:
+    rows: int = 0
+    seconds: float = 0
+    errors: list = dataclasses.field(default_factory=list)
+
+    def add(self, other: "LoadReport"):
+        self.rows += other.rows
+        self.errors.extend(other.errors)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0
+
+
+def get_partition(row: dict, partitions: int) -> int:
+    # All answers to an event go to the same partition, so identical answers
+    # are numbered in file order like a single import of the file. crc32 is
+    # the same in every process, unlike hash().
+    key = str(row.get(EVENT_COLUMN) or "").strip().lower()
+    return zlib.crc32(key.encode()) % partitions
+
+
+def read_partition(reader, partition: int, partitions: int, skip_row: Callable[[dict], bool] | None = None):
+    return (
+        row
+        for row in reader
+        if get_partition(row, partitions) == partition
+        and (skip_row is None or not skip_row(row))
+    )
+
+
+def load_partition(
+    model,
+    path: str,
+    partition: int,
+    partitions: int,
+    batch_size: int | None = None,
+    skip_row: Callable[[dict], bool] | None = None,
+) -> LoadReport:
+    # Every process has its own connection and lookup caches, each partition
+    # is committed on its own.
+    started = time.monotonic()
+    context = import_utils.ImportContext()
+    importer = import_utils.BatchImporter(getattr(context, BUILDERS[model]), batch_size, preload=context.preload)
+    report = LoadReport()
+    try:
+        with import_utils.open_rows(path) as reader, change_stamps.batch_changes(), transaction.atomic():
+            report.rows = importer.insert_rows(read_partition(reader, partition, partitions, skip_row)).rows
+    except ValidationError as e:
+        report.errors = [f"{path} [{partition + 1}/{partitions}]: {message}" for message in e.messages]
+    except Exception as e:
+        report.errors = [f"{path} [{partition + 1}/{partitions}]: {e}"]
+    report.seconds = time.monotonic() - started
+    return report
+
+
+def load_parallel(
+    sources: dict,
+    processes: int,
+    batch_size: int | None = None,
+    skip_row: Callable[[dict], bool] | None = None,
+) -> dict:
+    reports = {model: LoadReport() for model in sources}
+    started = time.monotonic()
+
+    # Connections must not be shared with the forked workers
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=processes, initializer=django.setup) as executor:
+        futures = {
+            executor.submit(load_partition, model, path, partition, processes, batch_size, skip_row): model
+            for (model, path) in sources.items()
+            for partition in range(processes)
+        }
+        for future in as_completed(futures):
+            reports[futures[future]].add(future.result())
+
+    seconds = time.monotonic() - started
+    for report in reports.values():
+        report.seconds = seconds
+    return reports
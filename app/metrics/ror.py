@@ -0,0 +1,248 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils import timezone
+from metrics.models import RorCache, RorRecord
+import dataclasses
+import datetime
+import io
+import itertools
+import json
+import logging
+import re
+import requests
+import threading
+import time
+import zipfile
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class RorData:
+    name: str
+    country: str
+
+
+def get_api_url():
+    return getattr(settings, "ROR_API_URL", "https://api.ror.org/organizations/")
+
+
+def get_cache_ttl():
+    return datetime.timedelta(days=getattr(settings, "ROR_CACHE_TTL_DAYS", 30))
+
+
+def get_ror_suffix(ror_id: str) -> str:
+    match = re.match("^https://ror.org/(.+)$", ror_id or "")
+    if match is None:
+        raise ValidationError(f"Not a valid ror id: {ror_id}")
+    return match[1]
+
+
+def fetch_ror_data(ror_id: str, session: requests.Session) -> RorData:
+    ror_url = f"{get_api_url()}{get_ror_suffix(ror_id)}"
+    timeout = getattr(settings, "ROR_TIMEOUT", 5)
+    retries = getattr(settings, "ROR_RETRIES", 3)
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(ror_url, allow_redirects=True, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = str(e)
+        else:
+            if response.status_code == 200:
+                data = response.json()
+                return RorData(
+                    name=data["name"],
+                    country=data.get("country", {}).get("country_name", ""),
+                )
+            error = response.status_code
+            if response.status_code != 429 and response.status_code < 500:
+                break
+        if attempt < retries:
+            time.sleep(0.5 * 2 ** attempt)
+    raise ValidationError(f"Could not fetch ROR data for: {ror_id}, {ror_url}, {error}")
+
+
+def resolve(ror_ids, fetch: bool = True) -> dict:
+    """
+    Returns RorData or the ValidationError of the failed lookup for each of
+    the ror ids. The local registry is used first, then cached entries while
+    fresh, missing ones are fetched concurrently and stored in the cache.
+
+    Without fetch, nothing is requested or written: cached entries are used
+    however old they are, and the ids that are not known locally are only
+    checked for their format and left out of the result.
+    """
+    ror_ids = set(ror_ids)
+    results = {
+        entry.ror_id: RorData(name=entry.name, country=entry.country)
+        for entry in RorRecord.objects.filter(ror_id__in=ror_ids)
+    }
+    cached = RorCache.objects.filter(ror_id__in=ror_ids - results.keys())
+    if fetch:
+        cached = cached.filter(fetched__gte=timezone.now() - get_cache_ttl())
+    results.update({
+        entry.ror_id: RorData(name=entry.name, country=entry.country)
+        for entry in cached
+    })
+    missing = sorted(ror_ids - results.keys())
+    if not fetch:
+        for ror_id in missing:
+            try:
+                get_ror_suffix(ror_id)
+            except ValidationError as e:
+                results[ror_id] = e
+        return results
+    if not missing:
+        return results
+
+    # Sessions are not thread safe, every worker thread keeps its own
+    local = threading.local()
+    sessions = []
+
+    def fetch_one(ror_id):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            sessions.append(local.session)
+        try:
+            return fetch_ror_data(ror_id, local.session)
+        except ValidationError as e:
+            return e
+
+    max_workers = getattr(settings, "ROR_MAX_WORKERS", 8)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            fetched = dict(zip(missing, executor.map(fetch_one, missing)))
+    finally:
+        for session in sessions:
+            session.close()
+
+    now = timezone.now()
+    RorCache.objects.bulk_create(
+        [
+            RorCache(ror_id=ror_id, name=data.name, country=data.country, fetched=now)
+            for (ror_id, data) in fetched.items()
+            if isinstance(data, RorData)
+        ],
+        update_conflicts=True,
+        unique_fields=["ror_id"],
+        update_fields=["name", "country", "fetched"],
+    )
+    logger.info(f"Fetched {len(missing)} ROR records")
+    return {**results, **fetched}
+
+
+def get_ror_data(ror_id: str) -> RorData:
+    result = resolve([ror_id])[ror_id]
+    if isinstance(result, ValidationError):
+        raise result
+    return result
+
+
+def search(query: str, limit: int = 20):
+    return (
+        RorRecord.objects
+        .annotate(similarity=TrigramSimilarity("name", query))
+        .filter(Q(name__icontains=query) | Q(similarity__gt=0.3))
+        .order_by("-similarity", "name")[:limit]
+    )
+
+
+def iter_json_array(stream, chunk_size: int = 1 << 20):
+    # Decodes the items of a top level JSON array without reading the whole
+    # document into memory.
+    decoder = json.JSONDecoder()
+    separators = re.compile(r"[\s,]*")
+    buffer = ""
+    position = 0
+    started = False
+    eof = False
+    while True:
+        position = separators.match(buffer, position).end()
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                (item, position) = decoder.raw_decode(buffer, position)
+                yield item
+                continue
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+        elif eof:
+            raise ValueError("Unexpected end of JSON array")
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def parse_ror_record(record: dict) -> RorRecord:
+    if "names" in record:
+        # Schema v2
+        names = [name["value"] for name in record["names"]]
+        name = next(
+            (
+                value["value"]
+                for value in record["names"]
+                if "ror_display" in value.get("types", [])
+            ),
+            names[0] if names else "",
+        )
+        country = next(
+            (
+                location.get("geonames_details", {}).get("country_name", "")
+                for location in record.get("locations", [])
+            ),
+            "",
+        )
+    else:
+        name = record["name"]
+        names = [
+            *record.get("aliases", []),
+            *record.get("acronyms", []),
+            *[label["label"] for label in record.get("labels", [])],
+        ]
+        country = (record.get("country") or {}).get("country_name", "")
+    return RorRecord(
+        ror_id=record["id"],
+        name=name,
+        aliases=[value for value in names if value != name],
+        country=country or "",
+    )
+
+
+def get_dump_member(archive: zipfile.ZipFile) -> str:
+    members = sorted(name for name in archive.namelist() if name.endswith(".json"))
+    if not members:
+        raise ValueError("The archive contains no JSON file")
+    return next((name for name in members if "schema_v2" in name), members[0])
+
+
+def load_dump(path: str, batch_size: int = 5000) -> int:
+    loaded = 0
+    with zipfile.ZipFile(path) as archive:
+        with archive.open(get_dump_member(archive)) as member:
+            records = (
+                parse_ror_record(record)
+                for record in iter_json_array(io.TextIOWrapper(member, encoding="utf-8"))
+            )
+            while batch := list(itertools.islice(records, batch_size)):
+                RorRecord.objects.bulk_create(
+                    batch,
+                    update_conflicts=True,
+                    unique_fields=["ror_id"],
+                    update_fields=["name", "aliases", "country"],
+                )
+                loaded += len(batch)
+                logger.info(f"Loaded {loaded} ROR records")
+    return loaded
@@ -0,0 +1,39 @@
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from metrics.models import Event, Impact
+import io
+import json
+
+
+class TestBenchmarks(TransactionTestCase):
+    # The imports are committed in a scratch database of their own
+    SIZES = [10, 25]
+
+    def test_benchmark_imports(self):
+        stdout = io.StringIO()
+        call_command(
+            "benchmark_imports",
+            "--sizes",
+            ",".join(str(size) for size in self.SIZES),
+            stdout=stdout,
+            stderr=io.StringIO(),
+        )
+        results = {result["name"]: result for result in json.loads(stdout.getvalue())}
+
+        self.assertEqual(
+            sorted(results),
+            sorted(
+                f"{stage}-{upload_type}-{size}"
+                for size in self.SIZES
+                for stage in ["parse", "import"]
+                for upload_type in ["events", "demographic_quality_metrics", "impact_metrics"]
+            )
+        )
+        for size in self.SIZES:
+            with self.subTest(size=size):
+                self.assertEqual(results[f"import-events-{size}"]["rows"], size)
+                self.assertEqual(results[f"import-impact_metrics-{size}"]["rows"], size)
+                self.assertGreater(results[f"import-events-{size}"]["queries_per_row"], 0)
+                self.assertEqual(results[f"parse-events-{size}"]["queries"], 0)
+        self.assertFalse(Event.objects.exists())
+        self.assertFalse(Impact.objects.exists())
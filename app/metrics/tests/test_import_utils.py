@@ -1,4 +1,7 @@
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.conf import settings
 from metrics.models import (
     Node,
@@ -9,8 +12,24 @@ from metrics.models import (
     Impact,
     ChoiceArrayField
 )
-from metrics.import_utils import ImportContext
+from metrics.import_utils import (
+    ImportContext,
+    BatchImporter,
+    get_alias_maps,
+    normalize_column,
+    open_rows,
+    use_alias,
+)
+from metrics import instrumentation, upload_jobs
+from metrics.copy_loader import CopyImportContext, CopyLoader
+from metrics.parallel_loader import get_partition, load_partition
+from metrics.upsert_loader import EventUpserter
+from django.core.exceptions import ValidationError
 import csv
+import gzip
+import io
+import tempfile
+import threading
 
 
 # Create your tests here.
@@ -82,6 +101,430 @@ class TestImportValues(TestCase):
                         field_name: value
                     })
 
+    def test_batch_import(self):
+        node = Node.objects.create(name="Test", country="Anywhere")
+        user = User.objects.create(username="test")
+        event = self._create_event(user, node)
+        context = ImportContext()
+        rows = [
+            {
+                "user": user.username,
+                "event": event.code,
+                "used_resources_before": "",
+                "used_resources_future": "Yes",
+                "recommend_course": "Yes",
+                "course_rating": "",
+                "balance": "",
+                "email_contact": "",
+            }
+            for _i in range(5)
+        ]
+
+        items = BatchImporter(context.build_quality, batch_size=2).import_rows(rows)
+        self.assertEqual(len(items), 5)
+        self.assertEqual(Quality.objects.filter(event=event).count(), 5)
+
+        with self.assertRaises(ValidationError) as error:
+            BatchImporter(context.build_quality, batch_size=2).import_rows([
+                rows[0],
+                {**rows[0], "recommend_course": "Not a choice"},
+                rows[0],
+                {**rows[0], "used_resources_future": "Never"},
+            ])
+        self.assertEqual(len(error.exception.messages), 2)
+        self.assertTrue(error.exception.messages[1].startswith("Row 3: Quality.used_resources_future"))
+        self.assertEqual(Quality.objects.filter(event=event).count(), 5)
+
+        # Identical answers are kept within an import but skipped when
+        # they are imported again
+        result = BatchImporter(context.build_quality, batch_size=2).insert_rows(rows + rows[:2])
+        self.assertEqual(result.rows, 7)
+        self.assertEqual(result.duplicates, {"Quality": 5})
+        self.assertEqual(Quality.objects.filter(event=event).count(), 7)
+
+        # Another upload only adds the identical answers beyond those
+        # stored before
+        result = BatchImporter(context.build_quality).insert_rows(rows * 2)
+        self.assertEqual(result.duplicates, {"Quality": 7})
+        self.assertEqual(Quality.objects.filter(event=event).count(), 10)
+
+    def test_batch_import_legacy_ids(self):
+        node = Node.objects.create(name="Test", country="Anywhere")
+        user = User.objects.create(username="test")
+        event = self._create_event(user, node)
+        context = ImportContext()
+        rows = [
+            {
+                "legacy_id": str(legacy_id),
+                "user": user.username,
+                "event": event.code,
+                "used_resources_before": "",
+                "used_resources_future": "Yes",
+                "recommend_course": "Yes",
+                "course_rating": "",
+                "balance": "",
+                "email_contact": "",
+            }
+            for legacy_id in [1, 2, 3]
+        ]
+        BatchImporter(context.build_quality, batch_size=2).insert_rows(rows)
+
+        # Rows exported again update the answers with the same legacy ids
+        BatchImporter(context.build_quality, batch_size=2).insert_rows([
+            {**rows[0], "recommend_course": "No"},
+            rows[1],
+        ])
+        self.assertEqual(Quality.objects.filter(event=event).count(), 3)
+        self.assertEqual(Quality.objects.get(legacy_id=1).recommend_course, "No")
+
+        with self.assertRaises(ValidationError):
+            BatchImporter(context.build_quality).import_rows([{**rows[0], "legacy_id": "x"}])
+
+    def test_batch_import_preloads_lookups(self):
+        node = Node.objects.create(name="Test", country="Anywhere")
+        user = User.objects.create(username="test")
+        events = [
+            self._create_event(user, node, code=f"test-{i}")
+            for i in range(2)
+        ]
+        context = ImportContext()
+        rows = [
+            {
+                "user": user.username,
+                "event": events[i % 2].code,
+                "when_attend_training": "Over a year",
+                "main_attend_reason": "",
+                "how_often_use_before": "",
+                "how_often_use_after": "",
+                "able_to_explain": "Yes",
+                "able_use_now": "Independently",
+                "help_work": "Other",
+                "attending_led_to": "",
+                "people_share_knowledge": "",
+                "recommend_others": "",
+            }
+            for i in range(10)
+        ]
+        importer = BatchImporter(context.build_impact, preload=context.preload)
+
+        # One query for the users and one for the events
+        with self.assertNumQueries(2):
+            self.assertEqual(len(importer.build_rows(rows)), 10)
+
+        with self.assertRaises(ValidationError) as error:
+            importer.build_rows([{**rows[0], "event": "missing"}])
+        self.assertEqual(error.exception.messages, ["Row 0: Unknown event 'missing'"])
+
+    def test_copy_loader(self):
+        node = Node.objects.create(name="Test", country="Anywhere")
+        user = User.objects.create(username="test")
+        event = self._create_event(user, node)
+        context = CopyImportContext()
+        row = {
+            "user": user.username,
+            "event": event.code,
+            "heard_from": "TeSS, Email",
+            "employment_sector": "Industry",
+            "employment_country": "Tab\tland",
+            "gender": "",
+            "career_stage": "PhD candidate",
+        }
+        loader = CopyLoader(Demographic, context.build_demographic, context)
+
+        self.assertEqual(loader.load([row, row]), 2)
+        demographic = Demographic.objects.filter(event=event).first()
+        self.assertEqual(demographic.heard_from, ["TeSS", "Email"])
+        self.assertEqual(demographic.employment_country, "Tab\tland")
+        self.assertEqual(demographic.gender, "Other")
+
+        with self.assertRaises(ValidationError) as error:
+            loader.load([row, {**row, "event": "missing"}, {**row, "gender": "Not a choice"}])
+        self.assertEqual(error.exception.messages, ["Row 2: Demographic.gender: 'Not a choice' is not a valid choice."])
+        with self.assertRaises(ValidationError) as error:
+            loader.load([row, {**row, "event": "missing"}])
+        self.assertEqual(error.exception.messages, ["Row 1: Unknown event 'missing'"])
+        self.assertEqual(Demographic.objects.filter(event=event).count(), 2)
+
+    def test_profile_import_stages(self):
+        importer = BatchImporter(
+            lambda row: Node(name=row["name"], country="Anywhere"),
+            batch_size=3,
+            parse=lambda row: row,
+        )
+        rows = [{"name": f"Node {i}"} for i in range(7)]
+        importer.insert_rows(rows)
+        with instrumentation.profile(trace_memory=True) as profile:
+            importer.insert_rows(rows)
+
+        stages = {stats["name"]: stats for stats in profile.summary()}
+        self.assertEqual(list(stages), ["read", "parse", "build", "validate", "insert"])
+        self.assertEqual(stages["read"]["rows"], 7)
+        self.assertEqual(stages["insert"]["calls"], 3)
+        self.assertGreater(stages["insert"]["queries"], 0)
+        self.assertEqual(stages["parse"]["queries"], 0)
+        self.assertIsNotNone(stages["build"]["peak_memory"])
+        self.assertIsNone(instrumentation.get_profile())
+
+    def test_nested_stages_keep_the_outer_peak(self):
+        with instrumentation.profile(trace_memory=True) as profile:
+            with instrumentation.stage("outer"):
+                data = bytearray(1 << 20)
+                del data
+                with instrumentation.stage("inner"):
+                    pass
+
+        stages = {stats["name"]: stats for stats in profile.summary()}
+        self.assertGreaterEqual(stages["outer"]["peak_memory"], 1 << 20)
+        self.assertLess(stages["inner"]["peak_memory"], 1 << 20)
+
+    def test_profile_threads_count_their_own_queries(self):
+        shared_profile = instrumentation.ImportProfile()
+        stage_started = threading.Event()
+        query_done = threading.Event()
+
+        def wait_in_stage():
+            with instrumentation.profile(shared_profile), instrumentation.stage("wait"):
+                stage_started.set()
+                query_done.wait(5)
+            connection.close()
+
+        def query_in_stage():
+            stage_started.wait(5)
+            with instrumentation.profile(shared_profile), instrumentation.stage("query"):
+                Node.objects.count()
+            query_done.set()
+            connection.close()
+
+        threads = [threading.Thread(target=wait_in_stage), threading.Thread(target=query_in_stage)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stages = {stats["name"]: stats for stats in shared_profile.summary()}
+        self.assertEqual(stages["wait"]["queries"], 0)
+        self.assertEqual(stages["query"]["queries"], 1)
+        self.assertEqual(shared_profile.queries, 1)
+
+    def test_partitions_keep_events_together(self):
+        rows = [{"event": event, "user": f"user-{i}"} for i in range(5) for event in ["1", " 1", "2", "3"]]
+        partitions = {}
+        for row in rows:
+            partitions.setdefault(row["event"].strip(), set()).add(get_partition(row, 3))
+        self.assertEqual([len(found) for found in partitions.values()], [1, 1, 1])
+
+    def test_partition_fingerprints(self):
+        node = Node.objects.create(name="Test", country="Anywhere")
+        user = User.objects.create(username="test")
+        event = self._create_event(user, node)
+        header = [
+            "user",
+            "event",
+            "used_resources_before",
+            "used_resources_future",
+            "recommend_course",
+            "course_rating",
+            "balance",
+            "email_contact",
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for _i in range(12):
+                writer.writerow([user.username, event.code, "", "Yes", "Yes", "", "", ""])
+            f.flush()
+
+            for partition in range(3):
+                load_partition(Quality, f.name, partition, 3)
+            with open_rows(f.name) as reader:
+                rows = list(reader)
+        self.assertEqual(Quality.objects.filter(event=event).count(), 12)
+
+        # The partitions are numbered like a single import of the file
+        result = BatchImporter(ImportContext().build_quality).insert_rows(rows)
+        self.assertEqual(result.duplicates, {"Quality": 12})
+
+    def test_ndjson_rows_match_csv_rows(self):
+        with tempfile.TemporaryDirectory() as target_dir:
+            with open(f"{target_dir}/impacts.csv", "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["user", "event", "help_work", "people_share_knowledge"])
+                writer.writerow(["si", "12", "Other, It improved my ability to handle data", ""])
+                writer.writerow(["si", "13", "", "1-5"])
+            with gzip.open(f"{target_dir}/impacts.ndjson.gz", "wt") as f:
+                f.write('{"user":"si","event":12,"help_work":["Other","It improved my ability to handle data"],"people_share_knowledge":null}\n')
+                f.write('{"user":"si","event":13,"help_work":[],"people_share_knowledge":"1-5"}\n')
+
+            with open_rows(f"{target_dir}/impacts.csv") as reader:
+                csv_rows = list(reader)
+            with open_rows(f"{target_dir}/impacts.ndjson.gz") as reader:
+                self.assertEqual(reader.fieldnames, ["user", "event", "help_work", "people_share_knowledge"])
+                ndjson_rows = list(reader)
+        self.assertEqual(ndjson_rows, csv_rows)
+
+    def test_vectorized_test_data(self):
+        user = User.objects.create(username="uk")
+        node = Node.objects.create(name="ELIXIR-UK", country="Anywhere")
+        event = self._create_event(user, node)
+        with tempfile.TemporaryDirectory() as target_dir:
+            call_command(
+                "create_test_data",
+                "--vectorized",
+                "--targetdir", target_dir,
+                "--contextid", "test",
+                "--eventcodes", "1,2",
+                "--answersperevent", "20",
+                "--chunksize", "7",
+                "--skew", "1.5",
+                stdout=io.StringIO(),
+            )
+            for upload_type in ["demographic_quality_metrics", "impact_metrics"]:
+                (importer, _view_transforms) = upload_jobs.get_upload_handler(
+                    upload_type,
+                    upload_jobs.make_import_context(user, event),
+                )
+                prefix = upload_type.removesuffix("_metrics")
+                with open(f"{target_dir}/{prefix}-test.csv", "rb") as f:
+                    self.assertEqual(upload_jobs.validate_file(importer, f), [])
+                    f.seek(0)
+                    codes = [row["event_code"] for row in upload_jobs.read_csv_rows(f)]
+                self.assertGreater(len(codes), 2)
+                self.assertEqual(codes, sorted(codes))
+
+    def test_aliases_per_field(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as f:
+            f.write(
+                "field,value,alias\n"
+                "Quality.balance,About right,ok\n"
+                "Quality.course_rating,Good (4),ok\n"
+                "Impact.help_work,Other,something else\n"
+                "general.general,ELIXIR Converge,converge\n"
+                "general.general,Other,ok\n"
+            )
+            f.flush()
+            with override_settings(VALUE_ALIASES_PATH=f.name):
+                get_alias_maps.cache_clear()
+                self.addCleanup(get_alias_maps.cache_clear)
+
+                self.assertEqual(use_alias("OK", "Quality.balance"), "About right")
+                self.assertEqual(use_alias("ok ", "Quality.course_rating"), "Good (4)")
+                self.assertEqual(use_alias(["ok", "Ok"], "Quality.balance"), ["About right", "About right"])
+                # General aliases apply to fields with their own aliases too
+                self.assertEqual(use_alias("Converge", "Impact.help_work"), "ELIXIR Converge")
+                self.assertEqual(use_alias("ok", "Impact.help_work"), "Other")
+                # Colliding aliases are left out of the field independent map
+                self.assertEqual(use_alias("ok"), "ok")
+                self.assertEqual(
+                    normalize_column(["ok", "Maybe", "ok"], "Quality.balance"),
+                    ["About right", "Maybe", "About right"]
+                )
+                self.assertEqual(
+                    normalize_column(["Something else, Other", ""], "Impact.help_work", array=True),
+                    [["Other", "Other"], []]
+                )
+
+    def test_save_events_in_bulk(self):
+        node = Node.objects.create(name="Test", country="Anywhere")
+        user = User.objects.create(username="test")
+        rows = self._event_rows(user, 6)
+
+        queries = []
+        for chunk in [rows[:2], rows[2:]]:
+            with CaptureQueriesContext(connection) as context:
+                ImportContext().save_events(chunk)
+            queries.append(len(context.captured_queries))
+        self.assertEqual(queries[0], queries[1])
+        self.assertEqual(Event.objects.count(), 6)
+        self.assertEqual(list(Event.objects.get(code="event-5").node.all()), [node])
+
+        # A code used twice in the chunk and one that exists already
+        new_rows = self._event_rows(user, 7)
+        with self.assertRaises(ValidationError) as error:
+            ImportContext().save_events([new_rows[6], new_rows[5], new_rows[6]])
+        self.assertEqual(len(error.exception.messages), 2)
+
+    def test_event_field_validators(self):
+        Node.objects.create(name="Test", country="Anywhere")
+        user = User.objects.create(username="test")
+        rows = self._event_rows(user, 2)
+
+        # Decimal digits and URLs are checked like full_clean does
+        with self.assertRaises(ValidationError) as error:
+            ImportContext().save_events([
+                {**rows[0], "duration": "12345.5"},
+                {**rows[1], "url": "not a url"},
+            ])
+        self.assertEqual(len(error.exception.messages), 2)
+        self.assertIn("duration", error.exception.messages[0])
+        self.assertIn("url", error.exception.messages[1])
+
+        # Single events are validated before they are saved
+        with self.assertRaises(ValidationError):
+            ImportContext().event_from_dict({**rows[0], "url": "not a url"})
+        self.assertEqual(Event.objects.count(), 0)
+
+    def test_event_upsert(self):
+        node = Node.objects.create(name="Test", country="Anywhere")
+        user = User.objects.create(username="test")
+        rows = self._event_rows(user, 3)
+
+        upserter = EventUpserter(ImportContext(), {})
+        report = upserter.upsert(rows)
+        self.assertEqual((report.inserted, report.updated, report.unchanged), (3, 0, 0))
+        self.assertEqual(upserter.changed_codes, {"event-0", "event-1", "event-2"})
+        # Without saved hashes, e.g. when loading the metrics failed, the
+        # events are upserted again
+        report = EventUpserter(ImportContext(), {}).upsert(rows)
+        self.assertEqual((report.inserted, report.updated, report.unchanged), (0, 3, 0))
+        upserter.save_content_hashes()
+        event = Event.objects.get(code="event-1")
+        self.assertEqual(list(event.node.all()), [node])
+        Quality.objects.create(user=user, event=event, email_contact="No")
+
+        upserter = EventUpserter(ImportContext(), {"event-0": "changed metrics"})
+        report = upserter.upsert([rows[0], {**rows[1], "title": "Changed"}, rows[2]])
+        self.assertEqual((report.inserted, report.updated, report.unchanged), (0, 2, 1))
+        self.assertEqual(upserter.changed_codes, {"event-0", "event-1"})
+        upserter.save_content_hashes()
+        event.refresh_from_db()
+        self.assertEqual(event.title, "Changed")
+        self.assertEqual(list(event.node.all()), [node])
+        self.assertEqual(Quality.objects.filter(event=event).count(), 0)
+        self.assertEqual(Event.objects.count(), 3)
+
+        Quality.objects.create(user=user, event=event, email_contact="No")
+        upserter = EventUpserter(ImportContext(), {}, replace_metrics=False)
+        report = upserter.upsert([{**rows[1], "title": "Changed again"}])
+        self.assertEqual(report.updated, 1)
+        self.assertEqual(Quality.objects.filter(event=event).count(), 1)
+
+    def _event_rows(self, user, count):
+        return [
+            {
+                "user": user.username,
+                "code": f"event-{i}",
+                "title": f"Event {i}",
+                "node": "Test",
+                "node_main": "Test",
+                "date_start": "2024-01-01",
+                "date_end": "2024-01-02",
+                "duration": "2",
+                "type": "Hackathon",
+                "funding": "",
+                "organising_institution": "",
+                "location_city": "Anytown",
+                "location_country": "Anywhere",
+                "target_audience": "",
+                "additional_platforms": "",
+                "communities": "",
+                "number_participants": "10",
+                "number_trainers": "10",
+                "url": "https://local.local",
+                "status": "Complete",
+            }
+            for i in range(count)
+        ]
+
     def _create_event(self, user, node, title="A test event", code="test"):
         event = Event.objects.create(
             user=user,
@@ -103,7 +546,7 @@ class TestImportValues(TestCase):
             communities=["NA"],
             status="Complete",
         )
-        event.node.set([event.id])
+        event.node.set([node])
         event.save()
         return event
 
@@ -0,0 +1,143 @@
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from metrics import ror
+from metrics.import_utils import ImportContext
+from metrics.models import OrganisingInstitution, RorCache, RorRecord, User
+import io
+import json
+import tempfile
+import threading
+import zipfile
+
+
+class StubRorHandler(BaseHTTPRequestHandler):
+    records = {
+        "001": {"name": "First institute", "country": {"country_name": "Slovenia"}},
+        "002": {"name": "Second institute", "country": {"country_name": "Finland"}},
+    }
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        record = self.records.get(self.path.rsplit("/", 1)[-1])
+        if record is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps(record).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRorResolution(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubRorHandler)
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        settings = override_settings(
+            ROR_API_URL=f"http://127.0.0.1:{self.server.server_port}/organizations/",
+            ROR_RETRIES=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_resolve_uses_cache(self):
+        results = ror.resolve(["https://ror.org/001", "https://ror.org/002", "https://ror.org/404"])
+        self.assertEqual(results["https://ror.org/001"], ror.RorData("First institute", "Slovenia"))
+        self.assertEqual(results["https://ror.org/002"].country, "Finland")
+        self.assertIsInstance(results["https://ror.org/404"], ValidationError)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(RorCache.objects.count(), 2)
+
+        ror.resolve(["https://ror.org/001", "https://ror.org/002"])
+        self.assertEqual(len(self.server.requests), 3)
+
+        with override_settings(ROR_CACHE_TTL_DAYS=0):
+            ror.resolve(["https://ror.org/001"])
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_import_context_preloads_institutions(self):
+        context = ImportContext()
+        context.preload([
+            {"organising_institution": "https://ror.org/001, https://ror.org/002"},
+            {"organising_institution": "https://ror.org/001"},
+        ])
+        self.assertEqual(len(self.server.requests), 2)
+
+        institutions = context.get_institutions(["https://ror.org/001", "https://ror.org/002", "https://ror.org/404"])
+        self.assertEqual([institution.name for institution in institutions], ["First institute", "Second institute"])
+        self.assertEqual(OrganisingInstitution.objects.count(), 2)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_registry_is_used_before_the_api(self):
+        RorRecord.objects.create(ror_id="https://ror.org/001", name="Registry institute", country="Slovenia")
+        results = ror.resolve(["https://ror.org/001", "https://ror.org/002"])
+        self.assertEqual(results["https://ror.org/001"].name, "Registry institute")
+        self.assertEqual(self.server.requests, ["/organizations/002"])
+
+    def test_resolve_without_fetching(self):
+        RorRecord.objects.create(ror_id="https://ror.org/001", name="Registry institute", country="Slovenia")
+        results = ror.resolve(["https://ror.org/001", "https://ror.org/002", "not-a-ror-id"], fetch=False)
+        self.assertEqual(results["https://ror.org/001"].name, "Registry institute")
+        self.assertNotIn("https://ror.org/002", results)
+        self.assertIsInstance(results["not-a-ror-id"], ValidationError)
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual(RorCache.objects.count(), 0)
+
+        context = ImportContext(fetch_ror=False)
+        context.preload([{"organising_institution": "https://ror.org/002"}])
+        context.check_institutions(["https://ror.org/002"])
+        self.assertEqual(self.server.requests, [])
+
+
+class TestRorRegistry(TestCase):
+    records = [
+        {
+            "id": "https://ror.org/001",
+            "name": "University of Ljubljana",
+            "aliases": [],
+            "acronyms": ["UL"],
+            "labels": [{"label": "Univerza v Ljubljani", "iso639": "sl"}],
+            "country": {"country_code": "SI", "country_name": "Slovenia"},
+        },
+        {
+            "id": "https://ror.org/002",
+            "names": [
+                {"value": "University of Helsinki", "types": ["ror_display", "label"]},
+                {"value": "Helsingin yliopisto", "types": ["label"]},
+            ],
+            "locations": [{"geonames_details": {"country_name": "Finland"}}],
+        },
+    ]
+
+    def test_load_dump(self):
+        with tempfile.NamedTemporaryFile(suffix=".zip") as f:
+            with zipfile.ZipFile(f, "w") as archive:
+                archive.writestr("v1.0-ror-data.json", json.dumps(self.records))
+            f.flush()
+            call_command("load_ror_dump", f.name, "--batchsize", "1", stdout=io.StringIO())
+            call_command("load_ror_dump", f.name, stdout=io.StringIO())
+
+        self.assertEqual(RorRecord.objects.count(), 2)
+        record = RorRecord.objects.get(ror_id="https://ror.org/001")
+        self.assertEqual(record.aliases, ["UL", "Univerza v Ljubljani"])
+        self.assertEqual(record.country, "Slovenia")
+        self.assertEqual(RorRecord.objects.get(ror_id="https://ror.org/002").name, "University of Helsinki")
+
+        self.client.force_login(User.objects.create(username="test"))
+        response = self.client.get(reverse("institution-search"), {"q": "helsinki"})
+        self.assertEqual(
+            [result["ror_id"] for result in response.json()["results"]],
+            ["https://ror.org/002"]
+        )
@@ -0,0 +1,325 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from metrics import forms, upload_jobs
+from metrics.models import (
+    Node,
+    User,
+    Event,
+    OrganisingInstitution,
+    Quality,
+    RorRecord,
+    UploadJob,
+)
+import csv
+import io
+import tempfile
+import zipfile
+
+
+class EventTestCase(TestCase):
+    # Session and user lookups are made by the auth middleware on every
+    # request, the validators themselves need a single query.
+    AUTH_QUERIES = 2
+
+    def setUp(self):
+        self.node = Node.objects.create(name="ELIXIR-TEST", country="Anywhere")
+        self.user = User.objects.create(username="test")
+        self.client.force_login(self.user)
+        self.events = [
+            self._create_event(title=f"Event {i}", code=f"event-{i}")
+            for i in range(3)
+        ]
+
+    def _create_event(self, title="A test event", code="test"):
+        event = Event.objects.create(
+            user=self.user,
+            title=title,
+            node_main=self.node,
+            date_start="2024-01-01",
+            date_end="2024-01-02",
+            duration=2,
+            location_city="Anytown",
+            location_country="Anywhere",
+            number_participants=10,
+            number_trainers=10,
+            funding=["ELIXIR Node"],
+            url="https://local.local",
+            code=code,
+            type="Hackathon",
+            target_audience=["Academia/ Research Institution"],
+            additional_platforms=["NA"],
+            communities=["NA"],
+            status="Complete",
+        )
+        event.node.set([self.node])
+        return event
+
+
+class TestEventListExport(EventTestCase):
+    def test_csv_export_streams_all_events(self):
+        response = self.client.get(reverse("event-list"), {"format": "csv", "page_size": 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0][:3], ["Code", "Id", "Title"])
+        self.assertEqual(
+            sorted(row[0] for row in rows[1:]),
+            sorted(event.code for event in self.events)
+        )
+
+    def test_csv_export_uses_list_filters(self):
+        response = self.client.get(reverse("event-list"), {"format": "csv", "id": self.events[0].id})
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][0], self.events[0].code)
+
+
+class TestConditionalGet(EventTestCase):
+
+    def test_unchanged_pages_are_not_modified(self):
+        urls = [
+            reverse("event-list"),
+            reverse("institution-list"),
+            reverse("event-edit", kwargs={"pk": self.events[0].id}),
+        ]
+        for url in urls:
+            etag = self._get_etag(url)
+            with self.assertNumQueries(self.AUTH_QUERIES + 1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_changed_event_is_modified(self):
+        url = reverse("event-edit", kwargs={"pk": self.events[0].id})
+        etag = self._get_etag(url)
+        self.events[0].title = "A changed title"
+        self.events[0].save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_new_metrics_modify_event_list(self):
+        url = reverse("event-list")
+        etag = self._get_etag(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Quality.objects.create(
+                user=self.user,
+                event=self.events[0],
+                email_contact="No",
+            )
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_changed_relations_modify_event(self):
+        url = reverse("event-edit", kwargs={"pk": self.events[0].id})
+        etag = self._get_etag(url)
+        institution = OrganisingInstitution.objects.create(name="An institute")
+        institution.event_set.add(self.events[0])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        self.node.event_set.clear()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_login_does_not_modify_event(self):
+        url = reverse("event-edit", kwargs={"pk": self.events[0].id})
+        etag = self._get_etag(url)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.user.save(update_fields=["last_login"])
+        self.assertEqual(callbacks, [])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def _get_etag(self, url):
+        # The first response sets the csrf cookie that is part of the ETag
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response["ETag"]
+
+
+class TestEventStats(EventTestCase):
+    def test_stats_use_one_query(self):
+        Quality.objects.create(
+            user=self.user,
+            event=self.events[0],
+            email_contact="No",
+        )
+        event = Event.objects.get(pk=self.events[0].pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                event.stats,
+                [("Quality metrics", 1), ("Impact metrics", 0), ("Demographic metrics", 0)]
+            )
+            self.assertEqual(event.metrics_status, "Partial")
+
+    def test_annotated_stats_need_no_query(self):
+        event = Event.objects.with_stats().get(pk=self.events[0].pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(event.metrics_status, "None")
+
+    def test_event_view_queries_do_not_depend_on_metrics(self):
+        url = reverse("event-edit", kwargs={"pk": self.events[0].id})
+        # The first response sets the csrf cookie
+        self.client.get(url)
+        self._add_metrics(self.events[0], 5)
+
+        # Change stamps, the event with its stats, its nodes and
+        # institutions, and the choices of the user and node fields
+        with self.assertNumQueries(self.AUTH_QUERIES + 6):
+            response = self.client.get(url)
+        self.assertContains(response, "Quality metrics")
+
+    def test_csv_export_queries_do_not_depend_on_events(self):
+        url = reverse("event-list")
+        params = {"format": "csv", "page_size": 10}
+        for event in [*self.events, self._create_event(code="event-3"), self._create_event(code="event-4")]:
+            self._add_metrics(event, 2)
+
+        # Change stamps, the events with their stats, and the prefetched
+        # nodes and institutions
+        with self.assertNumQueries(self.AUTH_QUERIES + 4):
+            content = b"".join(self.client.get(url, params).streaming_content).decode()
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual({row[-1] for row in rows[1:]}, {"Partial"})
+
+    def _add_metrics(self, event, count):
+        Quality.objects.bulk_create([
+            Quality(user=self.user, event=event, email_contact="No")
+            for _i in range(count)
+        ])
+
+
+class TestEventForm(EventTestCase):
+    def setUp(self):
+        super().setUp()
+        self.institution = OrganisingInstitution.objects.create(
+            name="An institute",
+            country="Anywhere",
+            ror_id="https://ror.org/001",
+        )
+        OrganisingInstitution.objects.create(name="Another institute", country="Anywhere")
+        # Events with a code are locked
+        self.event = self._create_event(code=None)
+        self.event.organising_institution.set([self.institution])
+        RorRecord.objects.create(ror_id="https://ror.org/002", name="Registry institute", country="Slovenia")
+
+    def test_only_selected_institutions_are_listed(self):
+        response = self.client.get(reverse("event-edit", kwargs={"pk": self.event.id}))
+        self.assertContains(response, f'<option value="{self.institution.id}" selected>An institute (Anywhere)</option>')
+        self.assertNotContains(response, "Another institute")
+        self.assertContains(response, f'data-search-url="{reverse("institution-search")}"')
+
+    def test_institutions_are_added_by_ror_id(self):
+        data = {**self._get_data(), "organising_institution": [self.institution.id, "https://ror.org/002"]}
+        response = self.client.post(reverse("event-edit", kwargs={"pk": self.event.id}), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(str(institution) for institution in self.event.organising_institution.all()),
+            ["An institute (Anywhere)", "Registry institute (Slovenia)"],
+        )
+
+    def test_existing_institutions_are_reused(self):
+        form = forms.EventForm(
+            {**self._get_data(), "organising_institution": [self.institution.id, "https://ror.org/001"]},
+            instance=self.event,
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data["organising_institution"], [self.institution])
+
+    def _get_data(self):
+        form = forms.EventForm(instance=self.event)
+        return {
+            name: value
+            for (name, value) in ((field.html_name, field.value()) for field in form)
+            if value is not None
+        }
+
+
+class TestUploadJobs(EventTestCase):
+    # Progress is reported over the jobs connection
+    databases = {"default", "jobs"}
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_upload_is_queued(self):
+        response = self._upload(b"event_code\n")
+        job = UploadJob.objects.get()
+        self.assertRedirects(response, reverse("upload-job", kwargs={"job_id": job.id}))
+        self.assertEqual(job.status, "Queued")
+        self.assertEqual(job.upload_type, "impact_metrics")
+
+        response = self.client.get(reverse("upload-job", kwargs={"job_id": job.id}))
+        self.assertContains(response, 'http-equiv="refresh"')
+
+    def test_worker_runs_queued_jobs(self):
+        self._upload(b"event_code\n", name="valid.csv")
+        self._upload(b"\xff\xfe\x00", name="invalid.csv")
+        self._run_queued_jobs()
+
+        jobs = {job.file_name: job for job in UploadJob.objects.all()}
+        self.assertEqual(jobs["valid.csv"].status, "Done")
+        self.assertFalse(jobs["valid.csv"].file)
+        self.assertEqual(jobs["invalid.csv"].status, "Failed")
+        self.assertIn("not UTF-8 encoded", jobs["invalid.csv"].errors[0])
+
+        response = self.client.get(reverse("upload-job", kwargs={"job_id": jobs["valid.csv"].id}))
+        self.assertNotContains(response, 'http-equiv="refresh"')
+
+    def test_zip_upload(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as f:
+            f.writestr("data/impact.csv", "event_code\n")
+            f.writestr("data/demographic_quality.csv", "event_code\n")
+        self.client.post(reverse("upload-data"), {
+            "zip-file": SimpleUploadedFile("upload.zip", archive.getvalue(), content_type="application/zip"),
+        })
+        with zipfile.ZipFile(archive, "a") as f:
+            f.writestr("other.csv", "event_code\n")
+        self.client.post(reverse("upload-data"), {
+            "zip-file": SimpleUploadedFile("invalid.zip", archive.getvalue(), content_type="application/zip"),
+        })
+        self._run_queued_jobs()
+
+        jobs = {job.file_name: job for job in UploadJob.objects.all()}
+        self.assertEqual(jobs["upload.zip"].status, "Done")
+        self.assertIn("0 demographic_quality_metrics rows from 'demographic_quality.csv'", jobs["upload.zip"].outputs["summary"])
+        self.assertEqual(jobs["invalid.zip"].status, "Failed")
+        self.assertIn("Can not tell the data type of 'other.csv'", jobs["invalid.zip"].errors[0])
+
+    def test_validate_only(self):
+        response = self._upload(b"\xff\xfe\x00", validate_only=True)
+        self.assertContains(response, "not UTF-8 encoded")
+        response = self._upload(b"event_code\n", validate_only=True)
+        self.assertContains(response, "is valid and can be uploaded")
+        self.assertFalse(UploadJob.objects.exists())
+
+    def _run_queued_jobs(self):
+        # Like run_import_worker --once, without closing the connection of
+        # the test transaction
+        while (job := upload_jobs.claim_job()) is not None:
+            upload_jobs.run_job(job)
+
+    def _upload(self, content, name="upload.csv", validate_only=False):
+        data = {
+            "impact_metrics-file": SimpleUploadedFile(name, content, content_type="text/csv"),
+        }
+        if validate_only:
+            data["impact_metrics-validate_only"] = "on"
+        return self.client.post(reverse("upload-data"), data)
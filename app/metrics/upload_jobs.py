@@ -0,0 +1,430 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+from metrics import change_stamps, import_utils, instrumentation
+from metrics.models import UploadJob
+import csv
+import datetime
+import django
+import io
+import logging
+import multiprocessing
+import re
+import zipfile
+
+
+logger = logging.getLogger(__name__)
+
+# Connection used to report progress while the import transaction is open
+PROGRESS_DATABASE = "jobs"
+ZIP_UPLOAD_TYPE = "zip"
+# The CSV files of ZIP uploads are told apart by their names and imported
+# in this order
+ZIP_MEMBER_TYPES = {
+    "events": re.compile("event", re.IGNORECASE),
+    "demographic_quality_metrics": re.compile("demographic|quality", re.IGNORECASE),
+    "impact_metrics": re.compile("impact", re.IGNORECASE),
+}
+PARSERS = {
+    "events": import_utils.legacy_to_current_event_dict,
+    "demographic_quality_metrics": import_utils.legacy_to_current_quality_or_demographic_dict,
+    "impact_metrics": import_utils.legacy_to_current_impact_dict,
+}
+
+
+def get_file_match(event=None, extension: str = "csv") -> str:
+    return f"^.+-{event.id}\\.{extension}$" if event else f"^.+\\.{extension}$"
+
+
+def read_csv_rows(file):
+    file.seek(0)
+    stream = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        yield from csv.DictReader(stream, delimiter=',')
+    finally:
+        stream.detach()
+
+
+def summary_output(result: import_utils.ImportProgress):
+    duplicates = "".join(
+        f" Skipped {count} {model} rows that were uploaded before."
+        for (model, count) in result.duplicates.items()
+        if count
+    )
+    return f"Successfully uploaded {result.rows} objects in {result.chunks} chunks.{duplicates}"
+
+
+def events_actions_output(result: import_utils.ImportProgress):
+    item_ids = [item.id for item in result.items]
+    base_url = reverse("event-list")
+    query_params = {"id": item_ids}
+    view_list_url = f"{base_url}?{urlencode(query_params, doseq=True)}"
+    return [
+        ("View events", view_list_url)
+    ]
+
+
+def table_output(columns: dict):
+    def _table_output(result: import_utils.ImportProgress):
+        return {
+            "headers": [value for value in columns.values()],
+            "content": [
+                [getattr(item, key, None) for key in columns.keys()]
+                for item in result.items
+            ]
+        }
+    return _table_output
+
+
+def make_import_context(user, event=None, fetch_ror=True):
+    current_time = datetime.datetime.now()
+    return import_utils.LegacyImportContext(
+        user=user,
+        node_main=user.get_node(),
+        timestamps=(
+            current_time,
+            current_time
+        ),
+        fixed_event=event,
+        fetch_ror=fetch_ror,
+    )
+
+
+def get_import_context(job: UploadJob):
+    return make_import_context(job.user, job.event)
+
+
+def validate_file(importer: import_utils.BatchImporter, file, progress=None) -> list[str]:
+    # Parses, normalizes and validates all rows without writing anything
+    try:
+        return importer.validate_rows(read_csv_rows(file), progress=progress)
+    except UnicodeDecodeError as e:
+        return [f"The file is not UTF-8 encoded: {e}"]
+
+
+def get_upload_handler(upload_type: str, import_context: import_utils.ImportContext, parsed: bool = False):
+    # Rows that were parsed beforehand are imported as they are
+    parse = None if parsed else PARSERS[upload_type]
+    return {
+        "events": (
+            import_utils.EventImporter(
+                import_context,
+                parse=parse,
+            ),
+            {
+                "summary": summary_output,
+                "table": table_output({
+                    "id": "Event Code",
+                    "title": "Title",
+                    "date_start": "Start date",
+                    "date_end": "End date"
+                }),
+                "actions": events_actions_output
+            }
+        ),
+        "demographic_quality_metrics": (
+            import_utils.BatchImporter(
+                import_context.build_quality_and_demographic,
+                preload=import_context.preload,
+                parse=parse,
+            ),
+            {"summary": summary_output}
+        ),
+        "impact_metrics": (
+            import_utils.BatchImporter(
+                import_context.build_impact,
+                preload=import_context.preload,
+                parse=parse,
+            ),
+            {"summary": summary_output}
+        ),
+    }[upload_type]
+
+
+def validate_upload(upload_type: str, file, import_context: import_utils.ImportContext, event=None) -> list[str]:
+    # The file is read as a stream like in the import jobs
+    if upload_type != ZIP_UPLOAD_TYPE:
+        (importer, _view_transforms) = get_upload_handler(upload_type, import_context)
+        return validate_file(importer, file)
+
+    # Metrics are checked against the events that exist now, not the ones
+    # of the same ZIP file.
+    (members, errors) = read_zip_members(file, event)
+    if errors:
+        return errors
+    for (upload_type, (name, rows, parse_errors)) in parse_members(file, members).items():
+        if parse_errors:
+            errors.extend(f"{name}: {error}" for error in parse_errors)
+            continue
+        (importer, _view_transforms) = get_upload_handler(upload_type, import_context, parsed=True)
+        errors.extend(f"{name}: {error}" for error in importer.validate_rows(rows))
+    return errors
+
+
+def read_zip_members(file, event=None) -> tuple[dict, list[str]]:
+    file_match = get_file_match(event)
+    allowed_types = [
+        upload_type
+        for upload_type in ZIP_MEMBER_TYPES
+        if event is None or upload_type != "events"
+    ]
+    members = {}
+    errors = []
+    try:
+        archive = zipfile.ZipFile(file)
+    except zipfile.BadZipFile as e:
+        return ({}, [f"Not a valid ZIP file: {e}"])
+    with archive:
+        for info in archive.infolist():
+            name = info.filename.rsplit("/", 1)[-1]
+            if info.is_dir() or info.filename.startswith("__MACOSX/") or name.startswith("."):
+                continue
+            if not re.match(file_match, name):
+                errors.append(f"Incorrect file name '{name}'. The file names need to match the following regex: '{file_match}'")
+                continue
+            upload_types = [
+                upload_type
+                for upload_type in allowed_types
+                if ZIP_MEMBER_TYPES[upload_type].search(name)
+            ]
+            if len(upload_types) != 1:
+                errors.append(f"Can not tell the data type of '{name}', the name needs to contain one of: {', '.join(allowed_types)}")
+            elif upload_types[0] in members:
+                errors.append(f"More than one '{upload_types[0]}' file: '{members[upload_types[0]][0]}' and '{name}'")
+            else:
+                members[upload_types[0]] = (name, info)
+    if not members and not errors:
+        errors.append("The ZIP file contains no CSV files")
+    return (
+        {
+            upload_type: members[upload_type]
+            for upload_type in ZIP_MEMBER_TYPES
+            if upload_type in members
+        },
+        errors,
+    )
+
+
+def parse_member(upload_type: str, archive_file, member_name: str) -> tuple[list[dict], list[str]]:
+    # The member is decompressed while its rows are read, the archive is
+    # either a path or an open file
+    parse = PARSERS[upload_type]
+    rows = []
+    errors = []
+    try:
+        with zipfile.ZipFile(archive_file) as archive, archive.open(member_name) as member:
+            for (index, row) in enumerate(read_csv_rows(member)):
+                try:
+                    rows.append(parse(row))
+                except ValidationError as e:
+                    errors.extend(f"Failed to parse row {index}: {message}" for message in e.messages)
+    except UnicodeDecodeError as e:
+        errors.append(f"The file is not UTF-8 encoded: {e}")
+    return (rows, errors)
+
+
+def get_local_path(file) -> str | None:
+    if hasattr(file, "temporary_file_path"):
+        return file.temporary_file_path()
+    try:
+        return file.path
+    except (AttributeError, NotImplementedError, ValueError):
+        return None
+
+
+def parse_members(file, members: dict) -> dict:
+    # Large files are parsed concurrently in spawned processes, which do not
+    # share the database connections of this one. They open the archive by
+    # its path, so only archives stored on disk are parsed in parallel.
+    upload_types = list(members)
+    member_names = [members[upload_type][1].filename for upload_type in upload_types]
+    size = sum(members[upload_type][1].file_size for upload_type in upload_types)
+    parallel_bytes = getattr(settings, "ZIP_PARALLEL_PARSE_BYTES", 10 * 2**20)
+    path = get_local_path(file)
+    if path is not None and len(upload_types) > 1 and size >= parallel_bytes:
+        with ProcessPoolExecutor(
+            max_workers=len(upload_types),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=django.setup,
+        ) as executor:
+            results = list(executor.map(parse_member, upload_types, [path] * len(upload_types), member_names))
+    else:
+        results = [
+            parse_member(upload_type, file, member_name)
+            for (upload_type, member_name) in zip(upload_types, member_names)
+        ]
+    return {
+        upload_type: (members[upload_type][0], rows, errors)
+        for (upload_type, (rows, errors)) in zip(upload_types, results)
+    }
+
+
+def claim_job(stale_after: datetime.timedelta | None = None) -> UploadJob | None:
+    # Locked rows are skipped, so that several workers can claim jobs
+    # concurrently without waiting on each other.
+    claimable = Q(status="Queued")
+    if stale_after is not None:
+        claimable |= Q(status="Running", modified__lt=timezone.now() - stale_after)
+
+    with transaction.atomic():
+        job = (
+            UploadJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(claimable)
+            .order_by("created")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = "Running"
+        job.started = timezone.now()
+        job.rows_parsed = 0
+        job.rows_inserted = 0
+        job.save(update_fields=["status", "started", "rows_parsed", "rows_inserted", "modified"])
+    return job
+
+
+def update_job(job: UploadJob, **fields):
+    UploadJob.objects.using(PROGRESS_DATABASE).filter(pk=job.pk).update(
+        modified=timezone.now(),
+        **fields
+    )
+
+
+def finish_job(job: UploadJob, status: str, errors: list[str] = None, outputs: dict = None, **fields):
+    job.status = status
+    job.finished = timezone.now()
+    job.errors = errors or []
+    job.outputs = outputs or {}
+    job.file.delete(save=False)
+    for (key, value) in fields.items():
+        setattr(job, key, value)
+    job.save()
+    return job
+
+
+def run_job(job: UploadJob, report_progress: bool = True) -> UploadJob:
+    if not getattr(settings, "IMPORT_PROFILING", False):
+        return import_job(job, report_progress)
+
+    with instrumentation.profile(trace_memory=getattr(settings, "IMPORT_PROFILING_MEMORY", False)) as profile:
+        job = import_job(job, report_progress)
+    profile.log(f"upload-job-{job.id}")
+    job.outputs = {**job.outputs, "profile": profile.summary()}
+    job.save(update_fields=["outputs", "modified"])
+    return job
+
+
+def import_job(job: UploadJob, report_progress: bool = True) -> UploadJob:
+    upload_type = job.upload_type
+    if upload_type == ZIP_UPLOAD_TYPE:
+        return import_zip_job(job, report_progress)
+    (importer, view_transforms) = get_upload_handler(upload_type, get_import_context(job))
+
+    def progress(field):
+        if not report_progress:
+            return None
+        return lambda result: update_job(job, **{field: result.rows})
+
+    # The file is streamed twice: all rows are validated before the first
+    # chunk is written.
+    with job.file.open("rb") as file:
+        errors = [
+            f"Invalid '{upload_type}' data: {error}"
+            for error in validate_file(importer, file, progress("rows_parsed"))
+        ]
+        if not errors:
+            try:
+                with change_stamps.batch_changes(), transaction.atomic():
+                    result = importer.insert_rows(
+                        read_csv_rows(file),
+                        progress=progress("rows_inserted"),
+                        keep_items=upload_type == "events",
+                    )
+            except ValidationError as e:
+                errors = [f"Failed to import '{upload_type}': {message}" for message in e.messages]
+            except Exception as e:
+                logger.exception(f"Upload job {job.id} failed")
+                errors = [f"Failed to import '{upload_type}': {e}"]
+    if errors:
+        return finish_job(job, "Failed", errors=errors, rows_inserted=0)
+
+    return finish_job(
+        job,
+        "Done",
+        outputs={
+            key: view_transform(result)
+            for key, view_transform in view_transforms.items()
+        },
+        rows_parsed=result.rows,
+        rows_inserted=result.rows,
+    )
+
+
+def import_zip_job(job: UploadJob, report_progress: bool = True) -> UploadJob:
+    # All files are parsed first, then events and metrics are validated and
+    # inserted in one transaction, so that metrics can refer to the events.
+    with job.file.open("rb") as file:
+        (members, errors) = read_zip_members(file, job.event)
+        parsed = parse_members(file, members)
+    for (name, _rows, parse_errors) in parsed.values():
+        errors.extend(f"{name}: {error}" for error in parse_errors)
+    if errors:
+        return finish_job(job, "Failed", errors=errors)
+
+    rows_parsed = sum(len(rows) for (_name, rows, _errors) in parsed.values())
+    if report_progress:
+        update_job(job, rows_parsed=rows_parsed)
+
+    import_context = get_import_context(job)
+    results = {}
+    inserted = 0
+    try:
+        with change_stamps.batch_changes(), transaction.atomic():
+            for (upload_type, (name, rows, _errors)) in parsed.items():
+                (importer, _view_transforms) = get_upload_handler(upload_type, import_context, parsed=True)
+                errors = importer.validate_rows(rows)
+                if errors:
+                    raise ValidationError([f"{name}: Invalid '{upload_type}' data: {error}" for error in errors])
+                results[upload_type] = importer.insert_rows(
+                    rows,
+                    progress=(
+                        (lambda result, offset=inserted: update_job(job, rows_inserted=offset + result.rows))
+                        if report_progress
+                        else None
+                    ),
+                    keep_items=upload_type == "events",
+                )
+                inserted += results[upload_type].rows
+    except ValidationError as e:
+        errors = e.messages
+    except Exception as e:
+        logger.exception(f"Upload job {job.id} failed")
+        errors = [f"Failed to import '{ZIP_UPLOAD_TYPE}': {e}"]
+    if errors:
+        return finish_job(job, "Failed", errors=errors, rows_parsed=rows_parsed, rows_inserted=0)
+
+    outputs = {
+        "summary": "Successfully uploaded " + ", ".join(
+            f"{result.rows} {upload_type} rows from '{parsed[upload_type][0]}'"
+            + (
+                f" ({sum(result.duplicates.values())} uploaded before)"
+                if any(result.duplicates.values())
+                else ""
+            )
+            for (upload_type, result) in results.items()
+        ) + ".",
+    }
+    if "events" in results:
+        (_importer, view_transforms) = get_upload_handler("events", import_context)
+        outputs.update({
+            key: view_transform(results["events"])
+            for (key, view_transform) in view_transforms.items()
+            if key != "summary"
+        })
+    return finish_job(job, "Done", outputs=outputs, rows_parsed=rows_parsed, rows_inserted=inserted)
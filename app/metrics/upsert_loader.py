@@ -0,0 +1,178 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.text import slugify
+from metrics import change_stamps, import_utils
+from metrics.models import Event, Demographic, Quality, Impact
+from typing import Callable, Iterable
+import dataclasses
+import hashlib
+import json
+
+
+METRICS_MODELS = [Demographic, Quality, Impact]
+# Fields that are kept when an existing event is updated
+KEEP_FIELDS = {"id", "created", "code", "locked"}
+
+
+@dataclasses.dataclass
+class UpsertReport:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    errors: list = dataclasses.field(default_factory=list)
+
+
+def hash_row(row: dict) -> bytes:
+    return json.dumps(row, sort_keys=True).encode()
+
+
+def get_metrics_hashes(sources: dict, skip_row: Callable[[dict], bool] | None = None) -> dict[str, str]:
+    # One hash over all metrics rows of each event code, so that events
+    # count as changed when only their metrics did.
+    hashers = {}
+    for (model, path) in sources.items():
+        with import_utils.open_rows(path) as reader:
+            for row in reader:
+                if skip_row is not None and skip_row(row):
+                    continue
+                hasher = hashers.setdefault(row["event"], hashlib.sha256())
+                hasher.update(model.__name__.encode())
+                hasher.update(hash_row(row))
+    return {
+        code: hasher.hexdigest()
+        for (code, hasher) in hashers.items()
+    }
+
+
+class EventUpserter:
+    """
+    Inserts or updates events by code with INSERT ... ON CONFLICT DO UPDATE,
+    skipping rows whose content hash is unchanged. The relations and metrics
+    of updated events are replaced, the codes of all inserted or updated
+    events are collected in changed_codes. Metrics are kept when applying
+    deltas that only contain the changed metrics rows.
+
+    Content hashes are only stored by save_content_hashes once the metrics
+    of the changed events are loaded, until then the events are stored
+    without a hash and are upserted again by the next run.
+    """
+
+    def __init__(
+        self,
+        context: import_utils.ImportContext,
+        metrics_hashes: dict[str, str],
+        batch_size: int | None = None,
+        replace_metrics: bool = True,
+    ):
+        self.context = context
+        self.metrics_hashes = metrics_hashes
+        self.batch_size = batch_size or import_utils.get_import_batch_size()
+        self.replace_metrics = replace_metrics
+        self.content_hashes = {}
+        self.update_fields = [
+            field.name
+            for field in Event._meta.concrete_fields
+            if field.name not in KEEP_FIELDS
+        ]
+        self.changed_codes = set()
+
+    def upsert(self, rows: Iterable[dict]) -> UpsertReport:
+        report = UpsertReport()
+        for (chunk_index, chunk) in enumerate(import_utils.chunked(rows, self.batch_size)):
+            with transaction.atomic():
+                self.upsert_chunk(chunk, chunk_index * self.batch_size, report)
+        if report.inserted or report.updated:
+            change_stamps.mark_changed(Event, None)
+            for model in METRICS_MODELS:
+                change_stamps.mark_changed(model, None)
+        return report
+
+    def upsert_chunk(self, rows: list[dict], offset: int, report: UpsertReport):
+        hashed = {}
+        for (index, row) in enumerate(rows, start=offset):
+            if not row.get("code"):
+                report.errors.append(f"Row {index}: events need a code to be upserted")
+                continue
+            content_hash = hashlib.sha256(
+                hash_row(row) + self.metrics_hashes.get(row["code"], "").encode()
+            ).hexdigest()
+            # The last row wins for codes that appear more than once
+            hashed[slugify(row["code"])] = (index, row, content_hash)
+
+        existing = dict(
+            Event.objects.filter(code__in=hashed.keys()).values_list("code", "content_hash")
+        )
+        changed = {
+            code: value
+            for (code, value) in hashed.items()
+            if existing.get(code) != value[2]
+        }
+        report.unchanged += len(hashed) - len(changed)
+        if not changed:
+            return
+
+        changed_rows = [row for (_index, row, _hash) in changed.values()]
+        self.context.preload(changed_rows)
+        self.context.create_institutions({
+            ror_id
+            for row in changed_rows
+            for ror_id in import_utils.get_ror_ids(row)
+        })
+        validator = import_utils.get_row_validator(Event)
+        built = {}
+        for (code, (index, row, content_hash)) in changed.items():
+            try:
+                (event, institutions, nodes) = self.context.build_event(row)
+            except (ValidationError, ValueError) as e:
+                messages = e.messages if isinstance(e, ValidationError) else [str(e)]
+                report.errors.extend(f"Row {index}: {message}" for message in messages)
+                continue
+            event.content_hash = ""
+            errors = validator.get_errors(event)
+            if errors:
+                report.errors.extend(f"Row {index}: Event.{error}" for error in errors)
+                continue
+            built[code] = (row, event, institutions, nodes)
+            self.content_hashes[code] = content_hash
+        if not built:
+            return
+
+        Event.objects.bulk_create(
+            [event for (_row, event, _institutions, _nodes) in built.values()],
+            update_conflicts=True,
+            unique_fields=["code"],
+            update_fields=self.update_fields,
+        )
+        event_ids = dict(
+            Event.objects.filter(code__in=built.keys()).values_list("code", "id")
+        )
+        self.replace_relations(
+            Event.node.through,
+            "node_id",
+            {event_ids[code]: nodes for (code, (_row, _event, _institutions, nodes)) in built.items()},
+        )
+        self.replace_relations(
+            Event.organising_institution.through,
+            "organisinginstitution_id",
+            {event_ids[code]: institutions for (code, (_row, _event, institutions, _nodes)) in built.items()},
+        )
+
+        updated_ids = [event_ids[code] for code in built if code in existing]
+        if self.replace_metrics:
+            for model in METRICS_MODELS:
+                model.objects.filter(event_id__in=updated_ids).delete()
+
+        report.updated += len(updated_ids)
+        report.inserted += len(built) - len(updated_ids)
+        self.changed_codes.update(row["code"] for (row, _event, _institutions, _nodes) in built.values())
+
+    def save_content_hashes(self):
+        events = list(Event.objects.filter(code__in=self.content_hashes.keys()).only("id", "code"))
+        for event in events:
+            event.content_hash = self.content_hashes[event.code]
+        Event.objects.bulk_update(events, ["content_hash"], batch_size=self.batch_size)
+        self.content_hashes = {}
+
+    def replace_relations(self, through, target_field: str, targets: dict[int, list]):
+        through.objects.filter(event_id__in=targets.keys()).delete()
+        import_utils.insert_relations(through, target_field, targets)
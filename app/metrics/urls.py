@@ -4,12 +4,13 @@ from django.contrib.auth import views as auth_views
 
 from metrics import views
 from metrics.forms import UserLoginForm
-from metrics.views.upload import upload_data
+from metrics.views.upload import upload_data, upload_job
 from metrics.views.model_views import (
     EventView,
     InstitutionView,
     EventListView,
     InstitutionListView,
+    institution_search,
     QualityMetricsDeleteView,
     DemographicMetricsDeleteView,
     ImpactMetricsDeleteView,
@@ -23,11 +24,13 @@ urlpatterns = [
     ),
     path('logout/', LogoutView.as_view(next_page='/'), name='logout'),
     path('upload-data', upload_data, name='upload-data'),
+    path('upload-data/job/<int:job_id>', upload_job, name='upload-job'),
     path('event/<int:pk>', EventView.as_view(), name='event-edit'),
     path('event/<int:event_id>/upload-data', upload_data, name='upload-data-event'),
     path('institution/<int:pk>', InstitutionView.as_view(), name='institution-edit'),
     path('event/list', EventListView.as_view(), name='event-list'),
     path('institution/list', InstitutionListView.as_view(), name='institution-list'),
+    path('institution/search', institution_search, name='institution-search'),
     path('event/delete-metrics/demographic/<int:pk>',
         DemographicMetricsDeleteView.as_view(),
         name="demographic-delete-metrics"
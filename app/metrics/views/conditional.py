@@ -0,0 +1,58 @@
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django_plotly_dash.dash_wrapper import all_apps
+from metrics import change_stamps
+from functools import wraps
+
+
+def set_validators(response, etag, last_modified):
+    if etag is not None:
+        response.headers.setdefault("ETag", etag)
+    if last_modified is not None and not response.has_header("Last-Modified"):
+        response.headers["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_response(request, models, render, instance_key=None):
+    (etag, last_modified) = change_stamps.get_validators(request, models, instance_key)
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=last_modified,
+    )
+    if response is None:
+        response = render()
+    return set_validators(response, etag, last_modified)
+
+
+class ConditionalGetMixin:
+    conditional_models = []
+
+    def get_conditional_instance_key(self):
+        return None
+
+    def get(self, request, *args, **kwargs):
+        return conditional_response(
+            request,
+            self.conditional_models,
+            lambda: super(ConditionalGetMixin, self).get(request, *args, **kwargs),
+            self.get_conditional_instance_key(),
+        )
+
+
+def conditional_dash_page(dash_name, models):
+    # The dash app is registered while the page renders, a page can only be
+    # answered with 304 when this process already serves the app.
+    def decorator(view):
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD") or dash_name not in all_apps():
+                return view(request, *args, **kwargs)
+            return conditional_response(
+                request,
+                models,
+                lambda: view(request, *args, **kwargs),
+            )
+        return inner
+    return decorator
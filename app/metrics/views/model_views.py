@@ -2,20 +2,40 @@ from django.views.generic.edit import FormView, UpdateView, DeleteView
 from django.views.generic.list import ListView
 from django.core.exceptions import FieldDoesNotExist
 from django.contrib.auth.mixins import UserPassesTestMixin, LoginRequiredMixin
-from django.http import HttpResponseRedirect
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils.http import urlencode
 from metrics import forms
 from metrics import models
 from django.core import serializers
 from collections.abc import Iterable
+from functools import cached_property
 from .common import get_tabs
+from .conditional import ConditionalGetMixin
+from metrics import change_stamps, ror
 from django.urls import reverse_lazy, reverse
 import requests
 import re
+import csv
 
 
-class GenericUpdateView(UpdateView):
+class CachedUserNodeMixin:
+    @cached_property
+    def user_node(self):
+        return self.request.user.get_node()
+
+
+class CachedObjectMixin:
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset)
+        if "_cached_object" not in self.__dict__:
+            self._cached_object = super().get_object()
+        return self._cached_object
+
+
+class GenericUpdateView(CachedObjectMixin, CachedUserNodeMixin, UpdateView):
     template_name = "metrics/model-form.html"
     model = models.Quality
     view_name = None
@@ -59,42 +79,34 @@ class GenericUpdateView(UpdateView):
         return form
 
 
-class UserHasNodeMixin(UserPassesTestMixin):
+class UserHasNodeMixin(CachedUserNodeMixin, UserPassesTestMixin):
     def test_func(self):
         try:
             model_object = self.get_object()
-            return self.request.user.get_node() == model_object.node_main
+            return self.user_node == model_object.node_main
         except self.model.DoesNotExist:
             return True
 
 
-class EventView(LoginRequiredMixin, GenericUpdateView):
+class EventView(LoginRequiredMixin, ConditionalGetMixin, GenericUpdateView):
     model = models.Event
-    fields = [
-        "user",
-        "title",
-        "node",
-        "date_start",
-        "date_end",
-        "duration",
-        "type",
-        "organising_institution",
-        "location_city",
-        "location_country",
-        "funding",
-        "target_audience",
-        "additional_platforms",
-        "communities",
-        "number_participants",
-        "number_trainers",
-        "url",
-        "status",
+    conditional_models = [
+        models.Demographic,
+        models.Quality,
+        models.Impact,
+        models.Node,
+        models.OrganisingInstitution,
+        models.User,
     ]
+    form_class = forms.EventForm
     view_name = "event-list"
 
     @property
     def title(self):
         return f"Event: {self.object}"
+
+    def get_conditional_instance_key(self):
+        return (self.model, self.kwargs["pk"])
     
     def get_actions(self):
         return (
@@ -107,11 +119,16 @@ class EventView(LoginRequiredMixin, GenericUpdateView):
             else []
         )
     
+    def get_queryset(self):
+        return super().get_queryset().select_related("node_main").with_stats()
+
     def can_edit(self):
+        # The node of the user is recognised by its name, without a query
         model_object = self.get_object()
         return (
-            self.request.user.get_node() == model_object.node_main
-            and not self.object.is_locked
+            model_object.node_main is not None
+            and model_object.node_main.name == self.request.user.get_node_name()
+            and not model_object.is_locked
         )
     
     def get_stats(self):
@@ -132,9 +149,13 @@ class EventView(LoginRequiredMixin, GenericUpdateView):
         ]
 
 
-class InstitutionView(LoginRequiredMixin, GenericUpdateView):
+class InstitutionView(LoginRequiredMixin, ConditionalGetMixin, GenericUpdateView):
     model = models.OrganisingInstitution
     fields = []
+    conditional_models = [
+        models.OrganisingInstitution,
+        models.Event,
+    ]
     view_name = "institution-list"
     
     def get_stats(self):
@@ -176,11 +197,24 @@ class InstitutionView(LoginRequiredMixin, GenericUpdateView):
         )
 
 
-class GenericListView(ListView):
+class Echo:
+    """Pseudo-buffer for csv.writer that returns written rows instead of storing them."""
+    def write(self, value):
+        return value
+
+
+class GenericListView(CachedUserNodeMixin, ListView):
     template_name = "metrics/model-list.html"
     paginate_by = 10
     max_paginate_by = 50
     min_paginate_by = 10
+    export_formats = []
+    export_chunk_size = 2000
+
+    def get(self, request, *args, **kwargs):
+        if self.export_format in self.export_formats:
+            return self.render_to_csv_response()
+        return super().get(request, *args, **kwargs)
 
     @property
     def title(self):
@@ -221,6 +255,7 @@ class GenericListView(ListView):
         ]
         context["node_only"] = self.node_only
         context["page_size"] = self.get_paginate_by(None)
+        context["export_url"] = self.get_export_url()
         context.update(get_tabs(self.request))
         return context
 
@@ -228,6 +263,39 @@ class GenericListView(ListView):
     def node_only(self):
         return "node_only" in self.request.GET
 
+    @property
+    def export_format(self):
+        return self.request.GET.get("format")
+
+    def get_export_url(self):
+        if "csv" not in self.export_formats:
+            return None
+        query_params = self.request.GET.copy()
+        query_params.pop("page", None)
+        query_params["format"] = "csv"
+        return f"?{query_params.urlencode()}"
+
+    def get_export_queryset(self):
+        return self.get_queryset()
+
+    def get_export_filename(self):
+        return f"{self.model.__name__.lower()}-list.csv"
+
+    def get_csv_rows(self):
+        yield [self.get_field_label(field) for field in self.fields]
+        queryset = self.get_export_queryset()
+        for entry in queryset.iterator(chunk_size=self.export_chunk_size):
+            yield [value for (value, _url) in self.get_values(entry)]
+
+    def render_to_csv_response(self):
+        writer = csv.writer(Echo())
+        response = StreamingHttpResponse(
+            (writer.writerow(row) for row in self.get_csv_rows()),
+            content_type="text/csv",
+        )
+        response["Content-Disposition"] = f'attachment; filename="{self.get_export_filename()}"'
+        return response
+
     def get_entry_extras(self, entry):
         return []
 
@@ -267,9 +335,18 @@ class GenericListView(ListView):
         return ", ".join([str(v) for v in value_list])
 
 
-class EventListView(LoginRequiredMixin, GenericListView):
+class EventListView(LoginRequiredMixin, ConditionalGetMixin, GenericListView):
     model = models.Event
     paginate_by = 30
+    export_formats = ["csv"]
+    conditional_models = [
+        models.Event,
+        models.Demographic,
+        models.Quality,
+        models.Impact,
+        models.Node,
+        models.OrganisingInstitution,
+    ]
     fields = [
         "code",
         "id",
@@ -294,9 +371,9 @@ class EventListView(LoginRequiredMixin, GenericListView):
     def get_queryset(self):
         id_list = self.request.GET.getlist("id", None)
         institution_id_list = self.request.GET.getlist("institution_id", None)
-        queryset = super().get_queryset().order_by("-id")
+        queryset = super().get_queryset().order_by("-id").with_stats()
         queryset = (
-            queryset.filter(node_main=self.request.user.get_node())
+            queryset.filter(node_main=self.user_node)
             if self.node_only
             else queryset
         )
@@ -312,9 +389,15 @@ class EventListView(LoginRequiredMixin, GenericListView):
         )
         return queryset
 
+    def get_export_queryset(self):
+        return (
+            self.get_queryset()
+            .select_related("node_main")
+            .prefetch_related("node", "organising_institution")
+        )
+
     def get_entry_extras(self, entry):
-        user_node = self.request.user.get_node()
-        can_edit = user_node == entry.node_main and not entry.is_locked
+        can_edit = self.user_node == entry.node_main and not entry.is_locked
         return [
             ("Edit" if can_edit else "View", entry.get_absolute_url()),
             (
@@ -324,9 +407,10 @@ class EventListView(LoginRequiredMixin, GenericListView):
         ]
 
 
-class InstitutionListView(LoginRequiredMixin, GenericListView):
+class InstitutionListView(LoginRequiredMixin, ConditionalGetMixin, GenericListView):
     model = models.OrganisingInstitution
     paginate_by = 30
+    conditional_models = [models.OrganisingInstitution]
     ordering = ['name']
     fields = [
         "name",
@@ -350,6 +434,7 @@ class InstitutionListView(LoginRequiredMixin, GenericListView):
 class GenericEventMetricsDeleteView(
     LoginRequiredMixin,
     UserHasNodeMixin,
+    CachedObjectMixin,
     DeleteView,
 ):
     template_name = "metrics/confirm.html"
@@ -374,6 +459,7 @@ class GenericEventMetricsDeleteView(
     def form_valid(self, form):
         success_url = self.get_success_url()
         self.metrics_model.objects.filter(event=self.object).delete()
+        change_stamps.mark_changed(self.metrics_model, None)
         return HttpResponseRedirect(success_url)
 
 
@@ -393,3 +479,19 @@ class DemographicMetricsDeleteView(
     GenericEventMetricsDeleteView
 ):
     metrics_model = models.Demographic
+
+
+@login_required
+def institution_search(request):
+    query = request.GET.get("q", "").strip()
+    records = ror.search(query) if len(query) >= 3 else []
+    return JsonResponse({
+        "results": [
+            {
+                "ror_id": record.ror_id,
+                "name": record.name,
+                "country": record.country,
+            }
+            for record in records
+        ]
+    })
@@ -1,22 +1,20 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.shortcuts import render, redirect
 from metrics.views.common import get_tabs
 from django import forms
 from django.forms.widgets import FileInput, Select, CheckboxInput
 from django.shortcuts import get_object_or_404
 import re
-import csv
-import io
-from metrics import import_utils, models
-import traceback
-from django.core.exceptions import ValidationError, PermissionDenied
-from django.db import transaction
-import datetime
+from metrics import models, upload_jobs
+from django.core.exceptions import PermissionDenied
 from django.contrib.auth.decorators import login_required
-from django.urls import reverse
-from django.utils.http import urlencode
 from django.templatetags.static import static
 
 
+# Seconds between reloads of the status page of an unfinished job
+JOB_REFRESH_INTERVAL = 2
+
+
 UPLOAD_TYPES = {
     upload_type["id"]: upload_type
     for upload_type in [
@@ -25,18 +23,32 @@ UPLOAD_TYPES = {
             "title": "Events",
             "description": "",
             "template_url": static("data-templates/events-template.csv"),
+            "extension": "csv",
         },
         {
             "id": "demographic_quality_metrics",
             "title": "Demographic and quality metrics",
             "description": "",
             "template_url": static("data-templates/metrics-demographic-quality-template.csv"),
+            "extension": "csv",
         },
         {
             "id": "impact_metrics",
             "title": "Impact metrics",
             "description": "",
             "template_url": static("data-templates/metrics-impact-template.csv"),
+            "extension": "csv",
+        },
+        {
+            "id": upload_jobs.ZIP_UPLOAD_TYPE,
+            "title": "All data as a ZIP file",
+            "description": (
+                "A ZIP file of the events, demographic and quality metrics and impact metrics CSV files, "
+                "told apart by 'event', 'demographic' or 'quality' and 'impact' in their names. "
+                "The files are imported together: events first, then metrics."
+            ),
+            "template_url": None,
+            "extension": "zip",
         },
     ]
 }
@@ -55,9 +67,16 @@ class DataUploadForm(forms.Form):
         ),
         widget=Select(attrs={"class": "form-control d-none"}),
     )
+    validate_only = forms.BooleanField(
+        label="Validate only",
+        required=False,
+        widget=CheckboxInput(attrs={"class": "form-check-input"}),
+    )
 
-    def __init__(self, *args, title=None, description=None, fixed_type=None, associated_templates=None, **kwargs):
+    def __init__(self, *args, title=None, description=None, fixed_type=None, associated_templates=None, file_label=None, **kwargs):
         super().__init__(*args, **kwargs)
+        if file_label is not None:
+            self.fields["file"].label = file_label
         self.fixed_type = fixed_type
         self.associated_templates = associated_templates
         if self.fixed_type is not None:
@@ -71,38 +90,12 @@ class DataUploadForm(forms.Form):
             else re.split("\n\n+", description)
         )
         self.title = title
-
-
-def summary_output(items: list):
-    return f"Successfully uploaded {len(items)} objects."
-
-
-def events_actions_output(items: list):
-    item_ids = [item.id for item in items]
-    base_url = reverse("event-list")
-    query_params = {"id": item_ids}
-    view_list_url = f"{base_url}?{urlencode(query_params, doseq=True)}"
-    return [
-        ("View events", view_list_url)
-    ]
-
-
-def table_output(columns: dict):
-    def _table_output(items: list):
-        return {
-            "headers": [value for value in columns.values()],
-            "content": [
-                [getattr(item, key, None) for key in columns.keys()]
-                for item in items
-            ]
-        }
-    return _table_output
+        self.validation_summary = None
 
 
 @login_required
 def upload_data(request, event_id=None):
     event = get_object_or_404(models.Event, id=event_id) if event_id else None
-    file_match = f"^.+-{event.id}\.csv$" if event else "^.+\.csv$"
 
     if event and (event.is_locked or request.user.get_node() != event.node_main):
         raise PermissionDenied(f"You do not have permissions the upload data to event {event.id}")
@@ -120,7 +113,16 @@ def upload_data(request, event_id=None):
             title=upload_type["title"],
             description=upload_type["description"],
             prefix=upload_type["id"],
-            associated_templates=[(upload_type["title"], str(upload_type["template_url"]))]
+            associated_templates=[
+                (associated_type["title"], str(associated_type["template_url"]))
+                for associated_type in (
+                    [upload_type]
+                    if upload_type["template_url"]
+                    else upload_types.values()
+                )
+                if associated_type["template_url"]
+            ],
+            file_label=f"{upload_type['extension'].upper()} batch file",
         )
         for upload_type in upload_types.values()
     ]
@@ -131,73 +133,35 @@ def upload_data(request, event_id=None):
                 data = form.cleaned_data
                 upload_type = data["upload_type"]
                 file = data["file"]
+                file_match = upload_jobs.get_file_match(event, UPLOAD_TYPES[upload_type]["extension"])
 
                 if not re.match(file_match, file.name):
                     form.add_error(None, f"Incorrect file name. The file name needs to match the following regex: '{file_match}'")
+                elif data["validate_only"]:
+                    # Checked in the request without creating a job or
+                    # writing anything
+                    errors = upload_jobs.validate_upload(
+                        upload_type,
+                        file,
+                        upload_jobs.make_import_context(request.user, event, fetch_ror=False),
+                        event,
+                    )
+                    for error in errors:
+                        form.add_error(None, f"Invalid '{upload_type}' data: {error}")
+                    if not errors:
+                        form.validation_summary = f"'{file.name}' is valid and can be uploaded."
                 else:
-                    node_main = request.user.get_node()
-                    current_time = datetime.datetime.now()
-                    import_context = import_utils.LegacyImportContext(
+                    job = models.UploadJob.objects.create(
                         user=request.user,
-                        node_main=node_main,
-                        timestamps=(
-                            current_time,
-                            current_time
-                        ),
-                        fixed_event=event
+                        event=event,
+                        upload_type=upload_type,
+                        file_name=file.name,
+                        file=file,
                     )
+                    if not settings.BACKGROUND_UPLOADS:
+                        upload_jobs.run_job(job, report_progress=False)
+                    return redirect("upload-job", job_id=job.id)
 
-                    (parser, importer, view_transforms) = {
-                        "events": (
-                            import_utils.legacy_to_current_event_dict,
-                            import_context.event_from_dict,
-                            {
-                                "summary": summary_output,
-                                "table": table_output({
-                                    "id": "Event Code",
-                                    "title": "Title",
-                                    "date_start": "Start date",
-                                    "date_end": "End date"
-                                }),
-                                "actions": events_actions_output
-                            }
-                        ),
-                        "demographic_quality_metrics": (
-                            import_utils.legacy_to_current_quality_or_demographic_dict,
-                            import_context.quality_or_demographic_from_dict,
-                            {"summary": summary_output}
-                        ),
-                        "impact_metrics": (
-                            import_utils.legacy_to_current_impact_dict,
-                            import_context.impact_from_dict,
-                            {"summary": summary_output}
-                        ),
-                    }[upload_type]
-
-                    csv_stream = io.StringIO(file.read().decode())
-                    reader = csv.DictReader(csv_stream, delimiter=',')
-                    entries = []
-                    for (index, row) in enumerate(reader):
-                        try:
-                            entries.append(parser(row))
-                        except ValidationError as e:
-                            traceback.print_exc()
-                            form.add_error(None, f"Failed to parse '{upload_type}' row {index} : {e}")
-
-                    if len(form.errors) == 0:
-                        items = []
-                        try:
-                            with transaction.atomic():
-                                items = [importer(entry) for entry in entries]
-
-                            form.outputs = {
-                                key: view_transform(items)
-                                for key, view_transform in view_transforms.items()
-                            }
-                        except Exception as e:
-                            traceback.print_exc()
-                            form.add_error(None, f"Failed to import '{upload_type}': {e}")
-    
     title = (
         f"Upload data for event: {event.title}" 
         if event
@@ -210,5 +174,25 @@ def upload_data(request, event_id=None):
             "title": title,
             **get_tabs(request, view_name="event-list" if event else None),
             "forms": forms,
+            "jobs": models.UploadJob.objects.filter(user=request.user).order_by("-created")[:10],
+        }
+    )
+
+
+@login_required
+def upload_job(request, job_id):
+    job = get_object_or_404(
+        models.UploadJob.objects.select_related("event"),
+        id=job_id,
+        user=request.user,
+    )
+    return render(
+        request,
+        'metrics/upload-job.html',
+        context={
+            "title": f"Upload: {job.file_name}",
+            **get_tabs(request, view_name="event-list" if job.event else None),
+            "job": job,
+            "refresh_interval": None if job.is_finished else JOB_REFRESH_INTERVAL,
         }
     )
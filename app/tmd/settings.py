@@ -23,6 +23,9 @@ STATIC_URL="static/"
 STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
+# Uploaded files wait here for the import workers, the directory is shared
+# with them
+MEDIA_ROOT = os.environ.get("TMD_MEDIA_ROOT", "/opt/tmd/media")
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
@@ -52,6 +55,7 @@ INSTALLED_APPS = [
     "django.contrib.contenttypes",
     "django.contrib.sessions",
     "django.contrib.messages",
+    "django.contrib.postgres",
     "crispy_forms",
     "crispy_bootstrap5",
     "metrics",
@@ -114,6 +118,21 @@ DATABASES = {
         "PORT": os.environ.get("DJANGO_POSTGRESQL_PORT"),
     }
 }
+# Upload jobs report their progress over a separate connection, so that it
+# is visible while the import transaction is still open.
+DATABASES["jobs"] = {
+    **DATABASES["default"],
+    "TEST": {"MIRROR": "default"},
+}
+
+# Uploads are queued for the run_import_worker command when enabled,
+# otherwise they are imported within the upload request.
+BACKGROUND_UPLOADS = bool(int(os.environ.get("DJANGO_BACKGROUND_UPLOADS", 1)))
+
+# Records time, queries and, with tracemalloc, memory per import stage of
+# uploads, shown on the upload page and logged.
+IMPORT_PROFILING = bool(int(os.environ.get("DJANGO_IMPORT_PROFILING", 0)))
+IMPORT_PROFILING_MEMORY = bool(int(os.environ.get("DJANGO_IMPORT_PROFILING_MEMORY", 0)))
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -42,7 +42,8 @@ WITH _Entity AS (SELECT entity_id,
                               node.changed AS e_changed,
                               node.uid     AS e_uid
                        FROM node
-                       WHERE type = 'event') _Entity_Local
+                       WHERE type = 'event'
+                         AND (:watermark IS NULL OR node.changed >= :watermark)) _Entity_Local
                           LEFT JOIN field_data_field_elixir_node USING (entity_id, entity_type, bundle, deleted)
                           LEFT JOIN field_data_field_date USING (entity_id, entity_type, bundle, deleted)
                           LEFT JOIN field_data_field_duration USING (entity_id, entity_type, bundle, deleted)
@@ -85,6 +86,7 @@ WITH _Entity AS (SELECT entity_id,
      _Full AS (SELECT entity_id,
                       FROM_UNIXTIME(e_created)                             AS f_created,
                       FROM_UNIXTIME(e_changed)                             AS f_changed,
+                      e_changed                                            AS f_changed_ts,
                       e_uid                                                AS f_created_by,
                       e_title                                              AS f_title,
                       JSON_ARRAYAGG(DISTINCT group_elixir_node)            AS f_elixir_node,
@@ -2,6 +2,7 @@ WITH _Entity AS (SELECT entity_id,
                         e_title                                AS f_title,
                         FROM_UNIXTIME(e_created)               AS f_created,
                         FROM_UNIXTIME(e_changed)               AS f_changed,
+                        e_changed                              AS f_changed_ts,
                         field_event_target_id                  AS f_event,
                         field_have_you_used_the_tools_re_value AS f_have_you_used_the_tools,
                         field_will_you_use_the_resources_value AS f_will_you_use_the_resources,
@@ -20,7 +21,8 @@ WITH _Entity AS (SELECT entity_id,
                               eck_custom_entities.created AS e_created,
                               eck_custom_entities.changed AS e_changed
                        FROM eck_custom_entities
-                       WHERE type = 'event_feedback') _Entity_Local
+                       WHERE type = 'event_feedback'
+                         AND (:watermark IS NULL OR eck_custom_entities.changed >= :watermark)) _Entity_Local
                           LEFT JOIN field_data_field_event
                                     USING (entity_id, entity_type, bundle, deleted)
                           LEFT JOIN field_data_field_have_you_used_the_tools_re
@@ -2,6 +2,7 @@ WITH _Entity AS (SELECT entity_id,
                         e_title                                AS f_title,
                         FROM_UNIXTIME(e_created)               AS f_created,
                         FROM_UNIXTIME(e_changed)               AS f_changed,
+                        e_changed                              AS f_changed_ts,
                         field_event_target_id                  AS f_event,
                         field_created_by_target_id             AS f_created_by,
                         field_how_long_ago_value               AS f_how_long_ago,
@@ -22,7 +23,8 @@ WITH _Entity AS (SELECT entity_id,
                               eck_custom_entities.created AS e_created,
                               eck_custom_entities.changed AS e_changed
                        FROM eck_custom_entities
-                       WHERE type = 'impact_metrics') _Entity_Local
+                       WHERE type = 'impact_metrics'
+                         AND (:watermark IS NULL OR eck_custom_entities.changed >= :watermark)) _Entity_Local
                           LEFT JOIN field_data_field_event
                                     USING (entity_id, entity_type, bundle, deleted)
                           LEFT JOIN field_data_field_created_by USING (entity_id, entity_type, bundle, deleted)
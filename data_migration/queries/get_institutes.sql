@@ -2,6 +2,7 @@ WITH _Entity AS (SELECT entity_id,
                         e_title                  AS f_title,
                         FROM_UNIXTIME(e_created) AS f_created,
                         FROM_UNIXTIME(e_changed) AS f_changed,
+                        e_changed                AS f_changed_ts,
                         ttd1.name                AS f_location,
                         COALESCE((SELECT JSON_ARRAYAGG(g.title)
                                   FROM field_data_field_elixir_node n
@@ -21,7 +22,8 @@ WITH _Entity AS (SELECT entity_id,
                               eck_custom_entities.created AS e_created,
                               eck_custom_entities.changed AS e_changed
                        FROM eck_custom_entities
-                       WHERE type = 'institute') _Entity_Local
+                       WHERE type = 'institute'
+                         AND (:watermark IS NULL OR eck_custom_entities.changed >= :watermark)) _Entity_Local
                           LEFT JOIN field_data_field_location USING (entity_id, entity_type, bundle, deleted)
                           LEFT JOIN taxonomy_term_data ttd1 ON ttd1.tid = field_location_tid
                  GROUP BY entity_id)